@@ -0,0 +1,72 @@
+"""
+Helpers for the async (ASGI) views.
+
+Django's database layer is synchronous. Instead of letting every request hop
+through ``sync_to_async`` onto its own thread, the async services run their
+DB work on one bounded executor, so a worker holds many slow clients while
+using at most ``ASYNC_DB_MAX_WORKERS`` threads and connections.
+
+If a client disconnects, Django cancels the view task. Cancelling the await
+in ``run_db`` also cancels the queued executor job when it has not started
+yet. A job that is already running finishes, but nobody waits for it.
+"""
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import HttpResponse
+
+from .fastjson import dumps, loads
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.ASYNC_DB_MAX_WORKERS,
+                    thread_name_prefix='async-db',
+                )
+    return _executor
+
+
+def _run_with_connection(func: Callable, *args, **kwargs):
+    # Executor threads outlive requests, so apply CONN_MAX_AGE and health
+    # checks around each job like request_started/finished would
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_db(func: Callable, *args, **kwargs) -> Any:
+    """Run a synchronous service call on the bounded DB executor"""
+    loop = asyncio.get_running_loop()
+    # Carry context variables (e.g. the replica routing state) into the thread
+    call = functools.partial(contextvars.copy_context().run, _run_with_connection, func, *args, **kwargs)
+    return await loop.run_in_executor(get_executor(), call)
+
+
+def parse_json_body(request):
+    """The decoded JSON body, ``None`` if it is empty or malformed"""
+    if not request.body:
+        return {}
+    try:
+        return loads(request.body)
+    except ValueError:
+        return None
+
+
+def json_response(data, status: int = 200) -> HttpResponse:
+    """The JSON the sync views' renderer would produce"""
+    return HttpResponse(dumps(data), status=status, content_type='application/json')
@@ -0,0 +1,13 @@
+from django.apps import AppConfig
+
+
+class CoreConfig(AppConfig):
+    # Shared infrastructure and the management commands spanning user and user_v2
+    name = "api.core"
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from .log import install_queue_logging
+        from .metrics import install_query_recorder
+        install_queue_logging()
+        connection_created.connect(install_query_recorder, dispatch_uid='api.core.metrics')
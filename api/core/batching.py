@@ -0,0 +1,31 @@
+"""Small helpers for set based SQL over many rows at once."""
+from itertools import islice
+from typing import Iterable, Iterator, List, TypeVar
+
+T = TypeVar('T')
+
+
+def chunked(items: Iterable[T], size: int) -> Iterator[List[T]]:
+    """Split ``items`` into lists of at most ``size`` elements"""
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def values_placeholders(row_count: int, column_count: int) -> str:
+    """``(%s, %s), (%s, %s)`` for a multi-row ``INSERT ... VALUES``"""
+    row = '(' + ', '.join(['%s'] * column_count) + ')'
+    return ', '.join([row] * row_count)
+
+
+def in_placeholders(count: int) -> str:
+    """``%s, %s, %s`` for an ``IN (...)`` list"""
+    return ', '.join(['%s'] * count)
+
+
+def unique(items: Iterable[T]) -> List[T]:
+    """Drop duplicates, keeping the first occurrence"""
+    return list(dict.fromkeys(items))
@@ -0,0 +1,180 @@
+"""
+Validation and insert orchestration shared by the bulk create endpoints.
+
+Items are validated with the regular create serializer (``many=True``) and
+the valid ones are handed to a service function that inserts a whole chunk
+with one multi-row statement. Everything runs in one transaction:
+
+* ``atomic`` mode is all-or-nothing, any invalid item or database error
+  rolls back the whole request.
+* ``partial`` mode inserts what it can. Each chunk runs in a savepoint and
+  a failing chunk is retried row by row to find the offending items.
+
+Logins repeated within the request or already taken are answered with a
+409 for their item before anything is inserted. A login taken concurrently
+after that check still fails the INSERT, in atomic mode the request is then
+rolled back and answered with 409 as well.
+"""
+import logging
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from django.db import DatabaseError, IntegrityError, transaction
+from rest_framework import status
+
+from .batching import chunked
+from .db.routing import shard_alias
+from .logins import is_duplicate_key, login_filter, normalize
+
+logger = logging.getLogger(__name__)
+
+MODE_ATOMIC = 'atomic'
+MODE_PARTIAL = 'partial'
+MODES = (MODE_ATOMIC, MODE_PARTIAL)
+
+
+def validate_items(serializer_class, items: List[Any], context: Optional[dict] = None
+                   ) -> Tuple[List[Optional[dict]], List[Optional[dict]]]:
+    """
+    Validate all items, returning ``(validated, errors)`` aligned with
+    ``items``. Exactly one of both entries is set for every index.
+    """
+    serializer = serializer_class(data=items, many=True, context=context or {})
+    if serializer.is_valid():
+        return list(serializer.validated_data), [None] * len(items)
+
+    validated = []
+    errors = []
+    for item, item_errors in zip(items, _item_errors(serializer.errors, len(items))):
+        if item_errors:
+            validated.append(None)
+            errors.append(item_errors)
+            continue
+        # The list serializer drops validated data as soon as one item fails
+        child = serializer_class(data=item, context=context or {})
+        child.is_valid(raise_exception=True)
+        validated.append(child.validated_data)
+        errors.append(None)
+    return validated, errors
+
+
+def _item_errors(errors, count: int) -> List[Optional[dict]]:
+    # DRF reports list errors either as a list aligned with the input or,
+    # in newer releases, as a dict keyed by the index of the failing items
+    if isinstance(errors, dict):
+        return [errors.get(i) for i in range(count)]
+    return list(errors)
+
+
+def bulk_create(items: List[Any], serializer_class, insert_rows: Callable[[List[dict]], Sequence[Any]],
+                represent: Callable[[Sequence[Any]], List[dict]], mode: str = MODE_ATOMIC,
+                chunk_size: int = 500, context: Optional[dict] = None,
+                existing_logins: Optional[Callable[[List[str]], Set[str]]] = None) -> Tuple[int, Dict[str, Any]]:
+    """
+    Validate and insert ``items``, returning ``(http_status, body)``.
+
+    ``insert_rows`` inserts a list of validated rows and returns the created
+    users in the same order, ``represent`` turns those into API dicts.
+    ``existing_logins`` (the service's lookup of taken logins) enables the
+    login check. The body holds one result per input item, in input order.
+    """
+    validated, errors = validate_items(serializer_class, items, context)
+    results: List[Optional[Dict[str, Any]]] = [
+        {'index': i, 'status': status.HTTP_400_BAD_REQUEST, 'errors': e} if e else None
+        for i, e in enumerate(errors)
+    ]
+    pending = [(i, row) for i, row in enumerate(validated) if row is not None]
+    if existing_logins:
+        pending = _reject_taken_logins(results, pending, existing_logins)
+
+    if mode == MODE_ATOMIC and len(pending) < len(items):
+        invalid = any(r and r['status'] == status.HTTP_400_BAD_REQUEST for r in results)
+        return status.HTTP_400_BAD_REQUEST if invalid else status.HTTP_409_CONFLICT, _body(results, created=0)
+
+    try:
+        with transaction.atomic(using=shard_alias()):
+            for chunk in chunked(pending, chunk_size):
+                if mode == MODE_ATOMIC:
+                    _store(results, chunk, insert_rows(_rows(chunk)), represent)
+                    continue
+                try:
+                    with transaction.atomic(using=shard_alias()):
+                        created = insert_rows(_rows(chunk))
+                    _store(results, chunk, created, represent)
+                except DatabaseError:
+                    _insert_one_by_one(results, chunk, insert_rows, represent)
+    except IntegrityError as e:
+        if not is_duplicate_key(e):
+            raise
+        # Atomic mode, a concurrent create took a login since the check
+        return status.HTTP_409_CONFLICT, _body(_conflicts(results, pending, existing_logins), created=0)
+
+    created = sum(1 for r in results if r and r['status'] == status.HTTP_201_CREATED)
+    http_status = status.HTTP_201_CREATED if created == len(items) else status.HTTP_207_MULTI_STATUS
+    return http_status, _body(results, created)
+
+
+def _reject_taken_logins(results, pending, existing_logins):
+    """Answer items whose login repeats an earlier item or is taken with 409, returning the others"""
+    seen = set()
+    unique_rows = []
+    for i, row in pending:
+        login = normalize(row['login'])
+        if login in seen:
+            results[i] = {'index': i, 'status': status.HTTP_409_CONFLICT,
+                          'errors': {'error': 'Duplicate login in the request'}}
+            continue
+        seen.add(login)
+        unique_rows.append((i, row))
+
+    # Like a single create, only logins the filter can not rule out are looked up
+    candidates = [row['login'] for _, row in unique_rows if login_filter.might_exist(row['login'])]
+    taken = existing_logins(candidates) if candidates else set()
+    remaining = []
+    for i, row in unique_rows:
+        if normalize(row['login']) in taken:
+            results[i] = {'index': i, 'status': status.HTTP_409_CONFLICT, 'errors': {'error': 'User already exists'}}
+        else:
+            remaining.append((i, row))
+    return remaining
+
+
+def _conflicts(results, pending, existing_logins):
+    """Results of a rolled back atomic request: 409 for the taken logins, nothing else created"""
+    taken = existing_logins([row['login'] for _, row in pending]) if existing_logins and pending else set()
+    for i, row in pending:
+        if normalize(row['login']) in taken:
+            results[i] = {'index': i, 'status': status.HTTP_409_CONFLICT, 'errors': {'error': 'User already exists'}}
+        else:
+            results[i] = None
+    return results
+
+
+def _rows(chunk):
+    return [row for _, row in chunk]
+
+
+def _store(results, chunk, created, represent):
+    for (i, _), data in zip(chunk, represent(created)):
+        results[i] = {'index': i, 'status': status.HTTP_201_CREATED, 'data': data}
+
+
+def _insert_one_by_one(results, chunk, insert_rows, represent):
+    for i, row in chunk:
+        try:
+            with transaction.atomic(using=shard_alias()):
+                created = insert_rows([row])
+            _store(results, [(i, row)], created, represent)
+        except IntegrityError as e:
+            error = 'User already exists' if is_duplicate_key(e) else 'Integrity error'
+            results[i] = {'index': i, 'status': status.HTTP_409_CONFLICT, 'errors': {'error': error}}
+        except DatabaseError as e:
+            logger.error("Bulk insert of item %s failed: %s", i, str(e))
+            results[i] = {'index': i, 'status': status.HTTP_500_INTERNAL_SERVER_ERROR,
+                          'errors': {'error': 'Database error'}}
+
+
+def _body(results, created: int) -> Dict[str, Any]:
+    # Items that were valid but never attempted (atomic mode aborted)
+    results = [r if r is not None else {'index': i, 'status': status.HTTP_424_FAILED_DEPENDENCY}
+               for i, r in enumerate(results)]
+    return {'created': created, 'results': results}
@@ -0,0 +1,262 @@
+"""
+Read-through caching for the single-user lookups.
+
+Two tiers are consulted in order:
+
+1. a bounded, per-process LRU with a TTL, which answers most reads without
+   leaving the worker, and
+2. optionally a shared Django cache (``settings.CACHES`` alias), so workers
+   share loaded users and invalidations.
+
+Misses (the loader returned ``None``) are cached for a shorter TTL so a
+flood of 404s does not reach the database either. Writers call
+``invalidate`` for the ids they touched. Other workers' LRU tiers only
+notice via their TTL: other clients can be served a row up to
+``USER_CACHE['TTL']`` seconds older than the last write, so keep it short.
+
+Invalidating a key also bumps its generation, kept per process for the
+loads in flight and in the shared tier. A load that overlaps an
+invalidation of its key is returned but not cached, as it may have read the
+row from before the write. A read from a replica can lag a write that is
+already invalidated, so replica rows are shared for ``TTL`` seconds only,
+not ``SHARED_TTL``. Either way a stale row outlives the write by at most
+``TTL`` seconds (plus the replication lag).
+
+Reads pinned to the primary (``routing.use_primary``: after the client's
+own write, or inside a transaction) bypass both tiers and refresh them, so
+read-your-writes holds even while other workers still cache the old row.
+
+Keys are scoped by the current shard (``api.core.db.routing``): the same id
+on two shards is two different users.
+"""
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from .db.routing import reads_may_lag, shard_alias, use_primary
+
+logger = logging.getLogger(__name__)
+
+# Stored in place of a value for keys known not to exist
+_NEGATIVE = ('__negative__',)
+
+_registry: List['ReadThroughCache'] = []
+
+
+class ReadThroughCache:
+    def __init__(self, namespace: str, max_entries: int = 10000, ttl: float = 30, negative_ttl: float = 5,
+                 shared_alias: Optional[str] = None, shared_ttl: Optional[float] = None):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.shared_alias = shared_alias or None
+        self.shared_ttl = shared_ttl if shared_ttl is not None else ttl
+        self._entries: 'OrderedDict[Hashable, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        # key -> [loads in flight, generation], while a load of the key runs
+        self._loads: Dict[Hashable, list] = {}
+        self.hits = 0
+        self.negative_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        _registry.append(self)
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias] if self.shared_alias else None
+
+    def get(self, key: Hashable, loader: Callable[[Hashable], Any]) -> Any:
+        """Return the cached value for ``key``, calling ``loader(key)`` on a miss"""
+        loader_key, key = key, (shard_alias(), key)
+        # A tier could still hold the row from before this client's write
+        fresh = use_primary()
+        if not fresh:
+            found, value = self._get_local(key)
+            if found:
+                return None if value is _NEGATIVE else value
+
+        shared_ttl = self.ttl if reads_may_lag() else self.shared_ttl
+        load = self._start_load(key)
+        try:
+            value, generation = self._get_shared(key)
+            loaded = fresh or value is None
+            if loaded:
+                with self._lock:
+                    self.misses += 1
+                value = loader(loader_key)
+                value = _NEGATIVE if value is None else value
+            else:
+                with self._lock:
+                    self.shared_hits += 1
+        finally:
+            current = self._finish_load(key, load)
+
+        if current:
+            self._set_local(key, value)
+            if loaded:
+                self._set_shared(key, value, generation, shared_ttl)
+        return None if value is _NEGATIVE else value
+
+    def invalidate(self, *keys: Hashable) -> None:
+        self._invalidate(shard_alias(), keys)
+
+    def _invalidate(self, shard: str, keys) -> None:
+        keys = [(shard, key) for key in keys]
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+                if key in self._loads:
+                    self._loads[key][1] += 1
+            self.invalidations += len(keys)
+        shared = self.shared
+        if shared is not None and keys:
+            generation = uuid.uuid4().hex
+            try:
+                shared.delete_many([self._shared_key(key) for key in keys])
+                shared.set_many({self._generation_key(key): generation for key in keys}, self.shared_ttl)
+            except Exception as e:
+                logger.warning("Shared cache invalidation failed for %s: %s", self.namespace, e)
+
+    def invalidate_on_commit(self, *keys: Hashable) -> None:
+        """
+        Invalidate now and again once the surrounding transaction commits, so
+        a reader can not cache the pre-commit row in between.
+        """
+        shard = shard_alias()
+        self._invalidate(shard, keys)
+        transaction.on_commit(lambda: self._invalidate(shard, keys), using=shard)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'namespace': self.namespace,
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'negative_hits': self.negative_hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+    def _start_load(self, key) -> tuple:
+        with self._lock:
+            load = self._loads.setdefault(key, [0, 0])
+            load[0] += 1
+            return load, load[1]
+
+    def _finish_load(self, key, load) -> bool:
+        """Whether ``key`` was not invalidated since ``_start_load``"""
+        load, generation = load
+        with self._lock:
+            load[0] -= 1
+            if not load[0]:
+                del self._loads[key]
+            return load[1] == generation
+
+    def _get_local(self, key):
+        if self.max_entries <= 0:
+            return False, None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            expires_at, value = entry
+            if expires_at < now:
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            if value is _NEGATIVE:
+                self.negative_hits += 1
+            else:
+                self.hits += 1
+            return True, value
+
+    def _set_local(self, key, value):
+        if self.max_entries <= 0:
+            return
+        ttl = self.negative_ttl if value is _NEGATIVE else self.ttl
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _shared_key(self, key) -> str:
+        shard, key = key
+        return f"{self.namespace}:{shard}:{key}"
+
+    def _generation_key(self, key) -> str:
+        shard, key = key
+        return f"{self.namespace}.generation:{shard}:{key}"
+
+    def _get_shared(self, key):
+        """``(value, generation)`` of ``key`` in the shared tier, the value is ``None`` on a miss"""
+        shared = self.shared
+        if shared is None:
+            return None, None
+        value_key, generation_key = self._shared_key(key), self._generation_key(key)
+        try:
+            found = shared.get_many([value_key, generation_key])
+        except Exception as e:
+            logger.warning("Shared cache read failed for %s: %s", self.namespace, e)
+            return None, None
+        value = found.get(value_key)
+        # The marker comes back as an equal copy after pickling, restore identity
+        if isinstance(value, tuple) and value == _NEGATIVE:
+            value = _NEGATIVE
+        return value, found.get(generation_key)
+
+    def _set_shared(self, key, value, generation, ttl):
+        shared = self.shared
+        if shared is None:
+            return
+        ttl = self.negative_ttl if value is _NEGATIVE else ttl
+        try:
+            # Another worker invalidated the key while this one was loading
+            if shared.get(self._generation_key(key)) != generation:
+                return
+            shared.set(self._shared_key(key), value, ttl)
+        except Exception as e:
+            logger.warning("Shared cache write failed for %s: %s", self.namespace, e)
+
+
+def build_cache(namespace: str) -> ReadThroughCache:
+    """A cache configured from ``settings.USER_CACHE``"""
+    options = settings.USER_CACHE
+    return ReadThroughCache(
+        namespace,
+        max_entries=options['MAX_ENTRIES'],
+        ttl=options['TTL'],
+        negative_ttl=options['NEGATIVE_TTL'],
+        shared_alias=options['SHARED_ALIAS'],
+        shared_ttl=options['SHARED_TTL'],
+    )
+
+
+def cache_stats() -> List[Dict[str, Any]]:
+    """Counters of every cache in this process"""
+    return [cache.stats() for cache in _registry]
+
+
+def clear_caches() -> None:
+    """Empty the local tier of every cache in this process, e.g. between tests"""
+    for cache in _registry:
+        cache.clear()
@@ -0,0 +1,112 @@
+"""
+Change feed (delta sync) over ``changed_at``.
+
+A client syncs by following a watermark: each page holds the rows changed
+(or deleted, as tombstones) after it, ordered by ``(changed_at, id)``, and
+the watermark of the last entry, which the client sends back as ``since``.
+A sync then reads the changes instead of the whole table.
+
+Writes stamp ``changed_at`` before they commit, so a row can become visible
+with a ``changed_at`` already behind a watermark handed out meanwhile. The
+feed therefore ends ``USER_CHANGES_SETTLE_SECONDS`` before now and reads
+the primary, a page never contains a range later writes could still land
+in. Tombstones are pruned after ``USER_CHANGES_RETENTION_DAYS``, an older
+watermark could miss deletions and is rejected, the client has to resync.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework.utils.urls import replace_query_param
+
+from api.mandant.context import mandant_limit
+from .pagination import InvalidCursor, decode_cursor, encode_cursor
+
+
+class InvalidWatermark(ValueError):
+    """Raised for a ``since`` that can not be decoded"""
+
+
+class ExpiredWatermark(ValueError):
+    """Raised for a ``since`` older than the tombstone retention"""
+
+
+def encode_watermark(changed_at: datetime, row_id: int) -> str:
+    return encode_cursor({'w': [changed_at, row_id]})
+
+
+def decode_watermark(token: str) -> Tuple[datetime, int]:
+    """``(changed_at, id)`` of a watermark"""
+    try:
+        key = decode_cursor(token).get('w')
+    except InvalidCursor as e:
+        raise InvalidWatermark('Invalid since') from e
+    if (not isinstance(key, list) or len(key) != 2 or not isinstance(key[0], datetime)
+            or not isinstance(key[1], int)):
+        raise InvalidWatermark('Invalid since')
+    return key[0], key[1]
+
+
+def _aware(value: datetime) -> datetime:
+    # Raw queries return the stored UTC values without a time zone
+    return timezone.make_aware(value, dt_timezone.utc) if timezone.is_naive(value) else value
+
+
+class ChangeFeed:
+    """
+    Parses ``since`` and ``limit`` from a request and turns the entries
+    returned by a service (dicts with ``id`` and ``changed_at``, in feed
+    order) into a page with the watermark to continue from.
+    """
+    since_query_param = 'since'
+    limit_query_param = 'limit'
+
+    def __init__(self, request, now: Optional[datetime] = None):
+        self.request = request
+        params = getattr(request, 'query_params', request.GET)
+        self.limit = self._parse_limit(params.get(self.limit_query_param))
+        now = now or timezone.now()
+        # Writes stamped before this have committed (or rolled back) by now
+        self.until = now - timedelta(seconds=settings.USER_CHANGES_SETTLE_SECONDS)
+
+        token = params.get(self.since_query_param)
+        self.key = decode_watermark(token) if token else None
+        self.since = token or None
+        retention = settings.USER_CHANGES_RETENTION_DAYS
+        if self.key and retention and _aware(self.key[0]) < now - timedelta(days=retention):
+            raise ExpiredWatermark(f"since is older than {retention} days, resync from the start")
+        self.has_more = False
+
+    @staticmethod
+    def _parse_limit(value) -> int:
+        default = mandant_limit('USER_CHANGES_PAGE_SIZE')
+        maximum = mandant_limit('USER_CHANGES_MAX_PAGE_SIZE')
+        try:
+            limit = int(value) if value is not None else default
+        except ValueError:
+            limit = default
+        return max(1, min(limit, maximum))
+
+    @property
+    def fetch_size(self) -> int:
+        """Entries to request from the service, one extra to detect more changes"""
+        return self.limit + 1
+
+    def paginate(self, entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        self.has_more = len(entries) > self.limit
+        entries = entries[:self.limit]
+        if entries:
+            self.since = encode_watermark(entries[-1]['changed_at'], entries[-1]['id'])
+        return entries
+
+    def get_response_data(self, results) -> Dict[str, Any]:
+        """``since`` is the watermark to poll with next, ``next`` the same as a link"""
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        return {
+            'since': self.since,
+            'next': replace_query_param(url, self.since_query_param, self.since) if self.since else None,
+            'has_more': self.has_more,
+            'results': results,
+        }
@@ -0,0 +1,127 @@
+"""
+Group commit of concurrent single-row writes.
+
+Under load every create is its own INSERT and commit, and the commits
+(each a log flush) become the limit. A ``WriteCoalescer`` lets the writes
+of one worker process share them: the first write to arrive becomes the
+leader of a batch and waits up to ``max_delay`` seconds, or until
+``max_batch`` writes joined, then runs ``flush`` with all of them (one
+multi-row INSERT and one commit) on its thread. The others block until the
+batch is done and each gets its own result or exception back.
+
+A batch only holds writes of one shard, the leader's connection writes it.
+Writes inside a transaction are not coalesced, they must commit with it.
+Batches only form between threads of a process: threaded WSGI workers or
+the executor of the async views (``ASYNC_DB_MAX_WORKERS``).
+
+Batch sizes and the leaders' waits go to the ``write_batch_size`` and
+``write_batch_wait_seconds`` histograms.
+"""
+import copy
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from django.db import connections
+
+from .db.routing import mark_write, shard_alias
+from .metrics import registry
+
+
+class _Batch:
+    __slots__ = ('items', 'results', 'error', 'full', 'done')
+
+    def __init__(self):
+        self.items: List[Any] = []
+        self.results: List[Any] = []
+        # What failed the whole batch, if anything did
+        self.error: Optional[Exception] = None
+        # Set once the batch takes no more items
+        self.full = threading.Event()
+        self.done = threading.Event()
+
+
+class WriteCoalescer:
+    """
+    Combines concurrent ``submit(item)`` calls into ``flush(items)`` calls.
+    ``flush`` returns one result per item, an exception in place of a
+    result fails only that item. If ``flush`` raises, all items fail, each
+    waiter with its own copy of the exception.
+    """
+
+    def __init__(self, name: str, flush: Callable[[List[Any]], List[Any]], enabled: bool = True,
+                 max_batch: int = 64, max_delay: float = 0.002):
+        self.name = name
+        self.flush = flush
+        self.enabled = enabled and max_batch > 1
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._open: Dict[str, _Batch] = {}
+        self._lock = threading.Lock()
+
+    def can_coalesce(self) -> bool:
+        """Enabled and not inside a transaction of the current shard"""
+        return self.enabled and not connections[shard_alias()].in_atomic_block
+
+    def submit(self, item: Any) -> Any:
+        """Write ``item`` with the next batch, returning its result"""
+        shard = shard_alias()
+        mark_write()
+        with self._lock:
+            batch = self._open.get(shard)
+            leader = batch is None
+            if leader:
+                batch = self._open[shard] = _Batch()
+            index = len(batch.items)
+            batch.items.append(item)
+            if len(batch.items) >= self.max_batch:
+                del self._open[shard]
+                batch.full.set()
+
+        if leader:
+            started = time.perf_counter()
+            batch.full.wait(self.max_delay)
+            with self._lock:
+                if self._open.get(shard) is batch:
+                    del self._open[shard]
+            self._run(batch, time.perf_counter() - started)
+        else:
+            batch.done.wait()
+
+        if batch.error is not None:
+            # Raised in many threads at once, one instance would collect all their tracebacks
+            raise _copy_error(batch.error) from batch.error
+        result = batch.results[index]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def _run(self, batch: _Batch, waited: float) -> None:
+        labels = {'coalescer': self.name}
+        registry.observe('write_batch_size', labels, len(batch.items))
+        registry.observe('write_batch_wait_seconds', labels, waited)
+        # Failing the followers should the leader not get to finish
+        batch.error = RuntimeError(f"{self.name} batch was not written")
+        try:
+            results = self.flush(batch.items)
+            if len(results) != len(batch.items):
+                raise RuntimeError(f"{self.name} flush returned {len(results)} results for {len(batch.items)} items")
+            batch.results = results
+            batch.error = None
+        except Exception as e:
+            batch.error = e
+        finally:
+            batch.done.set()
+        if batch.error is not None:
+            failed = len(batch.items)
+        else:
+            failed = sum(isinstance(result, Exception) for result in batch.results)
+        registry.inc('write_batch_items_total', {**labels, 'outcome': 'ok'}, len(batch.items) - failed)
+        registry.inc('write_batch_items_total', {**labels, 'outcome': 'failed'}, failed)
+
+
+def _copy_error(error: Exception) -> Exception:
+    try:
+        return copy.copy(error)
+    except Exception:
+        return RuntimeError(str(error))
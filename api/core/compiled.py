@@ -0,0 +1,330 @@
+"""
+Compiled serializers.
+
+DRF converts every instance by walking deep-copied field objects and
+dispatching ``get_attribute``/``to_representation`` (and ``get_value``/
+``run_validation`` for input) per field. ``compile_serializer`` generates
+one specialized function per serializer class and direction instead, with
+the conversions of the common field types inlined and the remaining fields
+called directly on a prototype bound once.
+
+Opt in with ``CompiledSerializerMixin`` (and ``CompiledListSerializer`` as
+``Meta.list_serializer_class`` for lists):
+
+* Output is built from dicts or objects/tuples of plain values. Anything the
+  generated code can not handle (e.g. a missing key) is retried with the
+  regular DRF code, so the result is the same.
+* Input takes a fast path for valid JSON objects. Any validation problem
+  reruns the regular DRF validation, so the errors are the same too.
+* ``fields=`` (a tuple of field names, see ``api.core.sparse``) renders only
+  those fields, with a converter generated for that field set.
+"""
+import functools
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from rest_framework import ISO_8601, serializers
+from rest_framework.exceptions import ValidationError
+from rest_framework.fields import empty
+from rest_framework.settings import api_settings
+
+from .metrics import serializer_timer
+from .serializer_fields import JaNeinToBooleanField, YesNoToBooleanField
+
+# Inlined to_representation of the field types, by their method
+_REPRESENTATIONS = {
+    serializers.IntegerField.to_representation: 'int({v})',
+    serializers.CharField.to_representation: 'str({v})',
+    # Same as BooleanField for ints, other values go through the field
+    serializers.BooleanField.to_representation: 'bool({v}) if type({v}) is int or type({v}) is bool else {f}({v})',
+    YesNoToBooleanField.to_representation: "{v}.lower() == 'yes'",
+    JaNeinToBooleanField.to_representation: "'ja' if {v} else 'nein'",
+}
+
+# Unbound field for the DRF datetime format (DATETIME_FORMAT, time zone)
+_datetime_field = serializers.DateTimeField()
+
+
+def datetime_formatter() -> Callable[[Any], Any]:
+    """
+    ``DateTimeField.to_representation`` with the current time zone looked up
+    once instead of per value. Values at a DST transition and formats other
+    than ISO 8601 go through the field itself.
+    """
+    field_timezone = _datetime_field.default_timezone()
+    if field_timezone is None or api_settings.DATETIME_FORMAT.lower() != ISO_8601:
+        return _datetime_field.to_representation
+
+    def to_representation(value):
+        if isinstance(value, str):
+            return value
+        if value.tzinfo is None:
+            aware = value.replace(tzinfo=field_timezone)
+            if aware.utcoffset() != aware.replace(fold=1).utcoffset():
+                return _datetime_field.to_representation(value)
+        else:
+            aware = value.astimezone(field_timezone)
+        value = aware.isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+
+    return to_representation
+
+
+def _is_default_datetime(field) -> bool:
+    return (
+        type(field).to_representation is serializers.DateTimeField.to_representation
+        and 'format' not in vars(field)
+        and 'timezone' not in vars(field)
+    )
+
+
+def _simple_source(field) -> bool:
+    return field.source != '*' and len(field.source_attrs) == 1
+
+
+def _build(name: str, lines: List[str], namespace: Dict[str, Any]) -> Callable:
+    exec('\n'.join(lines), namespace)
+    return namespace[name]
+
+
+def _compile_representation(prototype, only: Optional[Sequence[str]] = None) -> Optional[Callable]:
+    """``represent(instance, fmt)`` for the readable fields (of ``only``), ``None`` if not compilable"""
+    fields = [field for field in prototype._readable_fields if only is None or field.field_name in only]
+    if any(type(field).get_attribute is not serializers.Field.get_attribute or not _simple_source(field)
+           for field in fields):
+        return None
+
+    namespace = {'Mapping': Mapping}
+    by_key, by_attr, items = [], [], []
+    for i, field in enumerate(fields):
+        namespace[f'f{i}'] = field.to_representation
+        attr = field.source_attrs[0]
+        by_key.append(f'        v{i} = instance[{attr!r}]')
+        by_attr.append(f'        v{i} = instance.{attr}' if attr.isidentifier() else
+                       f'        v{i} = getattr(instance, {attr!r})')
+        if _is_default_datetime(field):
+            expression = 'fmt(v{i})'
+        else:
+            expression = _REPRESENTATIONS.get(type(field).to_representation, '{f}({v})')
+        expression = expression.format(v=f'v{i}', f=f'f{i}', i=i)
+        items.append(f'        {field.field_name!r}: None if v{i} is None else ({expression}),')
+
+    lines = [
+        'def represent(instance, fmt):',
+        '    if type(instance) is dict or isinstance(instance, Mapping):',
+        *(by_key or ['        pass']),
+        '    else:',
+        *(by_attr or ['        pass']),
+        '    return {',
+        *items,
+        '    }',
+    ]
+    return _build('represent', lines, namespace)
+
+
+def _compile_internal_value(prototype) -> Optional[Callable]:
+    """
+    ``internal(serializer, data, partial)`` for the writable fields, returning
+    the validated dict or ``None`` when the regular DRF path has to run
+    """
+    fields = list(prototype._writable_fields)
+    for field in fields:
+        if (type(field).get_value is not serializers.Field.get_value
+                or type(field).validate_empty_values is not serializers.Field.validate_empty_values
+                or type(field).run_validation not in (serializers.Field.run_validation,
+                                                      serializers.CharField.run_validation)
+                or not _simple_source(field)
+                or getattr(field.default, 'requires_context', False)
+                or any(getattr(validator, 'requires_context', False) for validator in field.validators)):
+            return None
+
+    namespace = {'empty': empty}
+    lines = ['def internal(serializer, data, partial):', '    ret = {}']
+    for i, field in enumerate(fields):
+        namespace[f'f{i}'] = field
+        name, source = field.field_name, field.source
+        validate_method = getattr(type(prototype), 'validate_' + name, None)
+        lines.append(f'    v = data.get({name!r}, empty)')
+
+        # Missing, as Field.validate_empty_values/get_default
+        lines.append('    if v is empty:')
+        lines.append('        if partial:')
+        lines.append('            pass')
+        if field.required:
+            lines.append('        else:')
+            lines.append('            return None')
+        elif field.default is not empty:
+            default = f'f{i}.default()' if callable(field.default) else f'f{i}.default'
+            lines.append('        else:')
+            lines.append(f'            v = {default}')
+            if validate_method:
+                lines.append(f'            v = serializer.validate_{name}(v)')
+            lines.append(f'            ret[{source!r}] = v')
+
+        # None
+        lines.append('    elif v is None:')
+        if field.allow_null:
+            if validate_method:
+                lines.append(f'        v = serializer.validate_{name}(v)')
+            lines.append(f'        ret[{source!r}] = v')
+        else:
+            lines.append('        return None')
+
+        lines.append('    else:')
+        if type(field).run_validation is serializers.CharField.run_validation:
+            blank = "v == ''" + (" or str(v).strip() == ''" if field.trim_whitespace else '')
+            lines.append(f'        if {blank}:')
+            if field.allow_blank:
+                lines.append("            v = ''")
+            else:
+                lines.append('            return None')
+            lines.append('        else:')
+            indent = '            '
+        else:
+            indent = '        '
+        lines.append(f'{indent}v = f{i}.to_internal_value(v)')
+        if field.validators:
+            lines.append(f'{indent}f{i}.run_validators(v)')
+        if validate_method:
+            lines.append(f'        v = serializer.validate_{name}(v)')
+        lines.append(f'        ret[{source!r}] = v')
+    lines.append('    return ret')
+    return _build('internal', lines, namespace)
+
+
+class CompiledSerializer:
+    """The generated converters of one serializer class"""
+
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+        self.prototype = serializer_class()
+        self._represent = None
+        self._internal = None
+        self._compilable = serializer_class.to_representation in (serializers.Serializer.to_representation,
+                                                                  CompiledSerializerMixin.to_representation)
+        if self._compilable:
+            self._represent = _compile_representation(self.prototype)
+        # Field set -> converter of the sparse fieldsets, at most one per subset of the fields
+        self._sparse: Dict[Tuple[str, ...], Optional[Callable]] = {}
+        if serializer_class.to_internal_value in (serializers.Serializer.to_internal_value,
+                                                  CompiledSerializerMixin.to_internal_value):
+            self._internal = _compile_internal_value(self.prototype)
+        # Serializer level validators need the full field set
+        self.has_validators = bool(self.prototype.validators)
+
+    def representer(self, fields: Optional[Tuple[str, ...]] = None) -> Optional[Callable]:
+        """The generated converter of ``fields`` (all readable fields if ``None``)"""
+        if fields is None:
+            return self._represent
+        try:
+            return self._sparse[fields]
+        except KeyError:
+            represent = _compile_representation(self.prototype, fields) if self._compilable else None
+            return self._sparse.setdefault(fields, represent)
+
+    def _generic_representation(self, instance, fields: Optional[Tuple[str, ...]] = None):
+        data = self.serializer_class.to_representation(self.prototype, instance)
+        if fields is not None:
+            data = {name: data[name] for name in fields}
+        return data
+
+    def _to_representation(self, instance, fmt: Callable, represent: Optional[Callable] = None,
+                           fields: Optional[Tuple[str, ...]] = None) -> Dict[str, Any]:
+        if represent is None:
+            return self._generic_representation(instance, fields)
+        try:
+            return represent(instance, fmt)
+        except (KeyError, AttributeError):
+            return self._generic_representation(instance, fields)
+
+    def _represent_many(self, instances, fields: Optional[Tuple[str, ...]] = None) -> List[Dict[str, Any]]:
+        fmt = datetime_formatter()
+        represent = self.representer(fields)
+        return [self._to_representation(instance, fmt, represent, fields) for instance in instances]
+
+    def to_representation(self, instance, fields: Optional[Tuple[str, ...]] = None) -> Dict[str, Any]:
+        with serializer_timer():
+            return self._to_representation(instance, datetime_formatter(), self.representer(fields), fields)
+
+    def represent_many(self, instances, fields: Optional[Tuple[str, ...]] = None) -> List[Dict[str, Any]]:
+        with serializer_timer():
+            return self._represent_many(instances, fields)
+
+    def to_internal_value(self, serializer, data) -> Optional[Dict[str, Any]]:
+        """The validated data, ``None`` if the regular DRF validation has to run"""
+        if self._internal is None or type(data) is not dict:
+            return None
+        try:
+            return self._internal(serializer, data, getattr(serializer.root, 'partial', False))
+        except (ValidationError, DjangoValidationError):
+            return None
+
+
+@functools.lru_cache(maxsize=None)
+def compile_serializer(serializer_class) -> CompiledSerializer:
+    return CompiledSerializer(serializer_class)
+
+
+class CompiledSerializerMixin:
+    """
+    Serializer mixin converting with the class' compiled functions. The
+    ``fields`` argument limits the output to those fields.
+    """
+
+    def __init__(self, *args, fields: Optional[Sequence[str]] = None, **kwargs):
+        self.sparse_fields = tuple(fields) if fields is not None else None
+        super().__init__(*args, **kwargs)
+
+    @property
+    def data(self):
+        with serializer_timer():
+            return super().data
+
+    def is_valid(self, *, raise_exception=False):
+        with serializer_timer():
+            return super().is_valid(raise_exception=raise_exception)
+
+    def to_representation(self, instance):
+        fields = self.sparse_fields
+        represent = compile_serializer(type(self)).representer(fields)
+        if represent is not None:
+            try:
+                return represent(instance, datetime_formatter())
+            except (KeyError, AttributeError):
+                pass
+        data = super().to_representation(instance)
+        if fields is not None:
+            data = {name: data[name] for name in fields}
+        return data
+
+    def to_internal_value(self, data):
+        value = compile_serializer(type(self)).to_internal_value(self, data)
+        if value is None:
+            # Invalid or unusual input, the regular path raises the exact errors
+            return super().to_internal_value(data)
+        return value
+
+    def run_validators(self, value):
+        # Without serializer level validators this would only deep-copy the fields
+        if compile_serializer(type(self)).has_validators:
+            super().run_validators(value)
+
+
+class CompiledListSerializer(serializers.ListSerializer):
+    """List serializer rendering all items with one compiled converter"""
+
+    @property
+    def data(self):
+        with serializer_timer():
+            return super().data
+
+    def is_valid(self, *, raise_exception=False):
+        with serializer_timer():
+            return super().is_valid(raise_exception=raise_exception)
+
+    def to_representation(self, data):
+        fields = getattr(self.child, 'sparse_fields', None)
+        return compile_serializer(type(self.child))._represent_many(data, fields)
@@ -0,0 +1,182 @@
+"""
+Content codings for ``CompressionMiddleware``: gzip (zlib), br (the
+``brotli`` or ``brotlicffi`` package) and zstd (``zstandard``, or
+``compression.zstd`` from Python 3.14). Codings whose library is missing
+are simply not offered.
+
+``negotiate`` picks the coding for an ``Accept-Encoding`` header: the
+highest q-value wins, ties go to the server's order of preference.
+"""
+import zlib
+from typing import Dict, Iterable, Optional, Sequence
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+try:
+    from compression import zstd as stdlib_zstd
+except ImportError:  # pragma: no cover
+    stdlib_zstd = None
+
+
+class StreamCompressor:
+    """Compresses a stream chunk by chunk, each chunk is flushed so the client can decode it right away"""
+
+    def compress(self, chunk: bytes) -> bytes:
+        raise NotImplementedError
+
+    def finish(self) -> bytes:
+        raise NotImplementedError
+
+
+class Coding:
+    name = ''
+
+    def __init__(self, level: Optional[int] = None):
+        self.level = self.default_level if level is None else level
+
+    def compress(self, data: bytes) -> bytes:
+        compressor = self.compressor()
+        return compressor.compress(data) + compressor.finish()
+
+    def compressor(self) -> StreamCompressor:
+        raise NotImplementedError
+
+
+class _ZlibStream(StreamCompressor):
+    def __init__(self, level):
+        # wbits 31: gzip header and trailer
+        self.zlib = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, chunk):
+        return self.zlib.compress(chunk) + self.zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.zlib.flush()
+
+
+class GzipCoding(Coding):
+    name = 'gzip'
+    default_level = 6
+
+    def compressor(self):
+        return _ZlibStream(self.level)
+
+
+class _BrotliStream(StreamCompressor):
+    def __init__(self, quality):
+        self.brotli = brotli.Compressor(quality=quality)
+
+    def compress(self, chunk):
+        return self.brotli.process(chunk) + self.brotli.flush()
+
+    def finish(self):
+        return self.brotli.finish()
+
+
+class BrotliCoding(Coding):
+    name = 'br'
+    # Fast enough for dynamic responses, the high qualities are for static files
+    default_level = 4
+
+    def compress(self, data):
+        return brotli.compress(data, quality=self.level)
+
+    def compressor(self):
+        return _BrotliStream(self.level)
+
+
+class _ZstandardStream(StreamCompressor):
+    def __init__(self, level):
+        self.zstd = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, chunk):
+        return self.zstd.compress(chunk) + self.zstd.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self.zstd.flush()
+
+
+class _StdlibZstdStream(StreamCompressor):
+    def __init__(self, level):
+        self.zstd = stdlib_zstd.ZstdCompressor(level=level)
+
+    def compress(self, chunk):
+        return self.zstd.compress(chunk) + self.zstd.flush(stdlib_zstd.ZstdCompressor.FLUSH_BLOCK)
+
+    def finish(self):
+        return self.zstd.flush()
+
+
+class ZstdCoding(Coding):
+    name = 'zstd'
+    default_level = 3
+
+    def compress(self, data):
+        if zstandard is not None:
+            return zstandard.ZstdCompressor(level=self.level).compress(data)
+        return stdlib_zstd.compress(data, level=self.level)
+
+    def compressor(self):
+        if zstandard is not None:
+            return _ZstandardStream(self.level)
+        return _StdlibZstdStream(self.level)
+
+
+CODINGS = {
+    'gzip': GzipCoding,
+    'br': BrotliCoding if brotli is not None else None,
+    'zstd': ZstdCoding if zstandard is not None or stdlib_zstd is not None else None,
+}
+
+
+def available_codings(names: Iterable[str], levels: Optional[Dict[str, int]] = None) -> Dict[str, Coding]:
+    """The installed codings of ``names``, in that order of preference"""
+    levels = levels or {}
+    unknown = set(names) - set(CODINGS)
+    if unknown:
+        raise ValueError(f"Unknown content codings: {', '.join(sorted(unknown))}")
+    return {name: CODINGS[name](levels.get(name)) for name in names if CODINGS[name] is not None}
+
+
+def _accepted(header: str) -> Dict[str, float]:
+    accepted = {}
+    for part in header.split(','):
+        name, _, params = part.partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[name] = q
+    return accepted
+
+
+def negotiate(header: str, preference: Sequence[str]) -> Optional[str]:
+    """The coding of ``preference`` to answer ``Accept-Encoding: header`` with, ``None`` for identity"""
+    if not header:
+        return None
+    accepted = _accepted(header)
+    wildcard = accepted.get('*', 0.0)
+    best, best_q = None, 0.0
+    for name in preference:
+        q = accepted.get(name, wildcard)
+        if q > best_q:
+            best, best_q = name, q
+    return best
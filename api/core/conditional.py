@@ -0,0 +1,50 @@
+"""
+ETag / Last-Modified support derived from row versions (``id`` and
+``changed_at``), so a conditional GET can be answered without loading or
+serializing the body.
+
+The ETags are weak: the same version may be sent with different encodings.
+"""
+import calendar
+import hashlib
+from datetime import datetime
+from typing import Iterable, Optional, Tuple
+
+from django.http import HttpResponseNotModified
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+def timestamp(value: Optional[datetime]) -> Optional[int]:
+    """Seconds since the epoch, naive datetimes are taken as UTC like the database stores them"""
+    if value is None:
+        return None
+    return calendar.timegm(value.utctimetuple())
+
+
+def row_etag(user_id, changed_at: Optional[datetime]) -> str:
+    version = changed_at.isoformat() if changed_at else ''
+    return f'W/"{user_id}-{hashlib.md5(version.encode()).hexdigest()[:16]}"'
+
+
+def page_etag(versions: Iterable[Tuple[int, Optional[datetime]]], salt: str = '') -> str:
+    """ETag of a list page from the ``(id, changed_at)`` of its rows"""
+    digest = hashlib.md5(salt.encode())
+    for user_id, changed_at in versions:
+        digest.update(f"{user_id}:{changed_at.isoformat() if changed_at else ''};".encode())
+    return f'W/"{digest.hexdigest()}"'
+
+
+def not_modified(request, etag: str, last_modified: Optional[datetime] = None):
+    """A 304 response if the request's validators match, else ``None``"""
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp(last_modified))
+    if isinstance(response, HttpResponseNotModified):
+        return set_validators(response, etag, last_modified)
+    return None
+
+
+def set_validators(response, etag: str, last_modified: Optional[datetime] = None):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(timestamp(last_modified))
+    return response
@@ -0,0 +1,14 @@
+"""
+MySQL backend with a connection pool:
+
+    'ENGINE': 'api.core.db.backends.mysql',
+    'POOL': {'MIN_SIZE': 2, 'MAX_SIZE': 10, ...},
+"""
+from django.db.backends.mysql import base
+
+from api.core.db.backends.pooled import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    def ping_connection(self, connection):
+        connection.ping()
@@ -0,0 +1,40 @@
+"""
+Mixin turning a Django database backend into a pooled one.
+
+``get_new_connection`` checks a connection out of the process' pool for the
+alias and ``_close`` returns it, so Django's per-request connect/close (keep
+``CONN_MAX_AGE`` at 0) becomes a checkout/checkin. Options are read from the
+``POOL`` dict of the database settings, see ``api.core.db.pool``.
+"""
+from api.core.db.pool import get_pool
+
+
+class PooledDatabaseWrapperMixin:
+    def ping_connection(self, connection):
+        """Raise if the raw connection is unusable"""
+        raise NotImplementedError
+
+    def reset_connection(self, connection):
+        """Make a returned raw connection safe for the next checkout"""
+        connection.rollback()
+
+    @property
+    def pool(self):
+        return get_pool(
+            self.alias,
+            lambda: super(PooledDatabaseWrapperMixin, self).get_new_connection(self.get_connection_params()),
+            ping=self.ping_connection,
+            reset=self.reset_connection,
+            **self.settings_dict.get('POOL', {}),
+        )
+
+    def get_new_connection(self, conn_params):
+        return self.pool.acquire()
+
+    def _close(self):
+        if self.connection is None:
+            return
+        with self.wrap_database_errors:
+            # Closed inside atomic() Django keeps referencing the connection,
+            # so it must not go back to the pool
+            self.pool.release(self.connection, discard=self.in_atomic_block)
@@ -0,0 +1,93 @@
+"""
+Composite indexes behind the filtered and sorted user lists.
+
+The ``user`` table is unmanaged, so migrations do not create them; run
+``python manage.py user_indexes --create``. Each list query is an equality
+on ``isActive`` (plus an optional filter) and a range or sort on one more
+column, ending in the id of the keyset seek. The index with the same
+leading columns turns that into a single index range scan in sort order.
+"""
+from typing import Dict, List, NamedTuple, Sequence, Tuple
+
+USER_TABLE = 'user'
+
+# name -> columns
+USER_INDEXES: Dict[str, Tuple[str, ...]] = {
+    'user_active_createdAt': ('isActive', 'createdAt', 'id'),  # v1 created_at
+    'user_active_created_at': ('isActive', 'created_at', 'id'),  # v2 created_at
+    'user_active_login': ('isActive', 'login', 'id'),
+    'user_active_first_name': ('isActive', 'first_name', 'id'),
+    'user_active_last_name': ('isActive', 'last_name', 'id'),
+    'user_active_testBool': ('isActive', 'testBool', 'id'),
+    'user_active_strBool': ('isActive', 'strBool', 'id'),
+    # The v2 change feed seeks on (changed_at, id) over active and inactive users
+    'user_changed_at': ('changed_at', 'id'),
+}
+
+
+# Duplicate logins are only stopped for sure by this key: the login checks
+# before an INSERT race with other writers, and each worker's login filter
+# skips the check for logins other workers created since its last rebuild
+LOGIN_UNIQUE_INDEX = 'user_login_unique'
+
+
+class IndexStatus(NamedTuple):
+    name: str
+    columns: Tuple[str, ...]
+    # Name of the existing index serving it, '' if missing
+    covered_by: str
+    # An index of that name exists with other columns
+    conflict: bool
+
+
+def existing_indexes(connection, table: str = USER_TABLE) -> Dict[str, List[str]]:
+    """name -> columns of the indexes (and unique keys) on ``table``"""
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, table)
+    return {
+        name: list(info['columns'])
+        for name, info in constraints.items()
+        if (info['index'] or info['unique'] or info['primary_key']) and info['columns']
+    }
+
+
+def _covers(existing: Sequence[str], wanted: Sequence[str]) -> bool:
+    # A longer index serves every query of a prefix of it
+    return [c.lower() for c in existing[:len(wanted)]] == [c.lower() for c in wanted]
+
+
+def check_indexes(connection, indexes: Dict[str, Tuple[str, ...]] = USER_INDEXES,
+                  table: str = USER_TABLE) -> List[IndexStatus]:
+    existing = existing_indexes(connection, table)
+    statuses = []
+    for name, columns in indexes.items():
+        if name in existing and _covers(existing[name], columns):
+            covered_by = name
+        else:
+            covered_by = next((other for other, cols in existing.items() if _covers(cols, columns)), '')
+        statuses.append(IndexStatus(name, columns, covered_by, name in existing and covered_by != name))
+    return statuses
+
+
+def create_index_sql(vendor: str, name: str, columns: Sequence[str], table: str = USER_TABLE) -> str:
+    column_list = ', '.join(columns)
+    if vendor == 'mysql':
+        # Online DDL, reads and writes continue while the index builds
+        return f"ALTER TABLE {table} ADD INDEX {name} ({column_list}), ALGORITHM=INPLACE, LOCK=NONE"
+    return f"CREATE INDEX {name} ON {table} ({column_list})"
+
+
+def has_unique_login(connection, table: str = USER_TABLE) -> bool:
+    """Whether a unique key on exactly ``login`` exists"""
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, table)
+    return any(
+        (info['unique'] or info['primary_key']) and [c.lower() for c in info['columns'] or []] == ['login']
+        for info in constraints.values()
+    )
+
+
+def create_unique_login_sql(vendor: str, table: str = USER_TABLE) -> str:
+    if vendor == 'mysql':
+        return f"ALTER TABLE {table} ADD UNIQUE INDEX {LOGIN_UNIQUE_INDEX} (login), ALGORITHM=INPLACE, LOCK=NONE"
+    return f"CREATE UNIQUE INDEX {LOGIN_UNIQUE_INDEX} ON {table} (login)"
@@ -0,0 +1,303 @@
+"""
+A small thread-safe pool of DB-API connections.
+
+Django opens and closes a connection for every request when CONN_MAX_AGE is
+0. The pooled backends hand those requests a connection from this pool
+instead, so the TCP/auth handshake is paid once per connection, not once per
+request.
+
+* ``MAX_SIZE`` bounds the open connections per process. Further checkouts
+  wait up to ``TIMEOUT`` seconds, then fail with ``PoolTimeout``.
+* ``MIN_SIZE`` connections are opened in advance and kept when reaping.
+* ``MAX_IDLE`` closes connections that sat unused for that long.
+* ``MAX_LIFETIME`` retires connections of that age.
+* ``PRE_PING`` checks an idle connection before handing it out and replaces
+  it if the check fails.
+* ``REAP_INTERVAL``: every that many seconds a background thread, started
+  with the first checkout, reaps idle and old connections and tops the
+  pool up to ``MIN_SIZE``, so an idle pool does not keep dead connections.
+  ``0`` leaves both to ``reap()``/``fill()`` calls (and ``release``).
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+from django.db.utils import OperationalError
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'MIN_SIZE': 0,
+    'MAX_SIZE': 10,
+    'TIMEOUT': 10.0,
+    'MAX_LIFETIME': 1800.0,
+    'MAX_IDLE': 300.0,
+    'PRE_PING': True,
+    'REAP_INTERVAL': 30.0,
+}
+
+
+class PoolTimeout(OperationalError):
+    """No connection became available within the checkout timeout"""
+
+
+class _Entry:
+    __slots__ = ('connection', 'created_at', 'released_at')
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.created_at = self.released_at = time.monotonic()
+
+
+class ConnectionPool:
+    def __init__(self, name: str, connect: Callable[[], Any], ping: Optional[Callable[[Any], None]] = None,
+                 reset: Optional[Callable[[Any], None]] = None, **options):
+        options = {**DEFAULTS, **options}
+        self.name = name
+        self.connect = connect
+        self.ping = ping
+        self.reset = reset
+        self.min_size = options['MIN_SIZE']
+        self.max_size = options['MAX_SIZE']
+        self.timeout = options['TIMEOUT']
+        self.max_lifetime = options['MAX_LIFETIME']
+        self.max_idle = options['MAX_IDLE']
+        self.pre_ping = options['PRE_PING']
+        self.reap_interval = options['REAP_INTERVAL']
+
+        self._idle: 'deque[_Entry]' = deque()
+        self._in_use: Dict[int, _Entry] = {}
+        self._opening = 0
+        self._cond = threading.Condition()
+        self._maintainer_pid: Optional[int] = None
+
+        self.created = 0
+        self.closed = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.timeouts = 0
+        self.ping_failures = 0
+
+    @property
+    def size(self) -> int:
+        return len(self._idle) + len(self._in_use) + self._opening
+
+    def acquire(self):
+        """Check out a connection, opening one if the pool has room"""
+        self._ensure_maintained()
+        deadline = None
+        with self._cond:
+            while True:
+                entry = self._pop_idle()
+                if entry is not None:
+                    break
+                if self.size < self.max_size:
+                    self._opening += 1
+                    break
+                # Pool exhausted, wait for a release
+                now = time.monotonic()
+                if deadline is None:
+                    deadline = now + self.timeout
+                    self.waits += 1
+                    wait_started = now
+                remaining = deadline - now
+                if remaining <= 0:
+                    self.timeouts += 1
+                    self.wait_time += now - wait_started
+                    raise PoolTimeout(
+                        f"No database connection available in pool '{self.name}' within {self.timeout}s"
+                    )
+                self._cond.wait(remaining)
+            if deadline is not None:
+                self.wait_time += time.monotonic() - wait_started
+
+        if entry is None:
+            entry = self._open()
+        elif self.pre_ping and self.ping is not None and not self._is_alive(entry):
+            entry = self._replace(entry)
+
+        with self._cond:
+            self._in_use[id(entry.connection)] = entry
+            self.checkouts += 1
+        return entry.connection
+
+    def release(self, connection, discard: bool = False) -> None:
+        """Return a connection, closing it if broken, too old or ``discard`` is set"""
+        with self._cond:
+            entry = self._in_use.pop(id(connection), None)
+        if entry is None:
+            # Not ours (opened before the pool existed), just close it
+            self._close_connection(connection)
+            return
+
+        if not discard and self.reset is not None:
+            try:
+                self.reset(connection)
+            except Exception as e:
+                logger.warning("Discarding connection of pool '%s', reset failed: %s", self.name, e)
+                discard = True
+
+        now = time.monotonic()
+        if discard or now - entry.created_at > self.max_lifetime:
+            self._close_connection(connection)
+            with self._cond:
+                self._cond.notify()
+            return
+
+        entry.released_at = now
+        with self._cond:
+            self._idle.append(entry)
+            self._cond.notify()
+        self.reap()
+
+    def reap(self) -> None:
+        """Close idle connections past MAX_IDLE or MAX_LIFETIME, keeping MIN_SIZE"""
+        now = time.monotonic()
+        expired: List[_Entry] = []
+        with self._cond:
+            keep = deque()
+            # Oldest releases are at the left
+            while self._idle:
+                entry = self._idle.popleft()
+                idle_too_long = now - entry.released_at > self.max_idle
+                too_old = now - entry.created_at > self.max_lifetime
+                if too_old or (idle_too_long and len(keep) + len(self._in_use) + len(self._idle) >= self.min_size):
+                    expired.append(entry)
+                else:
+                    keep.append(entry)
+            self._idle = keep
+        for entry in expired:
+            self._close_connection(entry.connection)
+
+    def fill(self) -> None:
+        """Open idle connections until the pool holds MIN_SIZE"""
+        while True:
+            with self._cond:
+                if self.size >= self.min_size:
+                    return
+                self._opening += 1
+            try:
+                entry = self._open()
+            except Exception as e:
+                logger.warning("Could not open a connection for pool '%s': %s", self.name, e)
+                return
+            with self._cond:
+                self._idle.appendleft(entry)
+                self._cond.notify()
+
+    def _ensure_maintained(self) -> None:
+        # One thread per pool and process, forked workers start their own
+        if self.reap_interval <= 0 or self._maintainer_pid == os.getpid():
+            return
+        with self._cond:
+            if self._maintainer_pid == os.getpid():
+                return
+            self._maintainer_pid = os.getpid()
+        threading.Thread(target=self._maintain, name=f'db-pool-{self.name}', daemon=True).start()
+
+    def _maintain(self) -> None:
+        self.fill()
+        while True:
+            time.sleep(self.reap_interval)
+            try:
+                self.reap()
+                self.fill()
+            except Exception as e:
+                logger.warning("Maintenance of pool '%s' failed: %s", self.name, e)
+
+    def close_all(self) -> None:
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+        for entry in idle:
+            self._close_connection(entry.connection)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                'name': self.name,
+                'size': self.size,
+                'in_use': len(self._in_use),
+                'idle': len(self._idle),
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'created': self.created,
+                'closed': self.closed,
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'wait_time': self.wait_time,
+                'timeouts': self.timeouts,
+                'ping_failures': self.ping_failures,
+            }
+
+    def _pop_idle(self) -> Optional[_Entry]:
+        # Most recently released first, so surplus connections go idle and get reaped
+        now = time.monotonic()
+        while self._idle:
+            entry = self._idle.pop()
+            if now - entry.created_at <= self.max_lifetime:
+                return entry
+            self._close_connection(entry.connection)
+        return None
+
+    def _open(self) -> _Entry:
+        try:
+            entry = _Entry(self.connect())
+        except BaseException:
+            with self._cond:
+                self._opening -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._opening -= 1
+            self.created += 1
+        return entry
+
+    def _is_alive(self, entry: _Entry) -> bool:
+        try:
+            self.ping(entry.connection)
+            return True
+        except Exception as e:
+            logger.info("Replacing dead connection of pool '%s': %s", self.name, e)
+            with self._cond:
+                self.ping_failures += 1
+            return False
+
+    def _replace(self, entry: _Entry) -> _Entry:
+        self._close_connection(entry.connection)
+        with self._cond:
+            self._opening += 1
+        return self._open()
+
+    def _close_connection(self, connection) -> None:
+        try:
+            connection.close()
+        except Exception:
+            pass
+        with self._cond:
+            self.closed += 1
+
+
+# Pools by (pid, alias), so forked workers never share sockets
+_pools: Dict[tuple, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias: str, connect: Callable[[], Any], **kwargs) -> ConnectionPool:
+    key = (os.getpid(), alias)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = _pools[key] = ConnectionPool(alias, connect, **kwargs)
+    return pool
+
+
+def pool_stats() -> List[Dict[str, Any]]:
+    """Statistics of every pool of this process"""
+    pid = os.getpid()
+    return [pool.stats() for (owner, _), pool in list(_pools.items()) if owner == pid]
@@ -0,0 +1,191 @@
+"""
+Read replica routing with read-your-writes stickiness.
+
+The raw SQL services take their connection from ``reader()`` for SELECTs and
+``writer()`` for everything else. ``reader()`` picks one of
+``DATABASE_REPLICAS`` (round-robin, or the least lagging one) unless the
+current client is pinned to the primary:
+
+* inside a transaction on the primary,
+* after a write earlier in the same request,
+* for ``READ_YOUR_WRITES_SECONDS`` after a write of the same client, carried
+  across requests by a cookie set in ``ReadYourWritesMiddleware``.
+
+``ReplicaRouter`` applies the same choice to ORM queries.
+
+Both follow the current shard, the database alias holding the user table of
+the request's mandant (``use_shard``, set by ``MandantMiddleware``). The
+replicas belong to the ``default`` shard, other shards are read from their
+primary.
+"""
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+logger = logging.getLogger(__name__)
+
+SELECTION_ROUND_ROBIN = 'round_robin'
+SELECTION_LEAST_LAG = 'least_lag'
+
+
+class _RequestState:
+    """Mutable, so writes on executor threads with a copied context are seen by the request"""
+    __slots__ = ('pinned', 'wrote')
+
+    def __init__(self, pinned: bool = False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+_state: ContextVar[Optional[_RequestState]] = ContextVar('db_routing_state', default=None)
+_shard: ContextVar[str] = ContextVar('db_shard', default=DEFAULT_DB_ALIAS)
+
+
+def shard_alias() -> str:
+    """The primary alias of the current shard"""
+    return _shard.get()
+
+
+@contextmanager
+def use_shard(alias: str):
+    """Route the queries of the block to the shard ``alias``"""
+    token = _shard.set(alias)
+    try:
+        yield alias
+    finally:
+        _shard.reset(token)
+
+
+def begin_request(pinned: bool = False):
+    return _state.set(_RequestState(pinned))
+
+
+def end_request(token) -> bool:
+    """Forget the request state, returning whether the request wrote"""
+    state = _state.get()
+    _state.reset(token)
+    return bool(state and state.wrote)
+
+
+def mark_write() -> None:
+    state = _state.get()
+    if state is not None:
+        state.wrote = True
+
+
+def use_primary() -> bool:
+    if connections[shard_alias()].in_atomic_block:
+        return True
+    state = _state.get()
+    return state is not None and (state.pinned or state.wrote)
+
+
+class _LagMonitor:
+    """Replication lag per replica, re-measured at most every LAG_CHECK_INTERVAL seconds"""
+
+    def __init__(self):
+        self._lag: Dict[str, Optional[float]] = {}
+        self._checked_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def lag(self, alias: str) -> Optional[float]:
+        now = time.monotonic()
+        with self._lock:
+            fresh = now - self._checked_at.get(alias, float('-inf')) < settings.DATABASE_REPLICA_LAG_CHECK_INTERVAL
+            if fresh:
+                return self._lag.get(alias)
+            # Claim the check, other threads use the previous value meanwhile
+            self._checked_at[alias] = now
+        lag = self._measure(alias)
+        with self._lock:
+            self._lag[alias] = lag
+        return lag
+
+    @staticmethod
+    def _measure(alias: str) -> Optional[float]:
+        """Seconds behind the source, ``None`` if unknown or the replica is unreachable"""
+        try:
+            with connections[alias].cursor() as cursor:
+                try:
+                    cursor.execute("SHOW REPLICA STATUS")
+                    column = 'Seconds_Behind_Source'
+                except Exception:
+                    # MySQL before 8.0.22 / MariaDB before 10.5
+                    cursor.execute("SHOW SLAVE STATUS")
+                    column = 'Seconds_Behind_Master'
+                row = cursor.fetchone()
+                if row is None:
+                    return None
+                names = [col[0] for col in cursor.description]
+                value = dict(zip(names, row)).get(column)
+                return float(value) if value is not None else None
+        except Exception as e:
+            logger.warning("Could not measure replication lag of %s: %s", alias, e)
+            return None
+
+
+_round_robin = itertools.count()
+_lag_monitor = _LagMonitor()
+
+
+def replica_alias() -> str:
+    """The alias a read should use right now"""
+    primary = shard_alias()
+    replicas: List[str] = settings.DATABASE_REPLICAS if primary == DEFAULT_DB_ALIAS else []
+    if not replicas or use_primary():
+        return primary
+
+    if settings.DATABASE_REPLICA_SELECTION == SELECTION_LEAST_LAG:
+        max_lag = settings.DATABASE_REPLICA_MAX_LAG
+        lags = [(lag, alias) for alias in replicas
+                for lag in [_lag_monitor.lag(alias)] if lag is not None and lag <= max_lag]
+        # No healthy replica in bounds, read from the primary
+        return min(lags)[1] if lags else DEFAULT_DB_ALIAS
+
+    return replicas[next(_round_robin) % len(replicas)]
+
+
+def reads_may_lag() -> bool:
+    """Whether a read right now can go to a replica, behind the primary"""
+    return bool(settings.DATABASE_REPLICAS) and shard_alias() == DEFAULT_DB_ALIAS and not use_primary()
+
+
+def reader():
+    """Connection for a read only query"""
+    return connections[replica_alias()]
+
+
+def writer():
+    """Connection for a write, pinning the client to the primary"""
+    mark_write()
+    return connections[shard_alias()]
+
+
+def primary():
+    """Connection of the shard's primary for a read that must not lag, without pinning the client"""
+    return connections[shard_alias()]
+
+
+class ReplicaRouter:
+    """Database router sending ORM reads to the replicas"""
+
+    def db_for_read(self, model, **hints):
+        return replica_alias()
+
+    def db_for_write(self, model, **hints):
+        mark_write()
+        return shard_alias()
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
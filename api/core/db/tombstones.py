@@ -0,0 +1,62 @@
+"""
+Tombstones of hard deleted users, the deletions of the v2 change feed.
+
+A deleted row is gone from ``user``, so the delete records ``(user_id,
+deleted_at)`` in ``user_tombstone`` in the same transaction. The feed reads
+them in ``(deleted_at, user_id)`` order next to the changed users. Like the
+user table the tombstone table is not managed by migrations; ``python
+manage.py user_indexes --create`` creates it, ``prune_tombstones`` drops the
+tombstones older than the feed's retention.
+"""
+from datetime import datetime
+from typing import List, Sequence
+
+from api.core.batching import values_placeholders
+
+TOMBSTONE_TABLE = 'user_tombstone'
+
+SCHEMA = {
+    'sqlite': [
+        f"""
+        CREATE TABLE {TOMBSTONE_TABLE} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            deleted_at DATETIME NOT NULL
+        )
+        """,
+        f"CREATE INDEX {TOMBSTONE_TABLE}_deleted_at ON {TOMBSTONE_TABLE} (deleted_at, user_id)",
+    ],
+    'mysql': [
+        f"""
+        CREATE TABLE {TOMBSTONE_TABLE} (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            user_id INT NOT NULL,
+            deleted_at DATETIME(6) NOT NULL,
+            INDEX {TOMBSTONE_TABLE}_deleted_at (deleted_at, user_id)
+        )
+        """,
+    ],
+}
+
+
+def create_table_sql(vendor: str) -> List[str]:
+    """Statements creating the tombstone table and its index"""
+    return SCHEMA['mysql' if vendor == 'mysql' else 'sqlite']
+
+
+def table_exists(connection) -> bool:
+    with connection.cursor() as cursor:
+        return TOMBSTONE_TABLE in connection.introspection.table_names(cursor)
+
+
+def record_deletions(cursor, user_ids: Sequence[int], deleted_at: datetime) -> None:
+    """Insert the tombstones of ``user_ids`` with the cursor of the deleting transaction"""
+    if not user_ids:
+        return
+    values = []
+    for user_id in user_ids:
+        values.extend([user_id, deleted_at])
+    cursor.execute(
+        f"INSERT INTO {TOMBSTONE_TABLE} (user_id, deleted_at) VALUES {values_placeholders(len(user_ids), 2)}",
+        values
+    )
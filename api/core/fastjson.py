@@ -0,0 +1,90 @@
+"""
+JSON encoding and decoding with orjson, falling back to the stdlib ``json``
+(through DRF's encoder) when it is not installed.
+
+The output is byte for byte what DRF's ``JSONRenderer`` produces with the
+default settings (compact, UTF-8, ``\\u2028``/``\\u2029`` escaped). orjson
+formats ``datetime``/``date``/``time`` values itself, the same way as
+DRF's encoder (ISO 8601, ``Z`` for UTC), so rows with raw ``created_at``
+values need no Python callback per value. Types orjson does not know go
+through DRF's ``JSONEncoder.default``.
+
+Configured in ``REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES']`` and
+``['DEFAULT_PARSER_CLASSES']``; the async views use ``dumps``/``loads``.
+"""
+import json
+from typing import Any
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser, get_encoding
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+_encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+if orjson is not None:
+    # Non-str keys like json.dumps, 'Z' for UTC like DRF's encoder
+    _OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z
+
+# Line and paragraph separator, valid in JSON but not in JavaScript strings
+_JS_UNSAFE = (('\u2028'.encode(), b'\\u2028'), ('\u2029'.encode(), b'\\u2029'))
+
+
+def _default(obj):
+    return _encoder.default(obj)
+
+
+def _js_safe(content: bytes) -> bytes:
+    for raw, escaped in _JS_UNSAFE:
+        if raw in content:
+            content = content.replace(raw, escaped)
+    return content
+
+
+def dumps(data: Any) -> bytes:
+    """Compact UTF-8 JSON of ``data``, as DRF's ``JSONRenderer`` renders it"""
+    if orjson is not None:
+        try:
+            return _js_safe(orjson.dumps(data, default=_default, option=_OPTIONS))
+        except orjson.JSONEncodeError:
+            # e.g. integers beyond 64 bit, the stdlib encoder handles them
+            pass
+    return _js_safe(_encoder.encode(data).encode())
+
+
+def loads(data) -> Any:
+    """Decode a JSON document from bytes or str, raising ``ValueError`` if invalid"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """``JSONRenderer`` encoding with orjson, pretty printed output (``; indent=N``) stays with DRF"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if (orjson is None or not self.compact or self.ensure_ascii or not self.strict
+                or self.get_indent(accepted_media_type, renderer_context or {}) is not None):
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
+
+
+class FastJSONParser(JSONParser):
+    """``JSONParser`` decoding UTF-8 bodies with orjson"""
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = get_encoding(parser_context or {})
+        if orjson is None or encoding.lower().replace('-', '').replace('_', '') != 'utf8':
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except ValueError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
@@ -0,0 +1,184 @@
+"""
+Filters and prefix search for the raw SQL list endpoints.
+
+A ``FilterSet`` maps public query parameters to columns and compiles them
+into a ``Condition``, a ``WHERE`` fragment with every value bound as a
+parameter. Only whitelisted columns and operators reach the SQL, and every
+predicate compares the bare column (no functions, no leading wildcard), so
+it can use the composite indexes of ``manage.py user_indexes``.
+
+    ?first_name=Anna&created_at__gte=2024-01-01&test_bool=ja
+    ?last_name__startswith=Mü&search=ann
+
+A parameter is ``<name>`` (exact) or ``<name>__<lookup>``. Unknown
+parameters are ignored, unknown lookups and invalid values are rejected
+with ``InvalidFilter``.
+"""
+from datetime import datetime, timezone as dt_timezone
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+
+from drf_yasg import openapi
+from rest_framework import serializers
+from rest_framework.fields import empty
+
+OPERATORS = {
+    'exact': '=',
+    'gt': '>',
+    'gte': '>=',
+    'lt': '<',
+    'lte': '<=',
+    'startswith': 'LIKE',
+}
+
+# Escape character of the LIKE patterns, the same in MySQL and SQLite
+LIKE_ESCAPE = '!'
+
+
+class InvalidFilter(ValueError):
+    """Raised for filter parameters with an unknown lookup or an invalid value"""
+
+
+class Condition(NamedTuple):
+    """``sql`` is empty when there is nothing to filter"""
+    sql: str
+    params: List[Any]
+
+
+def where_clause(*conditions: Optional[Condition]) -> Condition:
+    """``WHERE a AND b`` of the non-empty conditions, empty if there are none"""
+    parts = [c for c in conditions if c and c.sql]
+    if not parts:
+        return Condition('', [])
+    return Condition(
+        'WHERE ' + ' AND '.join(c.sql for c in parts),
+        [param for c in parts for param in c.params]
+    )
+
+
+def like_prefix(value: str) -> str:
+    """LIKE pattern matching values starting with ``value`` literally"""
+    for char in (LIKE_ESCAPE, '%', '_'):
+        value = value.replace(char, LIKE_ESCAPE + char)
+    return value + '%'
+
+
+def _comparison(column: str, lookup: str, value) -> Condition:
+    if lookup == 'startswith':
+        return Condition(f"{column} LIKE %s ESCAPE '{LIKE_ESCAPE}'", [like_prefix(value)])
+    return Condition(f"{column} {OPERATORS[lookup]} %s", [value])
+
+
+class Filter:
+    """
+    One filterable attribute: its column, the DRF field parsing the values
+    (the same conversion as the API's input, e.g. ``'ja'`` -> ``True``), the
+    lookups offered and the value applied when the parameter is missing.
+    """
+
+    def __init__(self, column: str, field: serializers.Field, lookups: Sequence[str] = ('exact',),
+                 default: Any = empty, description: str = ''):
+        unknown = set(lookups) - set(OPERATORS)
+        if unknown:
+            raise ValueError(f"Unknown lookups: {', '.join(sorted(unknown))}")
+        self.column = column
+        self.field = field
+        self.lookups = tuple(lookups)
+        self.default = default
+        self.description = description
+        # Prefixes are no complete values, e.g. no valid e-mail address
+        self.prefix_field = serializers.CharField(max_length=getattr(field, 'max_length', None) or 255)
+
+    def bind(self, name: str) -> None:
+        self.field.bind(name, None)
+        self.prefix_field.bind(name, None)
+
+    def parse(self, key: str, lookup: str, raw: str):
+        field = self.prefix_field if lookup == 'startswith' else self.field
+        try:
+            value = field.run_validation(raw)
+        except serializers.ValidationError as e:
+            detail = e.detail[0] if isinstance(e.detail, list) else e.detail
+            raise InvalidFilter(f"{key}: {detail}") from e
+        if isinstance(value, datetime) and value.tzinfo is not None:
+            # Compared with the UTC timestamps the services write
+            value = value.astimezone(dt_timezone.utc)
+        return value
+
+
+class FilterSet:
+    search_param = 'search'
+
+    def __init__(self, filters: Dict[str, Filter], search: Sequence[str] = ()):
+        self.filters = filters
+        self.search = tuple(search)
+        for name, filter_ in filters.items():
+            filter_.bind(name)
+
+    def parse(self, params) -> Condition:
+        """The conjunction of all filters and the search in ``params`` (a QueryDict)"""
+        conditions = []
+        given = set()
+        for key, raw in params.items():
+            name, _, lookup = key.partition('__')
+            filter_ = self.filters.get(name)
+            if filter_ is None:
+                continue
+            lookup = lookup or 'exact'
+            if lookup not in filter_.lookups:
+                raise InvalidFilter(f"Unsupported lookup: {key}")
+            given.add(name)
+            conditions.append(_comparison(filter_.column, lookup, filter_.parse(key, lookup, raw)))
+
+        for name, filter_ in self.filters.items():
+            if name not in given and filter_.default is not empty:
+                conditions.append(_comparison(filter_.column, 'exact', filter_.default))
+
+        term = params.get(self.search_param, '').strip()
+        if term and self.search:
+            if len(term) > 255:
+                raise InvalidFilter(f"{self.search_param}: Ensure this field has no more than 255 characters.")
+            # One prefix range per column, MySQL merges the index ranges
+            pattern = like_prefix(term)
+            conditions.append(Condition(
+                '(' + ' OR '.join(f"{column} LIKE %s ESCAPE '{LIKE_ESCAPE}'" for column in self.search) + ')',
+                [pattern] * len(self.search)
+            ))
+
+        return Condition(' AND '.join(c.sql for c in conditions), [p for c in conditions for p in c.params])
+
+    def openapi_parameters(self) -> List[openapi.Parameter]:
+        """Swagger query parameters of the filters and the search"""
+        parameters = []
+        for name, filter_ in self.filters.items():
+            schema_type, schema_format = _openapi_type(filter_.field)
+            for lookup in filter_.lookups:
+                description = filter_.description or name.replace('_', ' ').capitalize()
+                if lookup == 'startswith':
+                    description += ' starts with'
+                elif lookup != 'exact':
+                    description += f" {OPERATORS[lookup]}"
+                elif filter_.default is not empty:
+                    description += f" (default {str(filter_.default).lower()})"
+                parameters.append(openapi.Parameter(
+                    name if lookup == 'exact' else f'{name}__{lookup}', openapi.IN_QUERY,
+                    description=description,
+                    type=openapi.TYPE_STRING if lookup == 'startswith' else schema_type,
+                    format=None if lookup == 'startswith' else schema_format,
+                ))
+        if self.search:
+            parameters.append(openapi.Parameter(
+                self.search_param, openapi.IN_QUERY,
+                description=f"Prefix search on {', '.join(self.search)}",
+                type=openapi.TYPE_STRING,
+            ))
+        return parameters
+
+
+def _openapi_type(field):
+    if isinstance(field, serializers.BooleanField):
+        return openapi.TYPE_BOOLEAN, None
+    if isinstance(field, serializers.DateTimeField):
+        return openapi.TYPE_STRING, openapi.FORMAT_DATETIME
+    if isinstance(field, serializers.IntegerField):
+        return openapi.TYPE_INTEGER, None
+    return getattr(field, 'swagger_schema_fields', {}).get('type', openapi.TYPE_STRING), None
@@ -0,0 +1,307 @@
+"""
+Offline user import, the engine behind ``manage.py import_users``.
+
+The input (CSV or NDJSON) is streamed and cut into chunks. Worker processes
+validate the chunks with the regular create serializer, so an imported user
+passes exactly the rules of the create endpoint. The main process inserts
+the valid rows with large multi-row INSERTs, one transaction per batch of
+several INSERTs:
+
+* Logins repeated within a batch or already taken are rejected before the
+  INSERT. Should one slip through anyway (a concurrent writer), the batch
+  is retried row by row in savepoints.
+* Rejected records go to an NDJSON reject file with their record number,
+  the input and the errors.
+* After each committed batch the checkpoint file records how many input
+  records are done, and a rerun resumes after them. A crash between the
+  commit and the checkpoint replays at most that one batch, its users then
+  show up as duplicates in the reject file.
+"""
+import csv
+import json
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import IO, Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from django.db import DatabaseError, IntegrityError, connections, transaction
+from rest_framework import status
+
+from .batching import chunked
+from .bulk import validate_items
+from .db.routing import shard_alias
+from .fastjson import dumps, loads
+from .logins import normalize
+
+logger = logging.getLogger(__name__)
+
+FORMAT_CSV = 'csv'
+FORMAT_NDJSON = 'ndjson'
+FORMATS = (FORMAT_CSV, FORMAT_NDJSON)
+
+# File extension -> input format
+_EXTENSIONS = {'.csv': FORMAT_CSV, '.ndjson': FORMAT_NDJSON, '.jsonl': FORMAT_NDJSON}
+
+# (record number, input record, validated row or None, errors or None)
+Validated = Tuple[int, Any, Optional[dict], Optional[dict]]
+
+
+def detect_format(path: str) -> str:
+    """Input format by the file extension, ``ValueError`` if it is not known"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in _EXTENSIONS:
+        raise ValueError(f"Can not tell the format of {path}, one of {', '.join(FORMATS)} is needed")
+    return _EXTENSIONS[extension]
+
+
+def read_records(path: str, input_format: str, skip: int = 0) -> Iterator[Tuple[int, Any]]:
+    """
+    Yield ``(record number, record)`` of the input after the first ``skip``
+    records. NDJSON lines are passed on undecoded, the workers parse them.
+    Empty CSV cells count as missing, like the export writes ``None``.
+    """
+    with open(path, encoding='utf-8', newline='') as source:
+        if input_format == FORMAT_CSV:
+            for number, row in enumerate(csv.DictReader(source), 1):
+                if number > skip:
+                    yield number, {key: value for key, value in row.items() if key is not None and value != ''}
+            return
+        for number, line in enumerate(source, 1):
+            if number > skip and line.strip():
+                yield number, line
+
+
+def _init_worker():
+    # Spawned workers start without Django, for forked ones this is a no-op
+    import django
+
+    django.setup()
+
+
+def _plain(errors):
+    # ErrorDetail and lazy strings as plain JSON values
+    return loads(dumps(errors))
+
+
+def validate_chunk(serializer_class, defaults: Dict[str, Any], records: List[Tuple[int, Any]]) -> List[Validated]:
+    """Validate one chunk of records, runs in a worker process"""
+    results: List[Optional[Validated]] = []
+    items = []
+    for number, record in records:
+        if isinstance(record, str):
+            try:
+                record = loads(record)
+            except ValueError as e:
+                results.append((number, record.rstrip('\n'), None, {'non_field_errors': [f"Malformed JSON: {e}"]}))
+                continue
+        results.append(None)
+        items.append((number, record))
+
+    data = [{**defaults, **record} if isinstance(record, dict) else record for _, record in items]
+    validated, errors = validate_items(serializer_class, data) if data else ([], [])
+    pending = iter(zip(items, validated, errors))
+    for i, result in enumerate(results):
+        if result is None:
+            (number, record), row, row_errors = next(pending)
+            results[i] = (number, record, dict(row) if row is not None else None,
+                          _plain(row_errors) if row_errors else None)
+    return results
+
+
+class Checkpoint:
+    """
+    Progress of an import in a JSON file next to the input, replaced
+    atomically. It belongs to one input file, identified by path and size.
+    """
+
+    def __init__(self, path: str, input_path: str):
+        self.path = path
+        self.source = {'input': os.path.abspath(input_path), 'size': os.path.getsize(input_path)}
+
+    def load(self) -> Dict[str, Any]:
+        """The saved progress, a fresh one if there is none"""
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return {'position': 0, 'created': 0, 'rejected': 0, 'done': False}
+        if state.get('source') != self.source:
+            raise ValueError(f"Checkpoint {self.path} belongs to another input, remove it or restart the import")
+        return state
+
+    def save(self, state: Dict[str, Any]) -> None:
+        temporary = f'{self.path}.tmp'
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump({**state, 'source': self.source}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.path)
+
+    def clear(self) -> None:
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class ImportStats:
+    """Counters of a running import"""
+
+    def __init__(self, created: int = 0, rejected: int = 0):
+        self.read = 0
+        self.created = created
+        self.rejected = rejected
+        self.started = time.monotonic()
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    @property
+    def rate(self) -> float:
+        """Records per second of this run"""
+        return self.read / self.elapsed if self.elapsed else 0.0
+
+
+def _reject(number: int, record: Any, http_status: int, errors) -> Dict[str, Any]:
+    return {'record': number, 'status': http_status, 'errors': errors, 'input': record}
+
+
+class UserImport:
+    """
+    Imports records with ``serializer_class`` (a create serializer),
+    ``insert_rows`` (a service's multi-row insert) and ``existing_logins``
+    (the service's lookup of taken logins). ``defaults`` fill fields the
+    input leaves out.
+
+    ``batch_size`` records make one transaction and checkpoint, inserted
+    ``insert_size`` rows per statement. The workers validate
+    ``chunk_size`` records per task, ``workers=0`` validates in this
+    process.
+    """
+
+    def __init__(self, serializer_class, insert_rows: Callable[[List[dict]], Any],
+                 existing_logins: Callable[[List[str]], Set[str]], defaults: Optional[Dict[str, Any]] = None,
+                 batch_size: int = 5000, insert_size: int = 1000, chunk_size: int = 1000,
+                 workers: Optional[int] = None):
+        self.serializer_class = serializer_class
+        self.insert_rows = insert_rows
+        self.existing_logins = existing_logins
+        self.defaults = defaults or {}
+        self.batch_size = batch_size
+        self.insert_size = insert_size
+        self.chunk_size = chunk_size
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+
+    def _validated(self, records: Iterator[Tuple[int, Any]]) -> Iterator[Validated]:
+        """Validation results in input order, at most two chunks per worker in flight"""
+        chunks = chunked(records, self.chunk_size)
+        if not self.workers:
+            for chunk in chunks:
+                yield from validate_chunk(self.serializer_class, self.defaults, chunk)
+            return
+
+        # Forked workers must not inherit open database connections
+        connections.close_all()
+        pool = ProcessPoolExecutor(self.workers, initializer=_init_worker)
+        try:
+            window = deque()
+            for chunk in chunks:
+                window.append(pool.submit(validate_chunk, self.serializer_class, self.defaults, chunk))
+                if len(window) >= self.workers * 2:
+                    yield from window.popleft().result()
+            while window:
+                yield from window.popleft().result()
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def insert_batch(self, batch: List[Tuple[int, Any, dict]]) -> Tuple[int, List[Dict[str, Any]]]:
+        """Insert the validated rows of ``batch`` in one transaction, returning ``(created, rejects)``"""
+        rejects = []
+        seen = set()
+        unique_rows = []
+        for number, record, row in batch:
+            login = normalize(row['login'])
+            if login in seen:
+                rejects.append(_reject(number, record, status.HTTP_409_CONFLICT,
+                                       {'error': 'Duplicate login in the input'}))
+                continue
+            seen.add(login)
+            unique_rows.append((number, record, row))
+
+        taken = self.existing_logins([row['login'] for _, _, row in unique_rows]) if unique_rows else set()
+        pending = []
+        for number, record, row in unique_rows:
+            if normalize(row['login']) in taken:
+                rejects.append(_reject(number, record, status.HTTP_409_CONFLICT, {'error': 'User already exists'}))
+            else:
+                pending.append((number, record, row))
+        if not pending:
+            return 0, rejects
+
+        with transaction.atomic(using=shard_alias()):
+            try:
+                with transaction.atomic(using=shard_alias()):
+                    for chunk in chunked([row for _, _, row in pending], self.insert_size):
+                        self.insert_rows(chunk)
+                return len(pending), rejects
+            except IntegrityError:
+                pass
+            created = 0
+            for number, record, row in pending:
+                try:
+                    with transaction.atomic(using=shard_alias()):
+                        self.insert_rows([row])
+                    created += 1
+                except IntegrityError as e:
+                    rejects.append(_reject(number, record, status.HTTP_409_CONFLICT, {'error': str(e)}))
+        return created, rejects
+
+    def run(self, records: Iterator[Tuple[int, Any]], checkpoint: Checkpoint, rejects: IO[str],
+            progress: Optional[Callable[[ImportStats], None]] = None) -> ImportStats:
+        """
+        Import ``records`` (as from ``read_records``, after the checkpoint's
+        position), appending rejects as NDJSON lines to ``rejects``.
+        ``progress`` is called after every committed batch.
+        """
+        state = checkpoint.load()
+        stats = ImportStats(state['created'], state['rejected'])
+        batch: List[Tuple[int, Any, dict]] = []
+        failed: List[Dict[str, Any]] = []
+        position = state['position']
+
+        def commit():
+            created, batch_rejects = self.insert_batch(batch) if batch else (0, [])
+            stats.created += created
+            # The rejects are durable before the checkpoint moves past them
+            for reject in sorted(failed + batch_rejects, key=lambda r: r['record']):
+                rejects.write(dumps(reject).decode() + '\n')
+            stats.rejected += len(failed) + len(batch_rejects)
+            rejects.flush()
+            os.fsync(rejects.fileno())
+            state.update(position=position, created=stats.created, rejected=stats.rejected)
+            checkpoint.save(state)
+            batch.clear()
+            failed.clear()
+            if progress:
+                progress(stats)
+
+        try:
+            for number, record, row, errors in self._validated(records):
+                stats.read += 1
+                position = number
+                if errors:
+                    failed.append(_reject(number, record, status.HTTP_400_BAD_REQUEST, errors))
+                else:
+                    batch.append((number, record, row))
+                if len(batch) + len(failed) >= self.batch_size:
+                    commit()
+            commit()
+        except DatabaseError as e:
+            logger.error("Import stopped after record %s: %s", state['position'], str(e))
+            raise
+        state['done'] = True
+        checkpoint.save(state)
+        return stats
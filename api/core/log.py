@@ -0,0 +1,205 @@
+"""
+Logging off the request path.
+
+``install_queue_logging`` (called from ``CoreConfig.ready``) moves the
+handlers of the loggers in ``settings.LOG_QUEUE['LOGGERS']`` behind one
+bounded queue. The request thread only enqueues the record; formatting,
+file writes and mail happen on a background listener thread.
+
+When the queue is full, the ``'drop'`` policy discards the record right
+away. The ``'block'`` policy waits up to ``BLOCK_TIMEOUT`` seconds, then
+drops it. Dropped records are counted per level in ``log_stats()``.
+
+``LazyFileHandler`` creates the log file and its directory on the first
+record, not when the settings are imported.
+
+``ThrottledAdminEmailHandler`` replaces ``AdminEmailHandler``. It sends at
+most one mail per error fingerprint and ``interval``, and at most
+``max_mails`` mails per ``interval`` in total, so an outage does not turn
+into a mail storm.
+"""
+import atexit
+import hashlib
+import logging
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from django.utils.log import AdminEmailHandler
+
+POLICY_DROP = 'drop'
+POLICY_BLOCK = 'block'
+
+
+class BoundedQueueHandler(QueueHandler):
+    """QueueHandler that never waits longer than the policy allows"""
+
+    def __init__(self, log_queue: queue.Queue, policy: str = POLICY_DROP, block_timeout: float = 0.05):
+        super().__init__(log_queue)
+        if policy not in (POLICY_DROP, POLICY_BLOCK):
+            raise ValueError(f"Unknown log queue policy: {policy}")
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.enqueued = 0
+        self.dropped: Counter = Counter()
+
+    def prepare(self, record):
+        # Hand over the record unformatted, message and traceback are
+        # rendered by the handlers on the listener thread
+        return record
+
+    def enqueue(self, record):
+        try:
+            if self.policy == POLICY_BLOCK:
+                self.queue.put(record, timeout=self.block_timeout)
+            else:
+                self.queue.put_nowait(record)
+            self.enqueued += 1
+        except queue.Full:
+            self.dropped[record.levelname] += 1
+
+
+class LazyFileHandler(logging.FileHandler):
+    """FileHandler opening the file, and creating its directory, on the first record"""
+
+    def __init__(self, filename, mode='a', encoding=None, errors=None):
+        super().__init__(filename, mode, encoding, delay=True, errors=errors)
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super()._open()
+
+
+class ThrottledAdminEmailHandler(AdminEmailHandler):
+    """
+    AdminEmailHandler deduplicating by fingerprint (logger, level, message
+    template, exception type) and rate limiting the mails of this process.
+    The next mail of a fingerprint reports how many were suppressed.
+    """
+
+    def __init__(self, interval: float = 300, max_mails: int = 10, **kwargs):
+        super().__init__(**kwargs)
+        self.interval = interval
+        self.max_mails = max_mails
+        self._last_sent: Dict[str, float] = {}
+        self._suppressed: Counter = Counter()
+        self._window_start = float('-inf')
+        self._window_count = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def fingerprint(record) -> str:
+        exc_type = record.exc_info[0].__name__ if record.exc_info and record.exc_info[0] else ''
+        raw = f"{record.name}|{record.levelno}|{record.msg}|{exc_type}"
+        return hashlib.sha1(raw.encode(errors='replace')).hexdigest()
+
+    def emit(self, record):
+        key = self.fingerprint(record)
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_sent.get(key, float('-inf')) < self.interval:
+                self._suppressed[key] += 1
+                return
+            if now - self._window_start >= self.interval:
+                self._window_start, self._window_count = now, 0
+            if self._window_count >= self.max_mails:
+                self._suppressed[key] += 1
+                return
+            self._window_count += 1
+            self._last_sent[key] = now
+            suppressed = self._suppressed.pop(key, 0)
+            # Forget fingerprints that have been quiet for a while
+            if len(self._last_sent) > 1000:
+                self._last_sent = {k: t for k, t in self._last_sent.items() if now - t < self.interval}
+
+        if suppressed:
+            # A copy, the other handlers of the listener get the same record
+            record = logging.makeLogRecord(record.__dict__)
+            record.msg = f"{record.msg}\n\n({suppressed} similar messages suppressed)"
+        super().emit(record)
+
+
+class _Pipeline:
+    def __init__(self, logger_names: List[str], max_size: int, policy: str, block_timeout: float):
+        self.logger_names = logger_names
+        self.max_size = max_size
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.handlers: List[logging.Handler] = []
+        self.queue_handler: Optional[BoundedQueueHandler] = None
+        self.listener: Optional[QueueListener] = None
+
+    def install(self):
+        loggers = [logging.getLogger(name) for name in self.logger_names]
+        for logger in loggers:
+            for handler in logger.handlers:
+                if handler not in self.handlers:
+                    self.handlers.append(handler)
+        if not self.handlers:
+            return
+        self.start()
+        for logger in loggers:
+            logger.handlers = [self.queue_handler]
+
+    def start(self):
+        log_queue = queue.Queue(maxsize=self.max_size)
+        self.queue_handler = BoundedQueueHandler(log_queue, self.policy, self.block_timeout)
+        self.listener = QueueListener(log_queue, *self.handlers, respect_handler_level=True)
+        self.listener.start()
+
+    def restart_in_child(self):
+        # Threads do not survive fork, a preloaded master's listener is gone
+        if self.listener is None:
+            return
+        old = self.queue_handler
+        self.start()
+        for name in self.logger_names:
+            logger = logging.getLogger(name)
+            logger.handlers = [self.queue_handler if h is old else h for h in logger.handlers]
+
+    def stop(self):
+        if self.listener is not None:
+            # Drains the queue before returning
+            self.listener.stop()
+            self.listener = None
+
+    def stats(self) -> Dict[str, Any]:
+        handler = self.queue_handler
+        if handler is None:
+            return {'queued': 0, 'enqueued': 0, 'dropped': {}}
+        return {
+            'queued': handler.queue.qsize(),
+            'enqueued': handler.enqueued,
+            'dropped': dict(handler.dropped),
+        }
+
+
+_pipeline: Optional[_Pipeline] = None
+
+
+def install_queue_logging() -> None:
+    """Move the handlers of the configured loggers onto the listener thread, once per process"""
+    global _pipeline
+    options = getattr(settings, 'LOG_QUEUE', None)
+    if _pipeline is not None or not options or not options.get('LOGGERS'):
+        return
+    _pipeline = _Pipeline(
+        options['LOGGERS'],
+        options.get('MAX_SIZE', 10000),
+        options.get('POLICY', POLICY_DROP),
+        options.get('BLOCK_TIMEOUT', 0.05),
+    )
+    _pipeline.install()
+    atexit.register(_pipeline.stop)
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=_pipeline.restart_in_child)
+
+
+def log_stats() -> Dict[str, Any]:
+    """Queue depth, enqueued and dropped (per level) records of this process"""
+    return _pipeline.stats() if _pipeline is not None else {'queued': 0, 'enqueued': 0, 'dropped': {}}
@@ -0,0 +1,223 @@
+"""
+Duplicate login detection for user creation.
+
+The unique index on ``user.login`` stays the source of truth: a concurrent
+duplicate insert fails with an IntegrityError, which the services raise as
+``DuplicateLogin`` (409). In front of it every worker keeps a Bloom filter
+of the existing logins. A login the filter has never seen is definitely new
+and goes straight to the INSERT. Only possible duplicates pay for the
+index lookup before it.
+
+The filter is built from the table on a background thread on first use
+and rebuilt every ``REBUILD_INTERVAL`` seconds. The rebuild drops deleted
+logins and picks up the inserts of other workers. Until the first build is
+done every login counts as possibly taken. Logins are compared lower-cased,
+like the case-insensitive collation of the column does.
+
+Every shard has its own table and so its own filter, ``login_filter``
+answers for the current shard (``api.core.db.routing``).
+"""
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from django.db import connections
+
+from .bloom import BloomFilter
+from .db.routing import reader, shard_alias, use_shard
+from .streaming import stream_rows
+
+logger = logging.getLogger(__name__)
+
+# MySQL ER_DUP_ENTRY
+MYSQL_DUPLICATE_ENTRY = 1062
+
+# Seconds before a failed build is retried
+RETRY_INTERVAL = 60
+
+
+class DuplicateLogin(Exception):
+    """Raised for a login that another user already has"""
+
+    def __init__(self, login: Optional[str] = None):
+        super().__init__('User already exists')
+        self.login = login
+
+
+def is_duplicate_key(error: Exception) -> bool:
+    """Whether an IntegrityError is a unique key violation, on the user table one of the login"""
+    args = getattr(error, 'args', ())
+    if args and args[0] == MYSQL_DUPLICATE_ENTRY:
+        return True
+    return 'UNIQUE constraint failed' in str(error)
+
+
+def normalize(login: str) -> str:
+    return login.strip().lower()
+
+
+class LoginFilter:
+    def __init__(self, capacity: int = 1000000, error_rate: float = 0.01, rebuild_interval: float = 3600,
+                 enabled: bool = True, shard: str = 'default'):
+        self.shard = shard
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.rebuild_interval = rebuild_interval
+        self.enabled = enabled
+        self._bloom: Optional[BloomFilter] = None
+        # Logins added while a rebuild runs, replayed onto the new filter
+        self._pending: Optional[List[str]] = None
+        self._lock = threading.Lock()
+        self._building = False
+        self._built_at = float('-inf')
+        self.definitely_new = 0
+        self.possible = 0
+        self.rebuilds = 0
+
+    def might_exist(self, login: str) -> bool:
+        """``False`` only for logins that are certainly not in the table"""
+        if not self.enabled:
+            return True
+        self._maybe_rebuild()
+        bloom = self._bloom
+        if bloom is None or normalize(login) in bloom:
+            self.possible += 1
+            return True
+        self.definitely_new += 1
+        return False
+
+    def add(self, *logins: str) -> None:
+        """Record logins this worker just wrote"""
+        if not self.enabled:
+            return
+        keys = [normalize(login) for login in logins]
+        with self._lock:
+            if self._bloom is not None:
+                self._bloom.update(keys)
+            if self._pending is not None:
+                self._pending.extend(keys)
+
+    def _maybe_rebuild(self) -> None:
+        if self._building or time.monotonic() - self._built_at < self.rebuild_interval:
+            return
+        with self._lock:
+            if self._building:
+                return
+            self._building = True
+            self._pending = []
+        threading.Thread(target=self._rebuild, name='login-filter', daemon=True).start()
+
+    def _rebuild(self) -> None:
+        started = time.monotonic()
+        try:
+            # A new thread starts in an empty context, route to the filter's shard explicitly
+            with use_shard(self.shard):
+                bloom = self.build()
+        except Exception as e:
+            logger.error("Building the login filter failed: %s", str(e), exc_info=True)
+            with self._lock:
+                self._pending = None
+                self._building = False
+                self._built_at = started - max(0.0, self.rebuild_interval - RETRY_INTERVAL)
+            return
+        finally:
+            # This thread's connections, back to the pool
+            connections.close_all()
+
+        with self._lock:
+            bloom.update(self._pending)
+            self._bloom = bloom
+            self._pending = None
+            self._building = False
+            self._built_at = started
+            self.rebuilds += 1
+        logger.info("Login filter of %s built with %s logins in %.1fs", self.shard, len(bloom),
+                    time.monotonic() - started)
+
+    def build(self) -> BloomFilter:
+        """A filter of all logins in the table, inactive users included (the index covers them too)"""
+        connection = reader()
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM user")
+            count = cursor.fetchone()[0]
+        # Room to grow until the next rebuild
+        bloom = BloomFilter(max(self.capacity, 2 * count), self.error_rate)
+        for (login,) in stream_rows(connection, "SELECT login FROM user", chunk_size=10000):
+            bloom.add(normalize(login))
+        return bloom
+
+    def after_fork(self) -> None:
+        # A rebuild thread of the parent does not exist in the child
+        self._lock = threading.Lock()
+        if self._building:
+            self._building = False
+            self._pending = None
+            self._built_at = float('-inf')
+
+    def stats(self) -> Dict[str, Any]:
+        bloom = self._bloom
+        return {
+            'enabled': self.enabled,
+            'ready': bloom is not None,
+            'size': len(bloom) if bloom is not None else 0,
+            'definitely_new': self.definitely_new,
+            'possible': self.possible,
+            'rebuilds': self.rebuilds,
+        }
+
+
+class ShardedLoginFilter:
+    """One ``LoginFilter`` per shard, created on first use, answering for the current shard"""
+
+    def __init__(self, **options):
+        self.options = options
+        self._filters: Dict[str, LoginFilter] = {}
+        self._lock = threading.Lock()
+
+    def for_shard(self, shard: str) -> LoginFilter:
+        login_filter = self._filters.get(shard)
+        if login_filter is None:
+            with self._lock:
+                login_filter = self._filters.setdefault(shard, LoginFilter(shard=shard, **self.options))
+        return login_filter
+
+    def might_exist(self, login: str) -> bool:
+        return self.for_shard(shard_alias()).might_exist(login)
+
+    def add(self, *logins: str) -> None:
+        self.for_shard(shard_alias()).add(*logins)
+
+    def after_fork(self) -> None:
+        self._lock = threading.Lock()
+        for login_filter in list(self._filters.values()):
+            login_filter.after_fork()
+
+    def stats(self) -> Dict[str, Any]:
+        """The counters summed over the shards"""
+        shards = [login_filter.stats() for login_filter in list(self._filters.values())]
+        return {
+            'enabled': self.options.get('enabled', True),
+            'ready': bool(shards) and all(stats['ready'] for stats in shards),
+            'size': sum(stats['size'] for stats in shards),
+            'definitely_new': sum(stats['definitely_new'] for stats in shards),
+            'possible': sum(stats['possible'] for stats in shards),
+            'rebuilds': sum(stats['rebuilds'] for stats in shards),
+        }
+
+
+def _build_login_filter() -> ShardedLoginFilter:
+    options = getattr(settings, 'USER_LOGIN_FILTER', {})
+    return ShardedLoginFilter(
+        capacity=options.get('CAPACITY', 1000000),
+        error_rate=options.get('ERROR_RATE', 0.01),
+        rebuild_interval=options.get('REBUILD_INTERVAL', 3600),
+        enabled=options.get('ENABLED', True),
+    )
+
+
+login_filter = _build_login_filter()
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=login_filter.after_fork)
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.urls import schema
+
+
+class Command(BaseCommand):
+    help = "Generate the OpenAPI schema served by /swagger.json, /swagger/ and /redoc/ (API_SCHEMA['MODE'] 'prebuilt')"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', default=None,
+                            help="Directory to write to, defaults to settings.API_SCHEMA['DIR']")
+        parser.add_argument('--check', action='store_true',
+                            help="Only verify that the files are up to date, fail if not")
+
+    def handle(self, *args, **options):
+        directory = options['output'] or schema.directory
+        if options['check']:
+            if not schema.is_current(directory):
+                raise CommandError(f"The schema in {directory} is missing or stale, run manage.py build_schema")
+            self.stdout.write(self.style.SUCCESS(f"The schema in {directory} is up to date"))
+            return
+
+        for path in schema.write(directory):
+            self.stdout.write(f"wrote    {path}")
+        self.stdout.write(self.style.SUCCESS(f"Schema written to {directory}"))
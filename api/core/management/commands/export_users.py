@@ -0,0 +1,56 @@
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.core.streaming import export_chunks
+from api.mandant.context import InvalidMandant, activate, get_mandant
+
+
+class Command(BaseCommand):
+    help = "Stream all active users as NDJSON or CSV with constant memory"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--api', choices=['v1', 'v2'], default='v1',
+                            help="Schema to export, matching the /user/ or /user/v2/ JSON API")
+        parser.add_argument('--mandant', default=None, help="Mandant to export, from its shard")
+        parser.add_argument('--format', choices=['ndjson', 'csv'], default='ndjson', dest='export_format')
+        parser.add_argument('--output', '-o', default='-', help="Output file, '-' for stdout")
+        parser.add_argument('--chunk-size', type=int, default=settings.USER_EXPORT_CHUNK_SIZE,
+                            help="Rows fetched per round trip from the server-side cursor")
+
+    def handle(self, *args, **options):
+        try:
+            mandant = get_mandant(options['mandant']) if options['mandant'] else None
+        except InvalidMandant as e:
+            raise CommandError(str(e))
+        with activate(mandant):
+            self.export(options)
+
+    def export(self, options):
+        if options['api'] == 'v2':
+            from api.user_v2.exports import export_fieldnames, iter_export_records
+        else:
+            from api.user.exports import export_fieldnames, iter_export_records
+
+        exported = 0
+
+        def counted(records):
+            nonlocal exported
+            for record in records:
+                exported += 1
+                yield record
+
+        records = counted(iter_export_records(options['chunk_size']))
+        chunks = export_chunks(options['export_format'], records, export_fieldnames())
+
+        if options['output'] == '-':
+            for chunk in chunks:
+                sys.stdout.write(chunk)
+            sys.stdout.flush()
+            return
+
+        with open(options['output'], 'w', encoding='utf-8', newline='') as out:
+            for chunk in chunks:
+                out.write(chunk)
+        self.stderr.write(f"Exported {exported} users to {options['output']}")
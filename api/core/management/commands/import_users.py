@@ -0,0 +1,98 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.core.imports import FORMATS, Checkpoint, UserImport, detect_format, read_records
+from api.mandant.context import activate, get_mandant
+
+
+class Command(BaseCommand):
+    help = ("Import users from a CSV or NDJSON file: validated in parallel by the API's create rules, "
+            "inserted in batches, resumable from a checkpoint")
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help="CSV (with a header row) or NDJSON file")
+        parser.add_argument('--api', choices=['v1', 'v2'], default='v1',
+                            help="Schema of the records, matching POST /user/ or /user/v2/")
+        parser.add_argument('--mandant', default=None, help="Mandant to import into, on its shard")
+        parser.add_argument('--format', choices=FORMATS, default=None, dest='input_format',
+                            help="Input format, by default from the file extension")
+        parser.add_argument('--workers', type=int, default=None,
+                            help="Validating processes, the CPU count by default, 0 to validate in this process")
+        parser.add_argument('--batch-size', type=int, default=settings.USER_IMPORT_BATCH_SIZE,
+                            help="Records per transaction and checkpoint")
+        parser.add_argument('--insert-size', type=int, default=settings.USER_IMPORT_INSERT_SIZE,
+                            help="Rows per multi-row INSERT")
+        parser.add_argument('--chunk-size', type=int, default=settings.USER_IMPORT_CHUNK_SIZE,
+                            help="Records per validation task")
+        parser.add_argument('--checkpoint', default=None, help="Checkpoint file, <input>.checkpoint by default")
+        parser.add_argument('--rejects', default=None,
+                            help="NDJSON file of the rejected records, <input>.rejects.ndjson by default")
+        parser.add_argument('--restart', action='store_true',
+                            help="Ignore an existing checkpoint and start over, truncating the reject file")
+        parser.add_argument('--created-from', default='import',
+                            help="created_from of v2 records that do not have one")
+        parser.add_argument('--progress', type=float, default=5.0, help="Seconds between progress lines")
+
+    def _importer(self, options) -> UserImport:
+        if options['api'] == 'v2':
+            from api.user_v2.serializers import UserV2Serializer as serializer_class
+            from api.user_v2.services import UserV2Service as service
+            defaults = {'created_from': options['created_from']}
+        else:
+            from api.user.serializers import UserCreateSerializer as serializer_class
+            from api.user.services import UserService as service
+            defaults = {}
+        return UserImport(
+            serializer_class, service.create_users, service.existing_logins, defaults,
+            batch_size=options['batch_size'], insert_size=options['insert_size'],
+            chunk_size=options['chunk_size'], workers=options['workers']
+        )
+
+    def handle(self, *args, **options):
+        path = options['input']
+        for name in ('batch_size', 'insert_size', 'chunk_size'):
+            if options[name] < 1:
+                raise CommandError(f"--{name.replace('_', '-')} must be at least 1")
+        if options['workers'] is not None and options['workers'] < 0:
+            raise CommandError("--workers can not be negative")
+        try:
+            input_format = options['input_format'] or detect_format(path)
+            checkpoint = Checkpoint(options['checkpoint'] or f'{path}.checkpoint', path)
+            mandant = get_mandant(options['mandant']) if options['mandant'] else None
+        except (ValueError, OSError) as e:
+            raise CommandError(str(e))
+
+        if options['restart']:
+            checkpoint.clear()
+        try:
+            state = checkpoint.load()
+        except ValueError as e:
+            raise CommandError(str(e))
+        if state['done']:
+            self.stderr.write(f"{path} was imported already: {state['created']} created, "
+                              f"{state['rejected']} rejected (--restart to import it again)")
+            return
+        if state['position']:
+            self.stderr.write(f"Resuming after record {state['position']}")
+
+        last_report = time.monotonic()
+
+        def progress(stats):
+            nonlocal last_report
+            if time.monotonic() - last_report >= options['progress']:
+                last_report = time.monotonic()
+                self.stderr.write(f"{stats.read} records, {stats.created} created, {stats.rejected} rejected, "
+                                  f"{stats.rate:.0f} records/s")
+
+        rejects_path = options['rejects'] or f'{path}.rejects.ndjson'
+        records = read_records(path, input_format, skip=state['position'])
+        with open(rejects_path, 'a' if state['position'] else 'w', encoding='utf-8') as rejects, activate(mandant):
+            stats = self._importer(options).run(records, checkpoint, rejects, progress)
+
+        self.stderr.write(
+            f"Imported {path}: {stats.created} created, {stats.rejected} rejected"
+            f"{f' (see {rejects_path})' if stats.rejected else ''}. "
+            f"{stats.read} records in {stats.elapsed:.1f} s, {stats.rate:.0f} records/s"
+        )
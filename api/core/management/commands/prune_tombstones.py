@@ -0,0 +1,39 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from api.mandant.context import InvalidMandant, activate, get_mandant
+
+
+class Command(BaseCommand):
+    help = ("Drop the tombstones of the v2 change feed older than the retention, "
+            "watermarks before it are answered with 410")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.USER_CHANGES_RETENTION_DAYS,
+                            help="Keep the tombstones of this many days, USER_CHANGES_RETENTION_DAYS by default")
+        parser.add_argument('--mandant', default=None, help="Mandant whose shard to prune")
+        parser.add_argument('--chunk-size', type=int, default=10000, help="Tombstones per DELETE")
+
+    def handle(self, *args, **options):
+        from api.user_v2.services import UserV2Service
+
+        if options['days'] < 1:
+            raise CommandError("--days must be at least 1, USER_CHANGES_RETENTION_DAYS=0 keeps tombstones forever")
+        if options['days'] < settings.USER_CHANGES_RETENTION_DAYS:
+            # The feed would accept watermarks whose deletions are gone
+            raise CommandError(f"--days can not be below USER_CHANGES_RETENTION_DAYS "
+                               f"({settings.USER_CHANGES_RETENTION_DAYS})")
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size must be at least 1")
+        try:
+            mandant = get_mandant(options['mandant']) if options['mandant'] else None
+        except InvalidMandant as e:
+            raise CommandError(str(e))
+
+        before = timezone.now() - timedelta(days=options['days'])
+        with activate(mandant):
+            pruned = UserV2Service.prune_tombstones(before, options['chunk_size'])
+        self.stderr.write(f"Pruned {pruned} tombstones deleted before {before.isoformat()}")
@@ -0,0 +1,119 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Runs in a fresh interpreter, the phases of a worker boot up to the first request
+BOOT = r'''
+import json, os, time
+started = time.perf_counter()
+phases = []
+
+def phase(name):
+    global started
+    now = time.perf_counter()
+    phases.append((name, now - started))
+    started = now
+
+import django
+from django.conf import settings
+settings.INSTALLED_APPS
+phase('settings')
+django.setup(set_prefix=False)
+phase('apps ready')
+from django.urls import get_resolver
+get_resolver().url_patterns
+phase('urlconf')
+if getattr(settings, 'SERVER_MODE', 'wsgi') == 'asgi':
+    from django.core.handlers.asgi import ASGIHandler as Handler
+else:
+    from django.core.handlers.wsgi import WSGIHandler as Handler
+Handler()
+phase('handler')
+print(json.dumps(phases))
+'''
+
+
+def _parse_importtime(stderr: str):
+    """(module, self seconds, cumulative seconds, depth) of ``python -X importtime`` output"""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        if not own.strip().isdigit():
+            continue  # the header
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        modules.append((name.strip(), int(own) / 1e6, int(cumulative) / 1e6, depth))
+    return modules
+
+
+class Command(BaseCommand):
+    help = "Measure the cold start of a worker: time per boot phase and the slowest imports"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5,
+                            help="Fresh interpreters to time, the median of each phase is reported")
+        parser.add_argument('--top', type=int, default=20, help="Slowest modules and packages to list")
+        parser.add_argument('--budget', type=float, default=None,
+                            help="Fail if the median boot takes longer, in milliseconds")
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+
+    def _boot(self, *flags):
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [str(settings.BASE_DIR), env.get('PYTHONPATH')]))
+        result = subprocess.run([sys.executable, *flags, '-c', BOOT], capture_output=True, text=True,
+                                env=env, cwd=str(settings.BASE_DIR))
+        if result.returncode:
+            raise CommandError(f"Worker boot failed:\n{result.stderr}")
+        return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+    def handle(self, *args, **options):
+        if options['runs'] < 1:
+            raise CommandError("--runs must be at least 1")
+
+        timings = defaultdict(list)
+        for _ in range(options['runs']):
+            phases, _ = self._boot()
+            for name, seconds in phases:
+                timings[name].append(seconds)
+        phases = {name: statistics.median(values) for name, values in timings.items()}
+        total = sum(phases.values())
+
+        # One more boot for the import breakdown, -X importtime slows it down itself
+        _, stderr = self._boot('-X', 'importtime')
+        modules = _parse_importtime(stderr)
+        packages = defaultdict(float)
+        for name, own, _, _ in modules:
+            packages[name.partition('.')[0]] += own
+        slowest = sorted(modules, key=lambda m: m[2], reverse=True)[:options['top']]
+        heaviest = sorted(packages.items(), key=lambda p: p[1], reverse=True)[:options['top']]
+
+        if options['json']:
+            self.stdout.write(json.dumps({
+                'phases_ms': {name: round(seconds * 1000, 1) for name, seconds in phases.items()},
+                'total_ms': round(total * 1000, 1),
+                'modules': [{'module': name, 'self_ms': round(own * 1000, 2), 'cumulative_ms': round(cum * 1000, 2)}
+                            for name, own, cum, _ in slowest],
+                'packages_ms': {name: round(own * 1000, 2) for name, own in heaviest},
+            }, indent=2))
+        else:
+            self.stdout.write(f"Boot phases (median of {options['runs']} runs)")
+            for name, seconds in phases.items():
+                self.stdout.write(f"  {name:<12} {seconds * 1000:8.1f} ms")
+            self.stdout.write(f"  {'total':<12} {total * 1000:8.1f} ms")
+            self.stdout.write("\nSlowest imports (cumulative ms, self ms)")
+            for name, own, cumulative, depth in slowest:
+                self.stdout.write(f"  {cumulative * 1000:8.1f} {own * 1000:8.1f}  {'  ' * depth}{name}")
+            self.stdout.write("\nImport time per package (self ms)")
+            for name, own in heaviest:
+                self.stdout.write(f"  {own * 1000:8.1f}  {name}")
+
+        budget = options['budget']
+        if budget is not None and total * 1000 > budget:
+            raise CommandError(f"Cold start {total * 1000:.1f} ms exceeds the budget of {budget:.0f} ms")
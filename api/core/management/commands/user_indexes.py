@@ -0,0 +1,81 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from api.core.db.indexes import (
+    LOGIN_UNIQUE_INDEX, USER_TABLE, check_indexes, create_index_sql, create_unique_login_sql, has_unique_login
+)
+from api.core.db.tombstones import TOMBSTONE_TABLE, create_table_sql, table_exists
+
+
+class Command(BaseCommand):
+    help = ("Verify (and with --create, add) the unique key on login, the composite indexes of the "
+            "filtered user lists and the tombstone table of the change feed")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--create', action='store_true', help="Create the missing indexes")
+        parser.add_argument('--sql', action='store_true',
+                            help="Only print the statements that would create the missing indexes")
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS,
+                            help="Database alias, replicas get the indexes through replication")
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        unique_missing = not has_unique_login(connection)
+        table_missing = not table_exists(connection)
+        statuses = check_indexes(connection)
+        missing = [status for status in statuses if not status.covered_by]
+
+        self.stdout.write(f"{'missing ' if unique_missing else 'ok      '} UNIQUE (login)"
+                          f"{', required: duplicate logins are only rejected by it' if unique_missing else ''}")
+        self.stdout.write(f"{'missing ' if table_missing else 'ok      '} {TOMBSTONE_TABLE} (table)")
+
+        for status in statuses:
+            columns = ', '.join(status.columns)
+            if status.covered_by == status.name:
+                self.stdout.write(f"ok       {status.name} ({columns})")
+            elif status.covered_by:
+                self.stdout.write(f"ok       {status.name} ({columns}) served by {status.covered_by}")
+            else:
+                note = ", the name is taken by an index on other columns" if status.conflict else ''
+                self.stdout.write(f"missing  {status.name} ({columns}){note}")
+
+        if not missing and not table_missing and not unique_missing:
+            self.stdout.write(self.style.SUCCESS(f"All {len(statuses)} indexes on {USER_TABLE} are in place"))
+            return
+
+        conflicts = [status.name for status in missing if status.conflict]
+        if conflicts:
+            raise CommandError(f"Index names in use with other columns: {', '.join(conflicts)}")
+
+        unique_statements = [create_unique_login_sql(connection.vendor)] if unique_missing else []
+        table_statements = create_table_sql(connection.vendor) if table_missing else []
+        statements = [create_index_sql(connection.vendor, s.name, s.columns) for s in missing]
+        if options['sql']:
+            for statement in unique_statements + table_statements + statements:
+                self.stdout.write(' '.join(statement.split()) + ';')
+            return
+        if not options['create']:
+            what = (["the unique key on login"] if unique_missing else []) + \
+                ([f"{len(missing)} indexes"] if missing else []) + ([f"table {TOMBSTONE_TABLE}"] if table_missing else [])
+            raise CommandError(f"{' and '.join(what)} missing, run with --create (or --sql)")
+
+        with connection.cursor() as cursor:
+            if unique_missing:
+                # Fails if the table already holds duplicate logins, those have to be merged first
+                self.stdout.write(f"creating {LOGIN_UNIQUE_INDEX} ...")
+                cursor.execute(unique_statements[0])
+            if table_missing:
+                self.stdout.write(f"creating {TOMBSTONE_TABLE} ...")
+                for statement in table_statements:
+                    cursor.execute(statement)
+            for status, statement in zip(missing, statements):
+                self.stdout.write(f"creating {status.name} ...")
+                cursor.execute(statement)
+
+        still_missing = [status.name for status in check_indexes(connection) if not status.covered_by]
+        if not has_unique_login(connection):
+            still_missing.append(LOGIN_UNIQUE_INDEX)
+        if still_missing:
+            raise CommandError(f"Indexes still missing after creation: {', '.join(still_missing)}")
+        self.stdout.write(self.style.SUCCESS(f"Created {len(missing)} indexes on {USER_TABLE}"
+                                             f"{f' and table {TOMBSTONE_TABLE}' if table_missing else ''}"))
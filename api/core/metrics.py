@@ -0,0 +1,397 @@
+"""
+Request and service metrics in the Prometheus text format.
+
+Every process keeps its counters and histograms in memory and a background
+thread dumps them to ``<METRICS_DIR>/metrics-<pid>.json`` every
+``METRICS_FLUSH_INTERVAL`` seconds. ``/metrics`` merges the files of all
+workers. Counters and histograms of exited workers keep counting in the
+totals, like in Prometheus' own multiprocess mode. Gauges only come from
+live processes. Empty the directory when the service (re)starts.
+
+Recorded are:
+
+* per route and method: latency histogram, requests by status, SQL queries,
+  DB time and serializer time (``MetricsMiddleware``)
+* per service method: latency histogram and errors (``instrument_service``)
+* the user caches, the login filter, DB connection pools and the logging queue
+* the batches of the write coalescers (``api.core.coalescer``)
+"""
+import functools
+import glob
+import inspect
+import json
+import os
+import tempfile
+import threading
+import time
+from contextvars import ContextVar
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Histograms of something else than seconds
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+WAIT_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1)
+HISTOGRAM_BUCKETS = {
+    'write_batch_size': SIZE_BUCKETS,
+    'write_batch_wait_seconds': WAIT_BUCKETS,
+}
+
+# name -> (type, help)
+METRICS = {
+    'http_request_duration_seconds': ('histogram', 'Request latency by route and method'),
+    'http_requests_total': ('counter', 'Requests by route, method and status'),
+    'http_request_db_queries_total': ('counter', 'SQL queries run by requests'),
+    'http_request_db_seconds_total': ('counter', 'Time requests spent in SQL queries'),
+    'http_request_serializer_seconds_total': ('counter', 'Time requests spent in serializers'),
+    'service_call_duration_seconds': ('histogram', 'Service method latency'),
+    'service_call_errors_total': ('counter', 'Service method calls that raised'),
+    'user_cache_events_total': ('counter', 'User cache hits, misses, evictions and invalidations'),
+    'user_cache_entries': ('gauge', 'Entries in the per-process user cache'),
+    'user_login_filter_checks_total': ('counter', 'Login duplicate checks by Bloom filter answer'),
+    'user_login_filter_entries': ('gauge', 'Logins in the per-process Bloom filter'),
+    'db_pool_events_total': ('counter', 'Connection pool events'),
+    'db_pool_wait_seconds_total': ('counter', 'Time spent waiting for a pooled connection'),
+    'db_pool_connections': ('gauge', 'Pooled connections by state'),
+    'log_queue_records_total': ('counter', 'Log records enqueued or dropped'),
+    'log_queue_depth': ('gauge', 'Log records waiting for the listener'),
+    'write_batch_size': ('histogram', 'Writes per group commit batch'),
+    'write_batch_wait_seconds': ('histogram', 'Time the leader of a batch waited for more writes'),
+    'write_batch_items_total': ('counter', 'Coalesced writes by outcome'),
+}
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _buckets(name: str) -> Tuple[float, ...]:
+    return HISTOGRAM_BUCKETS.get(name, BUCKETS)
+
+
+class Registry:
+    """The metrics of this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[Tuple[str, LabelKey], float] = {}
+        # (name, labels) -> [bucket counts..., sum, count]
+        self.histograms: Dict[Tuple[str, LabelKey], List[float]] = {}
+
+    def inc(self, name: str, labels: Dict[str, Any], amount: float = 1.0) -> None:
+        key = (name, _key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0.0) + amount
+
+    def observe(self, name: str, labels: Dict[str, Any], value: float) -> None:
+        key = (name, _key(labels))
+        with self._lock:
+            buckets = _buckets(name)
+            series = self.histograms.get(key)
+            if series is None:
+                series = self.histograms[key] = [0.0] * (len(buckets) + 2)
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = [[name, dict(labels), value] for (name, labels), value in self.counters.items()]
+            histograms = [[name, dict(labels), list(series)] for (name, labels), series in self.histograms.items()]
+        counters.extend(_collected_counters())
+        return {'pid': os.getpid(), 'counters': counters, 'histograms': histograms, 'gauges': _collected_gauges()}
+
+
+registry = Registry()
+
+
+def _collected_counters() -> List[list]:
+    """Counters the caches, pools and logging queue keep themselves"""
+    from .cache import cache_stats
+    from .db.pool import pool_stats
+    from .log import log_stats
+    from .logins import login_filter
+
+    rows = []
+    for stats in cache_stats():
+        for event in ('hits', 'negative_hits', 'shared_hits', 'misses', 'evictions', 'invalidations'):
+            rows.append(['user_cache_events_total', {'cache': stats['namespace'], 'event': event}, stats[event]])
+    logins = login_filter.stats()
+    for answer in ('definitely_new', 'possible'):
+        rows.append(['user_login_filter_checks_total', {'answer': answer}, logins[answer]])
+    for stats in pool_stats():
+        for event in ('created', 'closed', 'checkouts', 'waits', 'timeouts', 'ping_failures'):
+            rows.append(['db_pool_events_total', {'pool': stats['name'], 'event': event}, stats[event]])
+        rows.append(['db_pool_wait_seconds_total', {'pool': stats['name']}, stats['wait_time']])
+    logs = log_stats()
+    rows.append(['log_queue_records_total', {'outcome': 'enqueued', 'level': ''}, logs['enqueued']])
+    for level, count in logs['dropped'].items():
+        rows.append(['log_queue_records_total', {'outcome': 'dropped', 'level': level}, count])
+    return rows
+
+
+def _collected_gauges() -> List[list]:
+    from .cache import cache_stats
+    from .db.pool import pool_stats
+    from .log import log_stats
+    from .logins import login_filter
+
+    rows = [['user_cache_entries', {'cache': stats['namespace']}, stats['size']] for stats in cache_stats()]
+    rows.append(['user_login_filter_entries', {}, login_filter.stats()['size']])
+    for stats in pool_stats():
+        for state in ('in_use', 'idle'):
+            rows.append(['db_pool_connections', {'pool': stats['name'], 'state': state}, stats[state]])
+    rows.append(['log_queue_depth', {}, log_stats()['queued']])
+    return rows
+
+
+class RequestTimings:
+    __slots__ = ('queries', 'db_time', 'serializer_time')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+
+
+# Shared by reference with executor threads running under a copied context
+current_timings: ContextVar[Optional[RequestTimings]] = ContextVar('request_timings', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    """Execute wrapper counting queries and DB time of the current request"""
+    timings = current_timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.queries += 1
+        timings.db_time += time.perf_counter() - start
+
+
+def install_query_recorder(sender, connection, **kwargs) -> None:
+    """``connection_created`` receiver, pooled connections are created once per checkout"""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def db_timer(query: bool = False):
+    """DB time of the current request spent outside the connection's execute wrappers,
+    like fetching from a server-side cursor, ``query`` counts a query run that way"""
+    timings = current_timings.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.queries += query
+        timings.db_time += time.perf_counter() - start
+
+
+@contextmanager
+def serializer_timer():
+    timings = current_timings.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.serializer_time += time.perf_counter() - start
+
+
+def _timed(service: str, name: str, func):
+    labels = {'service': service, 'method': name}
+
+    if inspect.isgeneratorfunction(func):
+        @functools.wraps(func)
+        def generator(*args, **kwargs):
+            # Time the whole iteration, not just creating the generator
+            start = time.perf_counter()
+            try:
+                yield from func(*args, **kwargs)
+            except GeneratorExit:
+                raise
+            except BaseException:
+                registry.inc('service_call_errors_total', labels)
+                raise
+            finally:
+                registry.observe('service_call_duration_seconds', labels, time.perf_counter() - start)
+        return generator
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            registry.inc('service_call_errors_total', labels)
+            raise
+        finally:
+            registry.observe('service_call_duration_seconds', labels, time.perf_counter() - start)
+    return wrapper
+
+
+def instrument_service(cls):
+    """Class decorator timing every public static method of a service by name"""
+    for name, attr in list(vars(cls).items()):
+        if isinstance(attr, staticmethod) and not name.startswith('_'):
+            setattr(cls, name, staticmethod(_timed(cls.__name__, name, attr.__func__)))
+    return cls
+
+
+def record_request(route: str, method: str, status: int, duration: float, timings: RequestTimings) -> None:
+    labels = {'route': route, 'method': method}
+    registry.observe('http_request_duration_seconds', labels, duration)
+    registry.inc('http_requests_total', {**labels, 'status': status})
+    registry.inc('http_request_db_queries_total', labels, timings.queries)
+    registry.inc('http_request_db_seconds_total', labels, timings.db_time)
+    registry.inc('http_request_serializer_seconds_total', labels, timings.serializer_time)
+    _flusher.ensure_running()
+
+
+def server_timing(duration: float, timings: RequestTimings) -> str:
+    return (
+        f'db;dur={timings.db_time * 1000:.2f};desc="{timings.queries} queries", '
+        f'ser;dur={timings.serializer_time * 1000:.2f}, '
+        f'total;dur={duration * 1000:.2f}'
+    )
+
+
+# Multiprocess store
+
+def metrics_dir() -> str:
+    return getattr(settings, 'METRICS_DIR', None) or os.path.join(tempfile.gettempdir(), 'api-metrics')
+
+
+def flush() -> None:
+    """Write this process' snapshot, atomically replacing the previous one"""
+    directory = metrics_dir()
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'metrics-{os.getpid()}.json')
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(registry.snapshot(), f)
+    os.replace(tmp, path)
+
+
+class _Flusher:
+    """Daemon thread flushing periodically, started lazily once per process"""
+
+    def __init__(self):
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_running(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name='metrics-flush', daemon=True).start()
+
+    def _run(self):
+        interval = getattr(settings, 'METRICS_FLUSH_INTERVAL', 5.0)
+        while True:
+            time.sleep(interval)
+            try:
+                flush()
+            except OSError:
+                pass
+
+
+_flusher = _Flusher()
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _load_snapshots() -> Iterable[Dict[str, Any]]:
+    for path in glob.glob(os.path.join(metrics_dir(), 'metrics-*.json')):
+        try:
+            with open(path) as f:
+                yield json.load(f)
+        except (OSError, ValueError):
+            continue
+
+
+def _labels_text(labels: Dict[str, str], extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in sorted(labels.items())]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def render() -> str:
+    """All processes' metrics in the Prometheus text exposition format"""
+    flush()
+    counters: Dict[Tuple[str, LabelKey], float] = {}
+    histograms: Dict[Tuple[str, LabelKey], List[float]] = {}
+    gauges: Dict[Tuple[str, LabelKey], float] = {}
+
+    for snapshot in _load_snapshots():
+        for name, labels, value in snapshot.get('counters', []):
+            key = (name, _key(labels))
+            counters[key] = counters.get(key, 0.0) + value
+        for name, labels, series in snapshot.get('histograms', []):
+            key = (name, _key(labels))
+            merged = histograms.setdefault(key, [0.0] * len(series))
+            for i, value in enumerate(series):
+                merged[i] += value
+        if _alive(snapshot.get('pid', 0)):
+            for name, labels, value in snapshot.get('gauges', []):
+                key = (name, _key(labels))
+                gauges[key] = gauges.get(key, 0.0) + value
+
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        source = {'counter': counters, 'gauge': gauges, 'histogram': histograms}[kind]
+        series = sorted((labels, value) for (metric, labels), value in source.items() if metric == name)
+        if not series:
+            continue
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in series:
+            labels = dict(labels)
+            if kind != 'histogram':
+                lines.append(f'{name}{_labels_text(labels)} {_number(value)}')
+                continue
+            cumulative = 0.0
+            for bound, count in zip(_buckets(name), value):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f'{name}_bucket{_labels_text(labels, le)} {_number(cumulative)}')
+            le = 'le="+Inf"'
+            lines.append(f'{name}_bucket{_labels_text(labels, le)} {_number(value[-1])}')
+            lines.append(f'{name}_sum{_labels_text(labels)} {_number(value[-2])}')
+            lines.append(f'{name}_count{_labels_text(labels)} {_number(value[-1])}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,252 @@
+"""
+Project wide middleware.
+"""
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+from api.core import metrics
+from api.core.compression import available_codings, negotiate
+from api.core.db.routing import begin_request, end_request
+
+
+class MetricsMiddleware:
+    """
+    Records latency, SQL queries, DB and serializer time per route and
+    method, and reports them to the client in a Server-Timing header.
+    Keep it first, so it sees the whole request.
+
+    A streaming response, like the exports, runs most of its queries while
+    the body is sent: it is recorded once the body was sent, or the client
+    went away in the middle, with the time and queries of producing it.
+    Its Server-Timing header goes out before the body and only covers the
+    time to the first byte.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        timings = metrics.RequestTimings()
+        token = metrics.current_timings.set(timings)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.current_timings.reset(token)
+        return self._finish(request, response, start, timings)
+
+    async def __acall__(self, request):
+        timings = metrics.RequestTimings()
+        token = metrics.current_timings.set(timings)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.current_timings.reset(token)
+        return self._finish(request, response, start, timings)
+
+    @classmethod
+    def _finish(cls, request, response, start, timings):
+        response['Server-Timing'] = metrics.server_timing(time.perf_counter() - start, timings)
+        if not response.streaming:
+            cls._record(request, response, start, timings)
+            return response
+        content = response.streaming_content
+        record_stream = cls._arecord_stream if response.is_async else cls._record_stream
+        response.streaming_content = record_stream(request, response, start, timings, content)
+        return response
+
+    @staticmethod
+    def _record(request, response, start, timings):
+        match = request.resolver_match
+        route = match.route if match else 'unmatched'
+        metrics.record_request(route, request.method, response.status_code, time.perf_counter() - start, timings)
+
+    @classmethod
+    def _record_stream(cls, request, response, start, timings, chunks):
+        chunks = iter(chunks)
+        try:
+            while True:
+                # Only while producing a chunk, the server's own code runs in between
+                token = metrics.current_timings.set(timings)
+                try:
+                    chunk = next(chunks)
+                except StopIteration:
+                    return
+                finally:
+                    metrics.current_timings.reset(token)
+                yield chunk
+        finally:
+            cls._record(request, response, start, timings)
+
+    @classmethod
+    async def _arecord_stream(cls, request, response, start, timings, chunks):
+        chunks = aiter(chunks)
+        try:
+            while True:
+                token = metrics.current_timings.set(timings)
+                try:
+                    chunk = await anext(chunks)
+                except StopAsyncIteration:
+                    return
+                finally:
+                    metrics.current_timings.reset(token)
+                yield chunk
+        finally:
+            cls._record(request, response, start, timings)
+
+
+class ReadYourWritesMiddleware:
+    """
+    Keeps a client reading from the primary for READ_YOUR_WRITES_SECONDS
+    after it wrote, so reads from a lagging replica never hide its own
+    changes. The pin travels in a cookie holding its expiry time.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        token = begin_request(self._is_pinned(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            wrote = end_request(token)
+        return self._pin(response, wrote)
+
+    async def __acall__(self, request):
+        token = begin_request(self._is_pinned(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            wrote = end_request(token)
+        return self._pin(response, wrote)
+
+    @staticmethod
+    def _is_pinned(request) -> bool:
+        try:
+            return float(request.COOKIES.get(settings.READ_YOUR_WRITES_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+    @staticmethod
+    def _pin(response, wrote: bool):
+        seconds = settings.READ_YOUR_WRITES_SECONDS
+        if wrote and seconds > 0 and settings.DATABASE_REPLICAS:
+            response.set_cookie(
+                settings.READ_YOUR_WRITES_COOKIE, str(int(time.time() + seconds)),
+                max_age=seconds, httponly=True, samesite='Lax',
+            )
+        return response
+
+
+class CompressionMiddleware:
+    """
+    Compresses response bodies with the best content coding the client
+    accepts of settings.COMPRESSION['ENCODINGS'] (zstd, br, gzip).
+
+    Bodies below MIN_SIZE bytes, responses that are already encoded or
+    marked ``no-transform``, and content types that do not compress (only
+    text, JSON, XML and YAML are) pass through unchanged. Streaming
+    responses, like the exports, are compressed chunk by chunk. Keep it
+    right after MetricsMiddleware, so the latency includes compression.
+    """
+    sync_capable = True
+    async_capable = True
+
+    compressible_types = ('text/', 'application/json', 'application/x-ndjson', 'application/xml',
+                          'application/yaml', 'application/javascript')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        options = getattr(settings, 'COMPRESSION', {})
+        self.codings = available_codings(options.get('ENCODINGS', ('gzip',)), options.get('LEVELS'))
+        self.min_size = options.get('MIN_SIZE', 1024)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return self._compress(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self._compress(request, await self.get_response(request))
+
+    def _compressible(self, response) -> bool:
+        if response.has_header('Content-Encoding') or 'no-transform' in response.get('Cache-Control', ''):
+            return False
+        if response.status_code < 200 or response.status_code in (204, 206, 304):
+            return False
+        content_type = response.get('Content-Type', '').split(';')[0].strip().lower()
+        return (content_type.startswith(self.compressible_types)
+                or content_type.endswith(('+json', '+xml')))
+
+    def _compress(self, request, response):
+        if not self.codings or not self._compressible(response):
+            return response
+        if not response.streaming and len(response.content) < self.min_size:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        name = negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''), self.codings)
+        if name is None:
+            return response
+        coding = self.codings[name]
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = self._acompress_stream(coding, response.streaming_content)
+            else:
+                response.streaming_content = self._compress_stream(coding, response.streaming_content)
+            # The compressed size is unknown until the stream ends
+            del response.headers['Content-Length']
+        else:
+            content = coding.compress(response.content)
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response.headers['Content-Length'] = str(len(content))
+
+        # A strong ETag names these exact bytes, the compressed body only matches weakly
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = name
+        return response
+
+    @staticmethod
+    def _compress_stream(coding, chunks):
+        compressor = coding.compressor()
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.finish()
+
+    @staticmethod
+    async def _acompress_stream(coding, chunks):
+        compressor = coding.compressor()
+        async for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.finish()
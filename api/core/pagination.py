@@ -0,0 +1,209 @@
+"""
+Keyset (cursor) pagination for the raw SQL list endpoints.
+
+A cursor is an opaque, url-safe token holding the ordering and the sort key
+of the row at the edge of the current page. The next page is then a bounded
+range scan ``WHERE key > last_key ORDER BY key LIMIT n`` instead of an
+``OFFSET`` over (or a ``fetchall()`` of) the whole table.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from api.mandant.context import mandant_limit
+
+
+class InvalidCursor(ValueError):
+    """Raised for cursors that can not be decoded or do not fit the endpoint"""
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'$dt': value.isoformat()}
+    raise TypeError(f"Unsupported cursor value: {value!r}")
+
+
+def _decode_value(obj):
+    if '$dt' in obj:
+        return datetime.fromisoformat(obj['$dt'])
+    return obj
+
+
+def encode_cursor(payload: Dict[str, Any]) -> str:
+    raw = json.dumps(payload, separators=(',', ':'), default=_encode_value)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token: str) -> Dict[str, Any]:
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        payload = json.loads(raw, object_hook=_decode_value)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise InvalidCursor('Invalid cursor') from e
+    if not isinstance(payload, dict):
+        raise InvalidCursor('Invalid cursor')
+    return payload
+
+
+def keyset_sql(columns: Sequence[str], key: Optional[Sequence[Any]],
+               descending: Union[bool, Sequence[bool]], backwards: bool) -> Tuple[str, str, List[Any]]:
+    """
+    Build the seek predicate and ORDER BY clause for a keyset page.
+
+    ``descending`` is one flag for all columns or one per column. Returns
+    ``(where, order_by, params)``. ``where`` is empty for the first page.
+    The predicate is spelled out as ``a > x OR (a = x AND b > y)`` rather
+    than a row constructor so MySQL can use the index range (and so the
+    columns can sort in different directions).
+    """
+    if isinstance(descending, bool):
+        descending = [descending] * len(columns)
+    # Walking backwards is the same scan with the directions flipped
+    descending = [d != backwards for d in descending]
+    order_by = ', '.join(f"{column} {'DESC' if d else 'ASC'}" for column, d in zip(columns, descending))
+
+    if key is None:
+        return '', order_by, []
+
+    terms = []
+    params = []
+    for i, column in enumerate(columns):
+        op = '<' if descending[i] else '>'
+        parts = [f"{prev} = %s" for prev in columns[:i]] + [f"{column} {op} %s"]
+        terms.append(' AND '.join(parts))
+        params.extend(key[:i + 1])
+    return '(' + ' OR '.join(f"({term})" for term in terms) + ')', order_by, params
+
+
+class KeysetPaginator:
+    """
+    Parses ``cursor``, ``limit`` and ``ordering`` from a request and turns
+    the rows returned by a service into a page with next/previous links.
+
+    ``orderings`` maps the public ordering names to a function returning the
+    sort value of a row, e.g. ``{'id': lambda u: u.id}``, and must offer
+    ``id``. The ordering is a comma separated list of names, each prefixed
+    with ``-`` to sort descending (``last_name,-created_at``). Unless it ends
+    in ``id``, the id is added as the last key, in the direction of the key
+    before it, so the sort is unique.
+
+    ``key_types`` maps ordering names to the type of their sort values
+    (``id`` is an ``int``), the values of a cursor must have them.
+    """
+    cursor_query_param = 'cursor'
+    limit_query_param = 'limit'
+    ordering_query_param = 'ordering'
+    max_ordering_fields = 3
+
+    def __init__(self, request, orderings: Dict[str, Callable[[Any], Any]], default_ordering: str = 'id',
+                 key_types: Optional[Dict[str, type]] = None):
+        self.request = request
+        self.orderings = orderings
+        self.key_types = {'id': int, **(key_types or {})}
+        # DRF requests have query_params, plain Django (async) views only GET
+        params = getattr(request, 'query_params', request.GET)
+        self.limit = self._parse_limit(params.get(self.limit_query_param))
+
+        token = params.get(self.cursor_query_param)
+        if token:
+            cursor = decode_cursor(token)
+            ordering = cursor.get('o')
+            self.key = cursor.get('k')
+            self.backwards = bool(cursor.get('b'))
+            if not isinstance(self.key, list) or not self.key:
+                raise InvalidCursor('Invalid cursor')
+        else:
+            ordering = params.get(self.ordering_query_param, default_ordering)
+            self.key = None
+            self.backwards = False
+
+        self.fields = self._parse_ordering(ordering)
+        if self.key is not None and (len(self.key) != len(self.fields) or not all(
+                self._valid_value(name, value) for (name, _), value in zip(self.fields, self.key))):
+            raise InvalidCursor('Invalid cursor')
+        self.ordering = ordering
+        self.next_link = None
+        self.previous_link = None
+
+    def _parse_ordering(self, ordering) -> List[Tuple[str, bool]]:
+        """``[(name, descending), ...]`` ending in the id"""
+        if not isinstance(ordering, str) or not ordering:
+            raise InvalidCursor(f"Unsupported ordering: {ordering}")
+        fields = []
+        for part in ordering.split(','):
+            name = part.strip().lstrip('-')
+            if name not in self.orderings or any(name == seen for seen, _ in fields):
+                raise InvalidCursor(f"Unsupported ordering: {ordering}")
+            fields.append((name, part.strip().startswith('-')))
+        if len(fields) - (fields[-1][0] == 'id') > self.max_ordering_fields:
+            raise InvalidCursor(f"Ordering by at most {self.max_ordering_fields} fields")
+        if fields[-1][0] != 'id':
+            if any(name == 'id' for name, _ in fields):
+                raise InvalidCursor(f"Unsupported ordering: {ordering}")
+            fields.append(('id', fields[-1][1]))
+        return fields
+
+    def _valid_value(self, name: str, value) -> bool:
+        """Whether a cursor value has the type of its sort column"""
+        expected = self.key_types.get(name)
+        if expected is None:
+            return True
+        if expected is int:
+            # bool is an int to Python, and the database only takes 64 bit ints
+            return type(value) is int and -2 ** 63 <= value < 2 ** 63
+        return type(value) is expected
+
+    def sort_key(self, row) -> tuple:
+        return tuple(self.orderings[name](row) for name, _ in self.fields)
+
+    @staticmethod
+    def _parse_limit(value) -> int:
+        default = mandant_limit('USER_LIST_PAGE_SIZE')
+        maximum = mandant_limit('USER_LIST_MAX_PAGE_SIZE')
+        if value is None:
+            return min(default, maximum)
+        try:
+            limit = int(value)
+        except ValueError:
+            return min(default, maximum)
+        return max(1, min(limit, maximum))
+
+    @property
+    def fetch_size(self) -> int:
+        """Rows to request from the service, one extra to detect a further page"""
+        return self.limit + 1
+
+    def paginate(self, rows: List[Any]) -> List[Any]:
+        has_more = len(rows) > self.limit
+        rows = rows[:self.limit]
+        if self.backwards:
+            rows.reverse()
+
+        if rows:
+            first, last = self.sort_key(rows[0]), self.sort_key(rows[-1])
+            # Coming from a cursor means there is a page on the other side
+            has_next = has_more if not self.backwards else True
+            has_previous = has_more if self.backwards else self.key is not None
+            if has_next:
+                self.next_link = self._link(last, backwards=False)
+            if has_previous:
+                self.previous_link = self._link(first, backwards=True)
+        return rows
+
+    def _link(self, key, backwards: bool) -> str:
+        token = encode_cursor({'o': self.ordering, 'k': list(key), 'b': int(backwards)})
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.ordering_query_param)
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        return replace_query_param(url, self.cursor_query_param, token)
+
+    def get_response_data(self, results) -> Dict[str, Any]:
+        return {
+            'next': self.next_link,
+            'previous': self.previous_link,
+            'results': results,
+        }
@@ -0,0 +1,312 @@
+"""
+The OpenAPI schema of /swagger.json, /swagger/ and /redoc/ without running
+drf_yasg on every hit.
+
+Generating the schema introspects every view and serializer, which costs
+far more than serving it. ``SchemaCache`` serves the encoded schema as
+ready-made bytes, each with a gzipped copy and a strong ETag, in one of
+three modes (``settings.API_SCHEMA['MODE']``):
+
+* ``prebuilt``: the files written at build/deploy time by
+  ``python manage.py build_schema``. If they are missing or were built from
+  other inputs (URL patterns, view or serializer source, API info, swagger
+  settings, drf_yasg release), the schema is generated once like in ``memo``.
+* ``memo``: generated on the first request of each process, again when the
+  URLconf changes.
+* ``dynamic``: drf_yasg on every request, for working on the docs.
+
+The schema is generated without a request, so it carries no host and
+clients take the one they loaded it from (``SWAGGER_SETTINGS
+['DEFAULT_API_URL']`` sets one).
+
+drf_yasg's views, renderers and codecs (with the spec validator and YAML)
+are imported on the first schema request, not when the URLconf loads.
+"""
+import gzip
+import hashlib
+import logging
+import os
+import re
+import sys
+import threading
+import weakref
+from importlib.metadata import version as package_version
+from types import ModuleType
+from typing import Dict, Iterator, NamedTuple, Optional, Tuple
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.urls import URLPattern, URLResolver, get_resolver
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.functional import cached_property
+
+from .conditional import not_modified, set_validators
+
+logger = logging.getLogger(__name__)
+
+# format -> media type, drf_yasg codec
+FORMATS = {
+    'json': ('application/json', 'OpenAPICodecJson'),
+    'yaml': ('application/yaml', 'OpenAPICodecYaml'),
+}
+
+# Query parameter values the UI pages fetch their schema with
+UI_FORMATS = {'openapi': 'json', 'json': 'json', 'yaml': 'yaml'}
+
+MODES = ('prebuilt', 'memo', 'dynamic')
+
+VERSION_FILE = 'openapi.version'
+
+accepts_gzip = re.compile(r'\bgzip\b')
+
+
+class SchemaDocument(NamedTuple):
+    content: bytes
+    gzipped: bytes
+    # Of the uncompressed content, the gzipped copy gets a suffix
+    etag: str
+    media_type: str
+
+    @classmethod
+    def of(cls, fmt: str, content: bytes, gzipped: Optional[bytes] = None) -> 'SchemaDocument':
+        if gzipped is None:
+            # mtime=0: the same schema gives the same bytes on every build
+            gzipped = gzip.compress(content, compresslevel=9, mtime=0)
+        etag = '"' + hashlib.sha256(content).hexdigest()[:32] + '"'
+        return cls(content, gzipped, etag, FORMATS[fmt][0])
+
+
+_versions = weakref.WeakKeyDictionary()
+
+
+def _views(resolver, prefix=''):
+    """``(route, view)`` of every URL pattern"""
+    for entry in resolver.url_patterns:
+        route = prefix + str(entry.pattern)
+        if isinstance(entry, URLResolver):
+            yield from _views(entry, route)
+        elif isinstance(entry, URLPattern):
+            yield route, entry.callback
+
+
+def _project_module(name) -> Optional[ModuleType]:
+    module = sys.modules.get(name) if isinstance(name, str) else None
+    path = getattr(module, '__file__', None)
+    if path and os.path.abspath(path).startswith(os.path.abspath(settings.BASE_DIR) + os.sep):
+        return module
+    return None
+
+
+def _source_files(views) -> Iterator[Tuple[str, str]]:
+    """``(module, path)`` of the project modules the schema is generated from: those
+    defining the views and what they use at module level (serializers, schema helpers)"""
+    modules = {}
+    for view in views:
+        view_module = _project_module(getattr(view, '__module__', None))
+        if view_module is None:
+            continue
+        modules[view_module.__name__] = view_module
+        for value in vars(view_module).values():
+            name = value.__name__ if isinstance(value, ModuleType) else getattr(value, '__module__', None)
+            module = _project_module(name)
+            if module is not None:
+                modules[module.__name__] = module
+    for name in sorted(modules):
+        yield name, modules[name].__file__
+
+
+def urlconf_version(urlconf: Optional[str] = None) -> str:
+    """Fingerprint of the URL patterns, their views and the source of the modules
+    defining them, computed once per resolver"""
+    resolver = get_resolver(urlconf)
+    version = _versions.get(resolver)
+    if version is None:
+        views = list(_views(resolver))
+        digest = hashlib.sha256('\n'.join(
+            f"{route} {getattr(view, '__module__', '')}.{getattr(view, '__qualname__', '')}" for route, view in views
+        ).encode())
+        for name, path in _source_files(view for _, view in views):
+            digest.update(f'\n{name}\n'.encode())
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+        version = _versions[resolver] = digest.hexdigest()[:16]
+    return version
+
+
+def _path(directory: str, fmt: str, gzipped: bool = False) -> str:
+    return os.path.join(directory, f"openapi.{fmt}{'.gz' if gzipped else ''}")
+
+
+class SchemaCache:
+    def __init__(self, info, urlconf: Optional[str] = None, **view_options):
+        """``view_options`` are passed to drf_yasg's ``get_schema_view``"""
+        self.info = info
+        self.urlconf = urlconf
+        self.view_options = view_options
+        self._documents: Dict[Tuple[str, str], SchemaDocument] = {}
+        self._versions: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    @cached_property
+    def schema_view(self):
+        """drf_yasg's schema view, serving the UI pages and the ``dynamic`` mode"""
+        from drf_yasg.views import get_schema_view
+
+        return get_schema_view(self.info, urlconf=self.urlconf, **self.view_options)
+
+    @property
+    def options(self) -> dict:
+        return getattr(settings, 'API_SCHEMA', {})
+
+    @property
+    def mode(self) -> str:
+        mode = self.options.get('MODE', 'prebuilt')
+        if mode not in MODES:
+            raise ValueError(f"API_SCHEMA['MODE'] must be one of {', '.join(MODES)}, not {mode!r}")
+        return mode
+
+    @property
+    def version(self) -> str:
+        """Fingerprint of everything the schema is generated from: the URLconf and the view
+        modules' source, the API info, ``SWAGGER_SETTINGS`` and the drf_yasg release"""
+        urlconf = urlconf_version(self.urlconf)
+        version = self._versions.get(urlconf)
+        if version is None:
+            inputs = (urlconf, repr(self.info), repr(getattr(settings, 'SWAGGER_SETTINGS', None)),
+                      package_version('drf-yasg'))
+            version = self._versions[urlconf] = hashlib.sha256('\n'.join(inputs).encode()).hexdigest()[:16]
+        return version
+
+    @property
+    def directory(self) -> str:
+        return str(self.options.get('DIR', settings.BASE_DIR / 'openapi'))
+
+    def generate(self, fmt: str) -> bytes:
+        """The encoded schema, as drf_yasg serves it to an anonymous client"""
+        from drf_yasg import codecs
+        from drf_yasg.app_settings import swagger_settings
+
+        generator = self.schema_view.generator_class(self.info, '', swagger_settings.DEFAULT_API_URL,
+                                                     urlconf=self.urlconf)
+        schema = generator.get_schema(request=None, public=True)
+        return getattr(codecs, FORMATS[fmt][1])(validators=[]).encode(schema)
+
+    def document(self, fmt: str) -> SchemaDocument:
+        version = self.version
+        document = self._documents.get((version, fmt))
+        if document is None:
+            with self._lock:
+                document = self._documents.get((version, fmt))
+                if document is None:
+                    document = self._load(fmt, version) if self.mode == 'prebuilt' else None
+                    if document is None:
+                        document = SchemaDocument.of(fmt, self.generate(fmt))
+                    self._documents[(version, fmt)] = document
+        return document
+
+    def _load(self, fmt: str, version: str) -> Optional[SchemaDocument]:
+        directory = self.directory
+        try:
+            with open(os.path.join(directory, VERSION_FILE)) as f:
+                built_for = f.read().strip()
+            if built_for != version:
+                logger.warning("The schema in %s is stale (version %s, built for %s), generating it",
+                               directory, version, built_for)
+                return None
+            with open(_path(directory, fmt), 'rb') as f:
+                content = f.read()
+            with open(_path(directory, fmt, gzipped=True), 'rb') as f:
+                gzipped = f.read()
+        except FileNotFoundError:
+            logger.warning("No prebuilt schema in %s, run manage.py build_schema. Generating it", directory)
+            return None
+        return SchemaDocument.of(fmt, content, gzipped)
+
+    def write(self, directory: Optional[str] = None) -> list:
+        """Generate all formats into ``directory``, returning the paths written"""
+        directory = directory or self.directory
+        os.makedirs(directory, exist_ok=True)
+        written = []
+        for fmt in FORMATS:
+            document = SchemaDocument.of(fmt, self.generate(fmt))
+            for path, data in ((_path(directory, fmt), document.content),
+                               (_path(directory, fmt, gzipped=True), document.gzipped)):
+                # Replaced atomically, workers reading it never see half a file
+                with open(path + '.tmp', 'wb') as f:
+                    f.write(data)
+                os.replace(path + '.tmp', path)
+                written.append(path)
+        path = os.path.join(directory, VERSION_FILE)
+        with open(path, 'w') as f:
+            f.write(self.version + '\n')
+        written.append(path)
+        return written
+
+    def is_current(self, directory: Optional[str] = None) -> bool:
+        """Whether the files in ``directory`` match a freshly generated schema"""
+        directory = directory or self.directory
+        try:
+            with open(os.path.join(directory, VERSION_FILE)) as f:
+                if f.read().strip() != self.version:
+                    return False
+            for fmt in FORMATS:
+                with open(_path(directory, fmt), 'rb') as f:
+                    if f.read() != self.generate(fmt):
+                        return False
+        except FileNotFoundError:
+            return False
+        return True
+
+    def respond(self, request, fmt: str) -> HttpResponse:
+        document = self.document(fmt)
+        gzipped = bool(accepts_gzip.search(request.META.get('HTTP_ACCEPT_ENCODING', '')))
+        # Strong validators differ between the encodings of the same schema
+        etag = document.etag[:-1] + '-gzip"' if gzipped else document.etag
+        response = not_modified(request, etag)
+        if response is None:
+            response = HttpResponse(document.gzipped if gzipped else document.content,
+                                    content_type=document.media_type)
+            if gzipped:
+                response['Content-Encoding'] = 'gzip'
+            set_validators(response, etag)
+        patch_vary_headers(response, ('Accept-Encoding',))
+        patch_cache_control(response, public=True, max_age=self.options.get('MAX_AGE', 0))
+        return response
+
+    def spec_view(self):
+        """View of ``swagger<format>/``, ``format`` is ``.json`` or ``.yaml``"""
+        dynamic = _LazyView(lambda: self.schema_view.without_ui(cache_timeout=0))
+
+        def view(request, format=None):
+            if self.mode == 'dynamic':
+                return dynamic(request, format=format)
+            fmt = (format or '.json').lstrip('.')
+            if fmt not in FORMATS or request.method not in ('GET', 'HEAD'):
+                raise Http404
+            return self.respond(request, fmt)
+        return view
+
+    def ui_view(self, renderer: str):
+        """View of the Swagger UI or ReDoc page, which loads the schema from ``?format=openapi``"""
+        ui = _LazyView(lambda: self.schema_view.with_ui(renderer, cache_timeout=0))
+
+        def view(request, *args, **kwargs):
+            fmt = UI_FORMATS.get(request.GET.get('format'))
+            if fmt is None or self.mode == 'dynamic' or request.method not in ('GET', 'HEAD'):
+                return ui(request, *args, **kwargs)
+            return self.respond(request, fmt)
+        return view
+
+
+class _LazyView:
+    """A view created on its first request"""
+
+    def __init__(self, factory):
+        self.factory = factory
+
+    @cached_property
+    def view(self):
+        return self.factory()
+
+    def __call__(self, request, *args, **kwargs):
+        return self.view(request, *args, **kwargs)
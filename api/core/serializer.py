@@ -1,5 +1,7 @@
 from rest_framework import serializers
 
+from api.mandant.context import mandant_limit
+
 class BaseSerializer(serializers.Serializer):
     # Common field that all serializers will inherit
     created_at = serializers.DateTimeField(read_only=True)
@@ -9,7 +11,6 @@ class BaseSerializer(serializers.Serializer):
 
     def validate(self, data):
         request = self.context.get('request') 
-        print("request: ", request)
         if request and request.method in ['PUT', 'PATCH']:
             if not data.get('changed_from'):
                 raise serializers.ValidationError({'changed_from': 'This field is required for PATCH/PUT.'})
@@ -17,4 +18,19 @@ class BaseSerializer(serializers.Serializer):
             # For POST requests, changed_from should not be present
             if 'changed_from' in data:
                 raise serializers.ValidationError({'changed_from': 'This field should not be included for POST requests.'})
-        return data
\ No newline at end of file
+        return data
+
+
+class IdListSerializer(serializers.Serializer):
+    """Body of the batch endpoints: the ids of the users to act on"""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False
+    )
+
+    def validate_ids(self, ids):
+        # USER_BATCH_MAX_IDS can differ per mandant, so it is checked per request
+        max_length = mandant_limit('USER_BATCH_MAX_IDS')
+        if len(ids) > max_length:
+            raise serializers.ValidationError(f"Ensure this field has no more than {max_length} elements.")
+        return ids
@@ -21,7 +21,6 @@ class YesNoToBooleanField(serializers.Field):
         return value.lower() == 'yes'
 
     def to_internal_value(self, data):
-        print("to_internal_value data:", data, type(data))
         """API (true/false) -> Database ('yes'/'no')"""
         if data is None:
             return None
@@ -42,4 +41,29 @@ class YesNoToBooleanField(serializers.Field):
         return {
             'type': 'boolean',
             'nullable': self.allow_null
-        }
\ No newline at end of file
+        }
+
+
+class JaNeinToBooleanField(serializers.CharField):
+    """
+    Serializer field that converts between:
+    - API: string ('ja'/'nein', any case)
+    - Database: boolean
+    """
+
+    default_error_messages = {
+        'invalid_choice': "{field_name} must be 'ja' or 'nein'",
+    }
+
+    def to_representation(self, value):
+        """Database (true/false) -> API ('ja'/'nein')"""
+        return 'ja' if value else 'nein'
+
+    def to_internal_value(self, data):
+        """API ('ja'/'nein') -> Database (true/false)"""
+        value = super().to_internal_value(data).lower()
+        if value == 'ja':
+            return True
+        if value == 'nein':
+            return False
+        self.fail('invalid_choice', field_name=self.field_name)
\ No newline at end of file
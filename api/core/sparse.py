@@ -0,0 +1,81 @@
+"""
+Sparse fieldsets: ``?fields=id,login`` or ``?exclude=created_at`` on the
+read endpoints.
+
+``sparse_fields`` validates the names against the readable fields of the
+serializer and returns them in the serializer's order, the compiled
+serializers then build only those keys. ``select_list`` narrows the SQL
+to match: columns nobody asked for are selected as ``NULL``, so rows keep
+their shape while the query reads only what an index can cover.
+"""
+from typing import Collection, Dict, List, Optional, Tuple
+
+from drf_yasg import openapi
+
+from .compiled import compile_serializer
+
+FIELDS_PARAM = 'fields'
+EXCLUDE_PARAM = 'exclude'
+
+
+class InvalidFields(ValueError):
+    """Raised for unknown names in ``fields`` or ``exclude``"""
+
+
+def readable_fields(serializer_class) -> List[str]:
+    return [field.field_name for field in compile_serializer(serializer_class).prototype._readable_fields]
+
+
+def _names(params, key: str) -> Optional[List[str]]:
+    raw = params.get(key)
+    if raw is None:
+        return None
+    return [name.strip() for name in raw.split(',') if name.strip()]
+
+
+def sparse_fields(params, serializer_class) -> Optional[Tuple[str, ...]]:
+    """
+    The fields to render for ``params`` (a QueryDict), ``None`` for all of
+    them. ``exclude`` is applied after ``fields``.
+    """
+    requested, excluded = _names(params, FIELDS_PARAM), _names(params, EXCLUDE_PARAM)
+    if not requested and not excluded:
+        return None
+    available = readable_fields(serializer_class)
+    unknown = [name for name in (requested or []) + (excluded or []) if name not in available]
+    if unknown:
+        raise InvalidFields(f"Unknown fields: {', '.join(unknown)}. Available: {', '.join(available)}")
+    wanted = set(requested or available) - set(excluded or ())
+    return tuple(name for name in available if name in wanted)
+
+
+def select_list(columns: Dict[str, str], fields: Optional[Collection[str]] = None,
+                required: Collection[str] = ()) -> str:
+    """
+    SQL select list of ``columns`` (field name -> column, in row order) with
+    ``NULL`` in place of the columns of fields outside ``fields`` and
+    ``required``. All columns when ``fields`` is ``None``.
+    """
+    if fields is None:
+        return ', '.join(columns.values())
+    return ', '.join(
+        column if name in fields or name in required else 'NULL'
+        for name, column in columns.items()
+    )
+
+
+def openapi_parameters(serializer_class) -> List[openapi.Parameter]:
+    """Swagger query parameters of the sparse fieldsets"""
+    names = ', '.join(readable_fields(serializer_class))
+    return [
+        openapi.Parameter(
+            FIELDS_PARAM, openapi.IN_QUERY,
+            description=f"Comma separated fields to return, of {names}",
+            type=openapi.TYPE_STRING
+        ),
+        openapi.Parameter(
+            EXCLUDE_PARAM, openapi.IN_QUERY,
+            description="Comma separated fields to leave out",
+            type=openapi.TYPE_STRING
+        ),
+    ]
@@ -0,0 +1,23 @@
+"""
+Test cases on the user table. The table is not managed by migrations, so the
+test database gets it (and the tombstone table) from the benchmark schema.
+"""
+from django.test import TestCase
+
+from benchmarks.seed import create_schema
+
+from .cache import clear_caches
+
+
+class UserTableTestCase(TestCase):
+    """``TestCase`` with an empty user table and empty user caches per test"""
+
+    @classmethod
+    def setUpClass(cls):
+        # Ahead of the class transaction, MySQL commits DDL implicitly
+        create_schema()
+        super().setUpClass()
+
+    def setUp(self):
+        # Rolled back ids are handed out again, cached rows of earlier tests would match them
+        clear_caches()
@@ -0,0 +1,33 @@
+from django.test import SimpleTestCase
+
+from api.core.bloom import BloomFilter
+
+
+class BloomFilterTests(SimpleTestCase):
+    def test_added_keys_are_found(self):
+        bloom = BloomFilter(1000)
+        keys = [f'user{i}@example.com' for i in range(1000)]
+        bloom.update(keys)
+
+        self.assertTrue(all(key in bloom for key in keys))
+        self.assertEqual(len(bloom), 1000)
+
+    def test_empty_filter_finds_nothing(self):
+        self.assertNotIn('anna@example.com', BloomFilter(10))
+
+    def test_false_positive_rate_at_capacity(self):
+        bloom = BloomFilter(2000, error_rate=0.01)
+        bloom.update(f'user{i}@example.com' for i in range(2000))
+
+        false_positives = sum(f'other{i}@example.com' in bloom for i in range(20000))
+        self.assertLess(false_positives / 20000, 0.02)
+
+    def test_sizing(self):
+        bloom = BloomFilter(1000, error_rate=0.01)
+        # About 9.6 bits and 7 hashes per key for 1%
+        self.assertEqual((bloom.size, bloom.hashes), (9586, 7))
+
+    def test_invalid_parameters(self):
+        for capacity, error_rate in ((0, 0.01), (10, 0), (10, 1)):
+            with self.subTest(capacity=capacity, error_rate=error_rate), self.assertRaises(ValueError):
+                BloomFilter(capacity, error_rate)
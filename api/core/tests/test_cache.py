@@ -0,0 +1,91 @@
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import SimpleTestCase, override_settings
+
+from api.core.cache import ReadThroughCache
+
+
+class Loader:
+    """A loader counting its calls, running ``during`` while it loads"""
+
+    def __init__(self, value, during=None):
+        self.value = value
+        self.during = during
+        self.calls = 0
+
+    def __call__(self, key):
+        self.calls += 1
+        if self.during is not None:
+            self.during()
+        return self.value
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class ReadThroughCacheTests(SimpleTestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.addCleanup(caches['default'].clear)
+
+    def workers(self):
+        """Two processes' caches on the same shared tier"""
+        return ReadThroughCache('test', shared_alias='default'), ReadThroughCache('test', shared_alias='default')
+
+    def test_hits_and_misses(self):
+        cache = ReadThroughCache('test', shared_alias='default')
+        loader = Loader({'id': 1})
+
+        self.assertEqual(cache.get(1, loader), {'id': 1})
+        self.assertEqual(cache.get(1, loader), {'id': 1})
+        self.assertEqual(loader.calls, 1)
+        self.assertEqual(cache.get(2, Loader(None)), None)
+        self.assertEqual(cache.get(2, loader), None)
+        self.assertEqual((cache.stats()['hits'], cache.stats()['negative_hits'], cache.stats()['misses']), (1, 1, 2))
+
+    def test_workers_share_loaded_rows_and_invalidations(self):
+        worker, other = self.workers()
+        worker.get(1, Loader({'id': 1}))
+
+        loader = Loader({'id': 1, 'first_name': 'Greta'})
+        self.assertEqual(other.get(1, loader), {'id': 1})
+        self.assertEqual(loader.calls, 0)
+        worker.invalidate(1)
+        other.clear()
+        self.assertEqual(other.get(1, loader), {'id': 1, 'first_name': 'Greta'})
+
+    def test_row_loaded_during_an_invalidation_is_not_cached(self):
+        cache = ReadThroughCache('test', shared_alias='default')
+        # A write of the row commits and invalidates while the loader still holds the old row
+        stale = Loader({'id': 1, 'first_name': 'Anna'}, during=lambda: cache.invalidate(1))
+
+        self.assertEqual(cache.get(1, stale), {'id': 1, 'first_name': 'Anna'})
+        current = Loader({'id': 1, 'first_name': 'Greta'})
+        self.assertEqual(cache.get(1, current), {'id': 1, 'first_name': 'Greta'})
+        self.assertEqual(current.calls, 1)
+        self.assertEqual(cache.get(1, current), {'id': 1, 'first_name': 'Greta'})
+        self.assertEqual(current.calls, 1)
+
+    def test_invalidation_by_another_worker_keeps_the_row_out_of_the_shared_tier(self):
+        worker, other = self.workers()
+        worker.get(1, Loader({'id': 1, 'first_name': 'Anna'}, during=lambda: other.invalidate(1)))
+
+        current = Loader({'id': 1, 'first_name': 'Greta'})
+        self.assertEqual(other.get(1, current), {'id': 1, 'first_name': 'Greta'})
+        self.assertEqual(current.calls, 1)
+
+    def test_other_keys_are_cached_during_an_invalidation(self):
+        cache = ReadThroughCache('test')
+        loader = Loader({'id': 1}, during=lambda: cache.invalidate(2))
+
+        cache.get(1, loader)
+        cache.get(1, loader)
+        self.assertEqual(loader.calls, 1)
+
+    @override_settings(DATABASE_REPLICAS=['replica_0'])
+    def test_replica_rows_are_shared_for_the_local_ttl(self):
+        cache = ReadThroughCache('test', ttl=30, shared_alias='default', shared_ttl=300)
+        shared = caches['default']
+
+        with mock.patch.object(shared, 'set', wraps=shared.set) as set_:
+            cache.get(1, Loader({'id': 1}))
+        self.assertEqual(set_.call_args.args[2], 30)
@@ -0,0 +1,87 @@
+import threading
+
+from django.test import SimpleTestCase
+
+from api.core.coalescer import WriteCoalescer
+
+
+class Recorder:
+    """A ``flush`` recording its batches, failing items or whole batches on request"""
+
+    def __init__(self, fail_items=(), fail_batch=None, results=None):
+        self.batches = []
+        self.fail_items = fail_items
+        self.fail_batch = fail_batch
+        self.results = results
+
+    def __call__(self, items):
+        self.batches.append(list(items))
+        if self.fail_batch is not None:
+            raise self.fail_batch
+        if self.results is not None:
+            return self.results
+        return [ValueError(item) if item in self.fail_items else item * 10 for item in items]
+
+
+def submit_concurrently(coalescer, items):
+    """``submit`` each item on its own thread, returning the results or exceptions by item"""
+    outcomes = {}
+    start = threading.Barrier(len(items))
+
+    def run(item):
+        start.wait()
+        try:
+            outcomes[item] = coalescer.submit(item)
+        except Exception as e:
+            outcomes[item] = e
+
+    threads = [threading.Thread(target=run, args=(item,)) for item in items]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    return outcomes
+
+
+class WriteCoalescerTests(SimpleTestCase):
+    def test_single_submit_is_flushed_alone(self):
+        flush = Recorder()
+        coalescer = WriteCoalescer('test', flush, max_batch=8, max_delay=0)
+
+        self.assertEqual(coalescer.submit(1), 10)
+        self.assertEqual(flush.batches, [[1]])
+
+    def test_concurrent_submits_share_a_flush(self):
+        flush = Recorder()
+        # The leader waits until the batch is full
+        coalescer = WriteCoalescer('test', flush, max_batch=4, max_delay=5)
+        outcomes = submit_concurrently(coalescer, [1, 2, 3, 4])
+
+        self.assertEqual(outcomes, {1: 10, 2: 20, 3: 30, 4: 40})
+        self.assertEqual(len(flush.batches), 1)
+        self.assertCountEqual(flush.batches[0], [1, 2, 3, 4])
+
+    def test_failed_item_fails_only_its_submit(self):
+        coalescer = WriteCoalescer('test', Recorder(fail_items=(2,)), max_batch=3, max_delay=5)
+        outcomes = submit_concurrently(coalescer, [1, 2, 3])
+
+        self.assertIsInstance(outcomes[2], ValueError)
+        self.assertEqual((outcomes[1], outcomes[3]), (10, 30))
+
+    def test_failed_flush_fails_every_submit_with_its_own_exception(self):
+        error = ConnectionError("gone away")
+        coalescer = WriteCoalescer('test', Recorder(fail_batch=error), max_batch=3, max_delay=5)
+        outcomes = submit_concurrently(coalescer, [1, 2, 3])
+
+        self.assertTrue(all(isinstance(outcome, ConnectionError) for outcome in outcomes.values()))
+        self.assertEqual(len({id(outcome) for outcome in outcomes.values()}), 3)
+        self.assertTrue(all(outcome.__cause__ is error for outcome in outcomes.values()))
+
+    def test_wrong_result_count_fails_the_batch(self):
+        coalescer = WriteCoalescer('test', Recorder(results=[10]), max_batch=2, max_delay=5)
+        outcomes = submit_concurrently(coalescer, [1, 2])
+
+        self.assertTrue(all(isinstance(outcome, RuntimeError) for outcome in outcomes.values()))
+
+    def test_disabled_for_batches_of_one(self):
+        self.assertFalse(WriteCoalescer('test', Recorder(), max_batch=1).enabled)
@@ -0,0 +1,106 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from django.test import SimpleTestCase
+from rest_framework import serializers
+
+from api.core.compiled import CompiledListSerializer, CompiledSerializerMixin, compile_serializer
+from api.core.serializer_fields import JaNeinToBooleanField, YesNoToBooleanField
+
+
+class PlainSerializer(serializers.Serializer):
+    id = serializers.IntegerField(read_only=True)
+    login = serializers.EmailField(max_length=100)
+    first_name = serializers.CharField(max_length=100)
+    last_name = serializers.CharField(max_length=100, required=False)
+    created_at = serializers.DateTimeField(read_only=True)
+    is_active = serializers.BooleanField(read_only=True, default=True)
+    test_bool = JaNeinToBooleanField(required=False, allow_null=True)
+    str_bool = YesNoToBooleanField(required=False, allow_null=True)
+
+
+class CompiledSerializer(CompiledSerializerMixin, PlainSerializer):
+    class Meta:
+        list_serializer_class = CompiledListSerializer
+
+
+ROW = {
+    'id': 7, 'login': 'anna@example.com', 'first_name': 'Anna', 'last_name': 'Müller',
+    'created_at': datetime(2024, 3, 1, 12, 30, 5, 123456, tzinfo=timezone.utc),
+    'is_active': 1, 'test_bool': True, 'str_bool': 'Yes',
+}
+
+
+class RepresentationTests(SimpleTestCase):
+    def assertSameAsDrf(self, instance, fields=None):
+        expected = PlainSerializer(instance).data
+        if fields is not None:
+            expected = {name: expected[name] for name in fields}
+        self.assertEqual(CompiledSerializer(instance, fields=fields).data, expected)
+
+    def test_dict_matches_drf(self):
+        self.assertSameAsDrf(ROW)
+
+    def test_object_matches_drf(self):
+        self.assertSameAsDrf(SimpleNamespace(**ROW))
+
+    def test_none_and_naive_datetimes_match_drf(self):
+        self.assertSameAsDrf({**ROW, 'last_name': None, 'test_bool': None, 'str_bool': None,
+                              'created_at': datetime(2024, 3, 1, 12, 30)})
+
+    def test_missing_key_falls_back_to_drf(self):
+        row = {key: value for key, value in ROW.items() if key != 'created_at'}
+        self.assertSameAsDrf(row)
+        self.assertNotIn('created_at', CompiledSerializer(row).data)
+
+    def test_sparse_fields(self):
+        self.assertSameAsDrf(ROW, fields=('id', 'login'))
+
+    def test_many_matches_drf(self):
+        rows = [ROW, {**ROW, 'id': 8, 'is_active': 0, 'test_bool': False}]
+        self.assertEqual(CompiledSerializer(rows, many=True).data, PlainSerializer(rows, many=True).data)
+
+    def test_custom_to_representation_is_not_compiled(self):
+        class Custom(CompiledSerializerMixin, PlainSerializer):
+            def to_representation(self, instance):
+                return {'id': instance['id']}
+
+        self.assertIsNone(compile_serializer(Custom).representer())
+        self.assertEqual(compile_serializer(Custom).to_representation(ROW), {'id': 7})
+
+
+class InternalValueTests(SimpleTestCase):
+    def assertSameAsDrf(self, data, partial=False):
+        plain = PlainSerializer(data=data, partial=partial)
+        compiled = CompiledSerializer(data=data, partial=partial)
+        self.assertEqual(compiled.is_valid(), plain.is_valid())
+        self.assertEqual(compiled.errors, plain.errors)
+        if not plain.errors:
+            self.assertEqual(compiled.validated_data, plain.validated_data)
+
+    def test_valid_input_matches_drf(self):
+        self.assertSameAsDrf({'login': 'anna@example.com', 'first_name': ' Anna ', 'test_bool': 'ja',
+                              'str_bool': None})
+
+    def test_missing_required_field_matches_drf(self):
+        self.assertSameAsDrf({'login': 'anna@example.com'})
+
+    def test_invalid_values_match_drf(self):
+        self.assertSameAsDrf({'login': 'no email', 'first_name': '', 'test_bool': 'maybe'})
+        self.assertSameAsDrf({'login': 'anna@example.com', 'first_name': 'x' * 101})
+        self.assertSameAsDrf({'login': None, 'first_name': 'Anna'})
+
+    def test_partial_matches_drf(self):
+        self.assertSameAsDrf({'last_name': 'Weber'}, partial=True)
+
+    def test_non_dict_input_matches_drf(self):
+        self.assertSameAsDrf(['anna@example.com'])
+
+    def test_fast_path_taken_for_valid_input(self):
+        compiled = compile_serializer(CompiledSerializer)
+        serializer = CompiledSerializer(data={})
+        self.assertEqual(
+            compiled.to_internal_value(serializer, {'login': 'anna@example.com', 'first_name': 'Anna'}),
+            {'login': 'anna@example.com', 'first_name': 'Anna'}
+        )
+        self.assertIsNone(compiled.to_internal_value(serializer, {'login': 'no email', 'first_name': 'Anna'}))
@@ -0,0 +1,117 @@
+import asyncio
+import gzip
+import zlib
+from unittest import mock
+
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from api.core import compression
+from api.core.compression import available_codings, negotiate
+from api.core.middleware import CompressionMiddleware
+
+BODY = b'{"results":[' + b','.join(b'{"id":%d,"login":"user%d@example.com"}' % (i, i) for i in range(100)) + b']}'
+
+
+class NegotiateTests(SimpleTestCase):
+    preference = ('zstd', 'br', 'gzip')
+
+    def test_highest_q_value_wins(self):
+        self.assertEqual(negotiate('gzip;q=1.0, br;q=0.5', self.preference), 'gzip')
+        self.assertEqual(negotiate('br;q=0.2, gzip;q=0.8, zstd;q=0.5', self.preference), 'gzip')
+
+    def test_ties_go_to_the_server_preference(self):
+        self.assertEqual(negotiate('gzip, deflate, br', self.preference), 'br')
+        self.assertEqual(negotiate('GZIP;Q=0.5, Br;q=0.5', self.preference), 'br')
+
+    def test_wildcard(self):
+        self.assertEqual(negotiate('*', self.preference), 'zstd')
+        self.assertEqual(negotiate('zstd;q=0, *;q=0.1', self.preference), 'br')
+
+    def test_identity(self):
+        for header in ('', 'identity', 'deflate', 'gzip;q=0', 'gzip;q=x', '*;q=0'):
+            with self.subTest(header=header):
+                self.assertIsNone(negotiate(header, self.preference))
+
+    def test_missing_libraries_are_not_offered(self):
+        with mock.patch.dict(compression.CODINGS, {'br': None}):
+            self.assertEqual(list(available_codings(['br', 'gzip'], {'gzip': 1})), ['gzip'])
+        self.assertEqual(available_codings(['gzip'], {'gzip': 1})['gzip'].level, 1)
+        with self.assertRaises(ValueError):
+            available_codings(['deflate'])
+
+
+@override_settings(COMPRESSION={'ENCODINGS': ['gzip'], 'MIN_SIZE': 100})
+class CompressionMiddlewareTests(SimpleTestCase):
+    def call(self, response, accept='gzip'):
+        request = RequestFactory().get('/user/', headers={'accept-encoding': accept})
+        return CompressionMiddleware(lambda request: response)(request)
+
+    def json_response(self, body=BODY, **headers):
+        return HttpResponse(body, content_type='application/json', headers=headers)
+
+    def test_body_is_compressed(self):
+        response = self.call(self.json_response(ETag='"abc"'))
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), BODY)
+        self.assertEqual(response['Content-Length'], str(len(response.content)))
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(response['ETag'], 'W/"abc"')
+
+    def test_client_without_a_coding(self):
+        response = self.call(self.json_response(), accept='identity')
+
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.content, BODY)
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+    def test_skipped_responses(self):
+        responses = {
+            'small': self.json_response(BODY[:99]),
+            'no-transform': self.json_response(**{'Cache-Control': 'no-transform'}),
+            'encoded': self.json_response(**{'Content-Encoding': 'br'}),
+            'image': HttpResponse(BODY, content_type='image/png'),
+            'not modified': HttpResponse(status=304),
+        }
+        for reason, response in responses.items():
+            with self.subTest(reason=reason):
+                content = response.content
+                response = self.call(response)
+                self.assertEqual(response.content, content)
+                self.assertNotEqual(response.get('Content-Encoding'), 'gzip')
+
+    def test_incompressible_body_is_sent_as_is(self):
+        body = bytes(range(256)) * 4
+        response = self.call(HttpResponse(gzip.compress(body), content_type='text/plain'))
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_stream_is_compressed_chunk_by_chunk(self):
+        chunks = [b'{"id":1}\n' * 20, b'{"id":2}\n' * 20]
+        response = self.call(StreamingHttpResponse(iter(chunks), content_type='application/x-ndjson'))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertFalse(response.has_header('Content-Length'))
+
+        decoder = zlib.decompressobj(31)
+        parts = [decoder.decompress(part) for part in response.streaming_content]
+        # Every chunk decodes as soon as it arrives
+        self.assertEqual(parts[:2], chunks)
+        self.assertEqual(b''.join(parts), b''.join(chunks))
+        self.assertTrue(decoder.eof)
+
+    def test_async_stream(self):
+        async def chunks():
+            yield b'a' * 200
+            yield b'b' * 200
+
+        async def call_async():
+            async def get_response(request):
+                return StreamingHttpResponse(chunks(), content_type='text/csv')
+
+            middleware = CompressionMiddleware(get_response)
+            response = await middleware(RequestFactory().get('/user/', headers={'accept-encoding': 'gzip'}))
+            return response, b''.join([part async for part in response.streaming_content])
+
+        response, content = asyncio.run(call_async())
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(content), b'a' * 200 + b'b' * 200)
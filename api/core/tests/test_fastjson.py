@@ -0,0 +1,50 @@
+import io
+import uuid
+from datetime import date, datetime, time, timedelta, timezone
+from decimal import Decimal
+
+from django.test import SimpleTestCase
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from api.core.fastjson import FastJSONParser, FastJSONRenderer, dumps, loads
+
+DATA = {
+    'id': 7, 'login': 'anna@example.com', 'last_name': 'Müller', 'quote': '"<tag>" & \\',
+    'created_at': datetime(2024, 3, 1, 12, 30, 5, 123456, tzinfo=timezone.utc),
+    'changed_at': datetime(2024, 3, 1, 12, 30, 5, tzinfo=timezone(timedelta(hours=2))),
+    'naive': datetime(2024, 3, 1, 12, 30, 5, 120), 'day': date(2024, 3, 1), 'time': time(12, 30, 5, 5),
+    'amount': Decimal('1.50'), 'uuid': uuid.UUID(int=5), 'ratio': 0.1, 'big': 2 ** 70, 1: 'int key',
+    'flags': [True, False, None], 'nested': {'empty': [], 'separators': 'a\u2028b\u2029c'},
+}
+
+
+class FastJSONRendererTests(SimpleTestCase):
+    def test_bytes_equal_drf(self):
+        self.assertEqual(FastJSONRenderer().render(DATA), JSONRenderer().render(DATA))
+        self.assertEqual(dumps(DATA), JSONRenderer().render(DATA))
+
+    def test_js_separators_are_escaped(self):
+        self.assertEqual(dumps({'s': '\u2028\u2029'}), b'{"s":"\\u2028\\u2029"}')
+
+    def test_indented_output_stays_with_drf(self):
+        media_type = 'application/json; indent=2'
+        self.assertEqual(FastJSONRenderer().render(DATA, media_type), JSONRenderer().render(DATA, media_type))
+
+    def test_none_is_an_empty_body(self):
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+
+
+class FastJSONParserTests(SimpleTestCase):
+    def parse(self, parser, body):
+        return parser.parse(io.BytesIO(body), 'application/json', {})
+
+    def test_same_as_drf(self):
+        body = JSONRenderer().render({'login': 'anna@example.com', 'name': 'Müller', 'ids': [1, 2], 'x': None})
+        self.assertEqual(self.parse(FastJSONParser(), body), self.parse(JSONParser(), body))
+        self.assertEqual(loads(body.decode()), self.parse(JSONParser(), body))
+
+    def test_invalid_json(self):
+        with self.assertRaises(ParseError):
+            self.parse(FastJSONParser(), b'{"login": ')
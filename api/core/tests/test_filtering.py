@@ -0,0 +1,83 @@
+from datetime import datetime, timezone
+
+from django.http import QueryDict
+from django.test import SimpleTestCase
+from rest_framework import serializers
+
+from api.core.filtering import Condition, Filter, FilterSet, InvalidFilter, like_prefix, where_clause
+
+FILTERS = FilterSet(
+    {
+        'name': Filter('name_col', serializers.CharField(max_length=10), ('exact', 'startswith')),
+        'active': Filter('active_col', serializers.BooleanField(), default=True),
+        'created': Filter('created_col', serializers.DateTimeField(), ('gt', 'lte')),
+    },
+    search=('name_col', 'other_col'),
+)
+
+
+def parse(query):
+    return FILTERS.parse(QueryDict(query))
+
+
+class LikePrefixTests(SimpleTestCase):
+    def test_wildcards_and_the_escape_character_are_literal(self):
+        self.assertEqual(like_prefix('50%_off!'), '50!%!_off!!%')
+        self.assertEqual(like_prefix('Anna'), 'Anna%')
+
+
+class WhereClauseTests(SimpleTestCase):
+    def test_empty_conditions_are_skipped(self):
+        self.assertEqual(where_clause(Condition('', []), None, Condition('a = %s', [1]), Condition('b > %s', [2])),
+                         Condition('WHERE a = %s AND b > %s', [1, 2]))
+        self.assertEqual(where_clause(Condition('', [])), Condition('', []))
+
+
+class FilterSetTests(SimpleTestCase):
+    def test_defaults_apply_when_not_given(self):
+        self.assertEqual(parse(''), Condition('active_col = %s', [True]))
+        self.assertEqual(parse('active=false'), Condition('active_col = %s', [False]))
+
+    def test_lookups(self):
+        self.assertEqual(
+            parse('name=Anna&created__gt=2024-01-01T00:00:00Z&created__lte=2024-02-01T00:00:00Z'),
+            Condition('name_col = %s AND created_col > %s AND created_col <= %s AND active_col = %s',
+                      ['Anna', datetime(2024, 1, 1, tzinfo=timezone.utc), datetime(2024, 2, 1, tzinfo=timezone.utc),
+                       True])
+        )
+
+    def test_startswith_is_an_escaped_prefix(self):
+        self.assertEqual(parse('name__startswith=5%_!&active=true'),
+                         Condition("name_col LIKE %s ESCAPE '!' AND active_col = %s", ['5!%!_!!%', True]))
+
+    def test_prefix_need_not_be_a_valid_value(self):
+        filters = FilterSet({'login': Filter('login', serializers.EmailField(max_length=100), ('exact', 'startswith'))})
+
+        self.assertEqual(filters.parse(QueryDict('login__startswith=ann')).params, ['ann%'])
+        with self.assertRaises(InvalidFilter):
+            filters.parse(QueryDict('login=ann'))
+
+    def test_aware_datetimes_are_compared_in_utc(self):
+        value = parse('created__gt=2024-01-01T02:00:00%2B02:00').params[0]
+        self.assertEqual((value, value.tzinfo), (datetime(2024, 1, 1, tzinfo=timezone.utc), timezone.utc))
+
+    def test_unknown_parameters_are_ignored(self):
+        self.assertEqual(parse('ordering=-id&limit=5&password=x'), parse(''))
+
+    def test_invalid_parameters_are_rejected(self):
+        for query in ('name__gt=A', 'created=2024-01-01T00:00:00Z', 'active=maybe', 'active=2', 'active=',
+                      'created__gt=yesterday', 'name=' + 'x' * 11, 'search=' + 'x' * 256):
+            with self.subTest(query=query), self.assertRaises(InvalidFilter):
+                parse(query)
+
+    def test_search_is_a_prefix_on_every_column(self):
+        self.assertEqual(
+            parse('search=+ann%25+'),
+            Condition("active_col = %s AND (name_col LIKE %s ESCAPE '!' OR other_col LIKE %s ESCAPE '!')",
+                      [True, 'ann!%%', 'ann!%%'])
+        )
+        self.assertEqual(parse('search=+'), parse(''))
+
+    def test_unknown_lookup_of_a_filter(self):
+        with self.assertRaises(ValueError):
+            Filter('name_col', serializers.CharField(), ('contains',))
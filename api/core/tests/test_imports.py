@@ -0,0 +1,131 @@
+import json
+import os
+import tempfile
+from unittest import mock
+
+from django.db import DatabaseError, connection
+
+from api.core.imports import FORMAT_CSV, FORMAT_NDJSON, Checkpoint, UserImport, read_records
+from api.core.testing import UserTableTestCase
+from api.user.serializers import UserCreateSerializer
+from api.user.services import UserService
+
+HEADER = 'login,password,first_name,last_name\n'
+
+
+def csv_line(login, first_name='Anna'):
+    return f'{login},Secret123!,{first_name},Müller\n'
+
+
+class UserImportTests(UserTableTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write_input(self, content, name='users.csv'):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return path
+
+    def run_import(self, path, input_format=FORMAT_CSV, insert_rows=UserService.create_users,
+                   existing_logins=UserService.existing_logins, **options):
+        importer = UserImport(UserCreateSerializer, insert_rows, existing_logins, workers=0, **options)
+        checkpoint = Checkpoint(f'{path}.checkpoint', path)
+        records = read_records(path, input_format, skip=checkpoint.load()['position'])
+        with open(f'{path}.rejects.ndjson', 'a', encoding='utf-8') as rejects:
+            stats = importer.run(records, checkpoint, rejects)
+        return stats, checkpoint
+
+    def rejects(self, path):
+        with open(f'{path}.rejects.ndjson', encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+
+    def logins(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT login FROM user ORDER BY id")
+            return [row[0] for row in cursor.fetchall()]
+
+    def test_valid_records_are_created_and_the_others_rejected(self):
+        UserService.create_users([{'login': 'ben@example.com', 'password': 'x', 'first_name': 'Ben',
+                                   'last_name': 'Weber'}])
+        path = self.write_input(HEADER + csv_line('anna@example.com') + csv_line('no email')
+                                + csv_line('ANNA@example.com') + csv_line('ben@example.com')
+                                + csv_line('carl@example.com', 'Carl'))
+
+        stats, checkpoint = self.run_import(path)
+        self.assertEqual((stats.read, stats.created, stats.rejected), (5, 2, 3))
+        self.assertEqual(self.logins(), ['ben@example.com', 'anna@example.com', 'carl@example.com'])
+
+        rejects = self.rejects(path)
+        self.assertEqual([(r['record'], r['status']) for r in rejects], [(2, 400), (3, 409), (4, 409)])
+        self.assertIn('login', rejects[0]['errors'])
+        self.assertEqual(rejects[1]['errors'], {'error': 'Duplicate login in the input'})
+        self.assertEqual(rejects[2]['errors'], {'error': 'User already exists'})
+        self.assertEqual(rejects[2]['input']['login'], 'ben@example.com')
+        state = checkpoint.load()
+        self.assertEqual((state['position'], state['created'], state['rejected'], state['done']), (5, 2, 3, True))
+
+    def test_rows_are_inserted_in_statements_of_insert_size(self):
+        path = self.write_input(HEADER + ''.join(csv_line(f'user{i}@example.com') for i in range(5)))
+        insert_rows = mock.Mock(wraps=UserService.create_users)
+
+        stats, _ = self.run_import(path, insert_rows=insert_rows, batch_size=4, insert_size=3)
+        self.assertEqual(stats.created, 5)
+        self.assertEqual([len(call.args[0]) for call in insert_rows.call_args_list], [3, 1, 1])
+
+    def test_failing_batch_is_retried_row_by_row(self):
+        UserService.create_users([{'login': 'anna@example.com', 'password': 'x', 'first_name': 'Anna',
+                                   'last_name': 'Müller'}])
+        path = self.write_input(HEADER + csv_line('ben@example.com') + csv_line('anna@example.com')
+                                + csv_line('carl@example.com'))
+
+        # A login taken after the lookup fails the multi-row INSERT on the unique key
+        stats, _ = self.run_import(path, existing_logins=lambda logins: set())
+        self.assertEqual((stats.created, stats.rejected), (2, 1))
+        self.assertEqual(self.logins(), ['anna@example.com', 'ben@example.com', 'carl@example.com'])
+        reject, = self.rejects(path)
+        self.assertEqual((reject['record'], reject['status']), (2, 409))
+
+    def test_rerun_resumes_after_the_checkpoint(self):
+        path = self.write_input(HEADER + ''.join(csv_line(f'user{i}@example.com') for i in range(5))
+                                + csv_line('no email'))
+        calls = []
+
+        def failing_second_batch(rows):
+            calls.append(rows)
+            if len(calls) == 2:
+                raise DatabaseError("server has gone away")
+            return UserService.create_users(rows)
+
+        with self.assertRaises(DatabaseError), self.assertLogs('api.core.imports', 'ERROR'):
+            self.run_import(path, insert_rows=failing_second_batch, batch_size=2)
+        state = Checkpoint(f'{path}.checkpoint', path).load()
+        self.assertEqual((state['position'], state['created'], state['done']), (2, 2, False))
+
+        stats, checkpoint = self.run_import(path, batch_size=2)
+        self.assertEqual((stats.read, stats.created, stats.rejected), (4, 5, 1))
+        self.assertEqual(self.logins(), [f'user{i}@example.com' for i in range(5)])
+        self.assertTrue(checkpoint.load()['done'])
+        self.assertEqual([r['record'] for r in self.rejects(path)], [6])
+
+    def test_malformed_ndjson_line_is_rejected(self):
+        path = self.write_input(
+            json.dumps({'login': 'anna@example.com', 'password': 'x', 'first_name': 'Anna', 'last_name': 'Müller'})
+            + '\n{"login": \n', name='users.ndjson'
+        )
+
+        stats, _ = self.run_import(path, FORMAT_NDJSON)
+        self.assertEqual((stats.created, stats.rejected), (1, 1))
+        reject, = self.rejects(path)
+        self.assertEqual((reject['record'], reject['status'], reject['input']), (2, 400, '{"login": '))
+
+    def test_checkpoint_of_another_input_is_refused(self):
+        path = self.write_input(HEADER + csv_line('anna@example.com'))
+        self.run_import(path)
+
+        self.write_input(HEADER + csv_line('anna@example.com') + csv_line('ben@example.com'))
+        with self.assertRaises(ValueError):
+            Checkpoint(f'{path}.checkpoint', path).load()
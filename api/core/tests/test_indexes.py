@@ -0,0 +1,50 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase
+
+from api.core.db.indexes import (
+    USER_INDEXES, check_indexes, create_index_sql, create_unique_login_sql, existing_indexes, has_unique_login
+)
+from api.core.testing import UserTableTestCase
+
+
+class CheckIndexesTests(UserTableTestCase):
+    def test_benchmark_schema_has_every_index(self):
+        statuses = check_indexes(connection)
+
+        self.assertEqual([status.name for status in statuses], list(USER_INDEXES))
+        self.assertEqual([status.covered_by for status in statuses], list(USER_INDEXES))
+        self.assertTrue(has_unique_login(connection))
+
+    def test_prefix_of_another_index_is_covered(self):
+        status, = check_indexes(connection, {'user_active': ('isactive', 'login')})
+        self.assertEqual((status.covered_by, status.conflict), ('user_active_login', False))
+
+    def test_name_taken_by_other_columns(self):
+        status, = check_indexes(connection, {'user_active_login': ('isActive', 'first_name', 'id')})
+        self.assertEqual((status.covered_by, status.conflict), ('user_active_first_name', True))
+
+    def test_missing_index(self):
+        status, = check_indexes(connection, {'user_login_active': ('login', 'isActive')})
+        self.assertEqual((status.covered_by, status.conflict), ('', False))
+        self.assertIn(['login'], existing_indexes(connection).values())
+
+    def test_command_reports_a_complete_schema(self):
+        out = StringIO()
+        call_command('user_indexes', stdout=out)
+        self.assertIn(f"All {len(USER_INDEXES)} indexes on user are in place", out.getvalue())
+
+
+class IndexSqlTests(SimpleTestCase):
+    def test_mysql_builds_online(self):
+        self.assertEqual(create_index_sql('mysql', 'user_active_login', ('isActive', 'login', 'id')),
+                         "ALTER TABLE user ADD INDEX user_active_login (isActive, login, id), "
+                         "ALGORITHM=INPLACE, LOCK=NONE")
+        self.assertIn('LOCK=NONE', create_unique_login_sql('mysql'))
+
+    def test_other_vendors(self):
+        self.assertEqual(create_index_sql('sqlite', 'user_active_login', ('isActive', 'login', 'id')),
+                         "CREATE INDEX user_active_login ON user (isActive, login, id)")
+        self.assertEqual(create_unique_login_sql('sqlite'), "CREATE UNIQUE INDEX user_login_unique ON user (login)")
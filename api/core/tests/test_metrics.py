@@ -0,0 +1,208 @@
+import asyncio
+import json
+import os
+import tempfile
+from unittest import mock
+
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from api.core import metrics
+from api.core.metrics import Registry, instrument_service
+from api.core.middleware import MetricsMiddleware
+from api.core.testing import UserTableTestCase
+from api.user.services import UserService
+
+# Above the kernel's pid_max, never a live process
+DEAD_PID = 2 ** 22 + 1
+
+
+class MetricsMiddlewareTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(metrics, 'record_request')
+        self.record_request = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def call(self, response):
+        return MetricsMiddleware(lambda request: response)(RequestFactory().get('/user/export/'))
+
+    def recorded_timings(self):
+        (route, method, status, duration, timings), = [call.args for call in self.record_request.call_args_list]
+        return timings
+
+    def chunks(self, seen):
+        for chunk in (b'a', b'b'):
+            # A query run while the body is produced
+            with metrics.db_timer(query=True):
+                seen.append(metrics.current_timings.get())
+            yield chunk
+
+    def test_response_is_recorded_with_its_server_timing(self):
+        response = self.call(HttpResponse(b'{}'))
+        self.record_request.assert_called_once()
+        self.assertRegex(response['Server-Timing'], r'^db;dur=0\.00;desc="0 queries", ser;dur=[\d.]+, total;dur=')
+
+    def test_stream_is_recorded_when_it_ends(self):
+        seen = []
+        response = self.call(StreamingHttpResponse(self.chunks(seen)))
+        self.assertIn('Server-Timing', response)
+
+        content = iter(response.streaming_content)
+        self.assertEqual(next(content), b'a')
+        self.record_request.assert_not_called()
+        # Not left set for the server between chunks
+        self.assertIsNone(metrics.current_timings.get())
+        self.assertEqual(b''.join(content), b'b')
+
+        timings = self.recorded_timings()
+        self.assertEqual(seen, [timings, timings])
+        self.assertEqual(timings.queries, 2)
+
+    def test_stream_closed_by_the_client_is_recorded(self):
+        seen = []
+        response = self.call(StreamingHttpResponse(self.chunks(seen)))
+        next(iter(response.streaming_content))
+        response.close()
+        self.assertEqual(self.recorded_timings().queries, 1)
+
+    def test_async_stream(self):
+        seen = []
+
+        async def chunks():
+            for chunk in self.chunks(seen):
+                yield chunk
+
+        async def call_async():
+            async def get_response(request):
+                return StreamingHttpResponse(chunks())
+
+            response = await MetricsMiddleware(get_response)(RequestFactory().get('/user/export/'))
+            return b''.join([part async for part in response.streaming_content])
+
+        self.assertEqual(asyncio.run(call_async()), b'ab')
+        self.assertEqual(self.recorded_timings().queries, 2)
+
+
+class StreamedExportTests(UserTableTestCase):
+    def test_export_queries_are_counted(self):
+        UserService.create_users([{'login': f'user{i}@example.com', 'password': 'x', 'first_name': 'Anna',
+                                   'last_name': 'Müller'} for i in range(3)])
+
+        with mock.patch.object(metrics, 'record_request') as record_request:
+            response = self.client.get('/user/export/')
+            self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 3)
+        route, method, status, duration, timings = record_request.call_args.args
+        self.assertEqual((route, status), ('user/export/', 200))
+        self.assertGreaterEqual(timings.queries, 1)
+        self.assertGreater(timings.db_time, 0)
+
+
+class InstrumentServiceTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(metrics, 'registry', Registry())
+        self.registry = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        @instrument_service
+        class Service:
+            @staticmethod
+            def get(value):
+                if value is None:
+                    raise ValueError(value)
+                return value
+
+            @staticmethod
+            def rows():
+                yield 1
+                raise LookupError
+
+            @staticmethod
+            def _helper():
+                return 'private'
+
+        self.service = Service
+
+    def calls(self, method):
+        labels = metrics._key({'service': 'Service', 'method': method})
+        series = self.registry.histograms.get(('service_call_duration_seconds', labels))
+        errors = self.registry.counters.get(('service_call_errors_total', labels), 0)
+        return (series[-1] if series else 0, errors)
+
+    def test_calls_and_errors_are_counted(self):
+        self.assertEqual(self.service.get(5), 5)
+        with self.assertRaises(ValueError):
+            self.service.get(None)
+        self.assertEqual(self.calls('get'), (2, 1))
+        self.assertEqual(self.service.get.__name__, 'get')
+
+    def test_generator_is_timed_over_its_iteration(self):
+        rows = self.service.rows()
+        self.assertEqual(next(rows), 1)
+        self.assertEqual(self.calls('rows'), (0, 0))
+        with self.assertRaises(LookupError):
+            next(rows)
+        self.assertEqual(self.calls('rows'), (1, 1))
+
+        rows = self.service.rows()
+        next(rows)
+        rows.close()
+        # Stopped by the caller, not an error
+        self.assertEqual(self.calls('rows'), (2, 1))
+
+    def test_private_methods_are_not_instrumented(self):
+        self.assertEqual(self.service._helper(), 'private')
+        self.assertEqual(self.calls('_helper'), (0, 0))
+
+
+class RenderTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings = override_settings(METRICS_DIR=self.directory)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        patcher = mock.patch.object(metrics, 'registry', Registry())
+        self.registry = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def write_snapshot(self, pid, counters=(), histograms=(), gauges=()):
+        with open(os.path.join(self.directory, f'metrics-{pid}.json'), 'w') as f:
+            json.dump({'pid': pid, 'counters': list(counters), 'histograms': list(histograms),
+                       'gauges': list(gauges)}, f)
+
+    def test_processes_are_merged(self):
+        labels = {'route': 'user/', 'method': 'GET'}
+        self.registry.inc('http_requests_total', {**labels, 'status': 200}, 3)
+        self.registry.observe('http_request_duration_seconds', labels, 0.003)
+        buckets = [0.0] * (len(metrics.BUCKETS) + 2)
+        buckets[2], buckets[-2], buckets[-1] = 2, 0.04, 2
+        self.write_snapshot(DEAD_PID, counters=[['http_requests_total', {**labels, 'status': '200'}, 2]],
+                            histograms=[['http_request_duration_seconds', labels, buckets]],
+                            gauges=[['log_queue_depth', {}, 50]])
+
+        lines = metrics.render().splitlines()
+        self.assertIn('http_requests_total{method="GET",route="user/",status="200"} 5', lines)
+        self.assertIn('http_request_duration_seconds_bucket{method="GET",route="user/",le="0.005"} 1', lines)
+        self.assertIn('http_request_duration_seconds_bucket{method="GET",route="user/",le="0.025"} 3', lines)
+        self.assertIn('http_request_duration_seconds_bucket{method="GET",route="user/",le="+Inf"} 3', lines)
+        self.assertIn('http_request_duration_seconds_count{method="GET",route="user/"} 3', lines)
+        self.assertIn('# TYPE http_request_duration_seconds histogram', lines)
+        # Gauges of exited workers are dropped, their counters keep counting
+        self.assertIn('log_queue_depth 0', lines)
+
+    def test_live_gauges_are_summed(self):
+        self.write_snapshot(os.getppid(), gauges=[['user_login_filter_entries', {}, 7]])
+        with mock.patch.object(metrics, '_collected_gauges', return_value=[['user_login_filter_entries', {}, 3]]):
+            self.assertIn('user_login_filter_entries 10', metrics.render().splitlines())
+
+    def test_unreadable_snapshot_is_skipped(self):
+        with open(os.path.join(self.directory, 'metrics-1.json'), 'w') as f:
+            f.write('{"pid": ')
+        self.registry.inc('write_batch_items_total', {'outcome': 'committed'})
+        self.assertIn('write_batch_items_total{outcome="committed"} 1', metrics.render().splitlines())
+
+    def test_label_values_are_escaped(self):
+        self.registry.inc('http_requests_total', {'route': 'a"b\\c\nd', 'method': 'GET', 'status': 200})
+        self.assertIn('http_requests_total{method="GET",route="a\\"b\\\\c\\nd",status="200"} 1',
+                      metrics.render().splitlines())
@@ -0,0 +1,119 @@
+import base64
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlparse
+
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from api.core.pagination import InvalidCursor, KeysetPaginator, decode_cursor, encode_cursor, keyset_sql
+
+ORDERINGS = {
+    'id': lambda row: row.id,
+    'last_name': lambda row: row.last_name,
+    'created_at': lambda row: row.created_at,
+}
+
+
+KEY_TYPES = {'last_name': str, 'created_at': datetime}
+
+
+def cursor_of(link):
+    return parse_qs(urlparse(link).query)['cursor'][0]
+
+
+class CursorTests(SimpleTestCase):
+    def test_round_trip(self):
+        payload = {'o': '-created_at', 'k': [datetime(2024, 3, 1, 12, tzinfo=timezone.utc), 5], 'b': 0}
+        token = encode_cursor(payload)
+
+        self.assertNotIn('=', token)
+        self.assertEqual(decode_cursor(token), payload)
+
+    def test_garbage_is_rejected(self):
+        for token in ('not a cursor!', '%%%', base64.urlsafe_b64encode(b'{"o":').decode()):
+            with self.subTest(token=token), self.assertRaises(InvalidCursor):
+                decode_cursor(token)
+
+    def test_non_object_payload_is_rejected(self):
+        with self.assertRaises(InvalidCursor):
+            decode_cursor(base64.urlsafe_b64encode(b'[1, 2]').decode())
+
+    def test_bad_datetime_is_rejected(self):
+        with self.assertRaises(InvalidCursor):
+            decode_cursor(encode_cursor({'k': [{'$dt': 'yesterday'}]}))
+
+
+class KeysetSqlTests(SimpleTestCase):
+    def test_first_page_has_no_predicate(self):
+        self.assertEqual(keyset_sql(['last_name', 'id'], None, False, False), ('', 'last_name ASC, id ASC', []))
+
+    def test_seek_predicate(self):
+        where, order_by, params = keyset_sql(['last_name', 'id'], ['Weber', 5], [True, False], False)
+
+        self.assertEqual(where, '((last_name < %s) OR (last_name = %s AND id > %s))')
+        self.assertEqual(order_by, 'last_name DESC, id ASC')
+        self.assertEqual(params, ['Weber', 'Weber', 5])
+
+    def test_backwards_flips_the_directions(self):
+        where, order_by, _ = keyset_sql(['id'], [5], False, True)
+        self.assertEqual((where, order_by), ('((id < %s))', 'id DESC'))
+
+
+@override_settings(USER_LIST_PAGE_SIZE=2, USER_LIST_MAX_PAGE_SIZE=10)
+class KeysetPaginatorTests(SimpleTestCase):
+    rows = [SimpleNamespace(id=i, last_name=name, created_at=datetime(2024, 1, i, tzinfo=timezone.utc))
+            for i, name in enumerate(['Becker', 'Fischer', 'Meyer', 'Weber'], start=1)]
+
+    def paginator(self, **params):
+        return KeysetPaginator(RequestFactory().get('/user/', params), ORDERINGS, key_types=KEY_TYPES)
+
+    def test_ordering_ends_in_the_id(self):
+        self.assertEqual(self.paginator(ordering='-last_name').fields, [('last_name', True), ('id', True)])
+        self.assertEqual(self.paginator(ordering='last_name,-id').fields, [('last_name', False), ('id', True)])
+
+    def test_unsupported_ordering_is_rejected(self):
+        for ordering in ('password', 'id,last_name', 'last_name,last_name', ''):
+            with self.subTest(ordering=ordering), self.assertRaises(InvalidCursor):
+                self.paginator(ordering=ordering)
+
+    def test_limit_is_clamped(self):
+        self.assertEqual(self.paginator(limit='1000').limit, 10)
+        self.assertEqual(self.paginator(limit='0').limit, 1)
+        self.assertEqual(self.paginator(limit='x').limit, 2)
+
+    def test_links_continue_from_the_page_edges(self):
+        first = self.paginator(ordering='-last_name')
+        page = first.paginate(self.rows[::-1][:first.fetch_size])
+        self.assertEqual([row.id for row in page], [4, 3])
+        self.assertIsNone(first.previous_link)
+
+        second = self.paginator(cursor=cursor_of(first.next_link))
+        self.assertEqual(second.key, ['Meyer', 3])
+        self.assertEqual(second.fields, first.fields)
+        self.assertFalse(second.backwards)
+
+        second.paginate(self.rows[1::-1])
+        self.assertIsNone(second.next_link)
+        previous = self.paginator(cursor=cursor_of(second.previous_link))
+        self.assertEqual((previous.key, previous.backwards), (['Fischer', 2], True))
+
+    def test_backwards_page_is_returned_in_order(self):
+        paginator = self.paginator(cursor=encode_cursor({'o': 'id', 'k': [3], 'b': 1}))
+        self.assertEqual([row.id for row in paginator.paginate(self.rows[1::-1])], [1, 2])
+        self.assertIsNotNone(paginator.next_link)
+
+    def test_tampered_cursor_is_rejected(self):
+        for payload in ({'o': 'id', 'k': []}, {'o': 'id', 'k': 3}, {'o': 'id', 'k': [1, 2]},
+                        {'o': 'password', 'k': [1, 2]}, {'k': [1]}):
+            with self.subTest(payload=payload), self.assertRaises(InvalidCursor):
+                self.paginator(cursor=encode_cursor(payload))
+
+    def test_cursor_values_must_fit_the_sort_columns(self):
+        for ordering, key in (('id', ['1']), ('id', [True]), ('id', [2 ** 63]), ('id', [1.5]),
+                              ('last_name', [3, 1]), ('last_name', [None, 1]),
+                              ('created_at', ['2024-01-01', 1]), ('created_at', [{'x': 1}, 1])):
+            with self.subTest(ordering=ordering, key=key), self.assertRaises(InvalidCursor):
+                self.paginator(cursor=encode_cursor({'o': ordering, 'k': key}))
+
+        paginator = self.paginator(cursor=encode_cursor({'o': '-created_at', 'k': [self.rows[0].created_at, 1]}))
+        self.assertEqual(paginator.key, [self.rows[0].created_at, 1])
@@ -0,0 +1,171 @@
+import itertools
+import threading
+import time
+
+from django.test import SimpleTestCase
+
+from api.core.db.pool import ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+    def __init__(self, number):
+        self.number = number
+        self.closed = False
+        self.alive = True
+        self.rollbacks = 0
+
+    def close(self):
+        self.closed = True
+
+
+class FakeDatabase:
+    """``connect``/``ping``/``reset`` of a pool, recording what was opened"""
+
+    def __init__(self):
+        self.numbers = itertools.count(1)
+        self.opened = []
+
+    def connect(self):
+        connection = FakeConnection(next(self.numbers))
+        self.opened.append(connection)
+        return connection
+
+    @staticmethod
+    def ping(connection):
+        if not connection.alive:
+            raise OSError("gone away")
+
+    @staticmethod
+    def reset(connection):
+        connection.rollbacks += 1
+
+
+def make_pool(db, **options):
+    options = {'REAP_INTERVAL': 0, **options}
+    return ConnectionPool('test', db.connect, ping=db.ping, reset=db.reset, **options)
+
+
+class CheckoutTests(SimpleTestCase):
+    def test_release_returns_the_connection_for_reuse(self):
+        db = FakeDatabase()
+        pool = make_pool(db)
+        connection = pool.acquire()
+        pool.release(connection)
+
+        self.assertIs(pool.acquire(), connection)
+        self.assertEqual(len(db.opened), 1)
+        self.assertEqual(connection.rollbacks, 1)
+        self.assertEqual(pool.stats()['checkouts'], 2)
+
+    def test_opens_up_to_max_size(self):
+        db = FakeDatabase()
+        pool = make_pool(db, MAX_SIZE=3)
+        connections = [pool.acquire() for _ in range(3)]
+
+        self.assertEqual(len({c.number for c in connections}), 3)
+        self.assertEqual(pool.stats()['in_use'], 3)
+
+    def test_exhausted_pool_times_out(self):
+        pool = make_pool(FakeDatabase(), MAX_SIZE=1, TIMEOUT=0.05)
+        pool.acquire()
+
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+    def test_exhausted_pool_waits_for_a_release(self):
+        pool = make_pool(FakeDatabase(), MAX_SIZE=1, TIMEOUT=5)
+        connection = pool.acquire()
+        threading.Timer(0.05, pool.release, [connection]).start()
+
+        self.assertIs(pool.acquire(), connection)
+        self.assertEqual(pool.stats()['waits'], 1)
+
+    def test_discarded_connection_is_closed_and_frees_its_slot(self):
+        db = FakeDatabase()
+        pool = make_pool(db, MAX_SIZE=1, TIMEOUT=0.05)
+        connection = pool.acquire()
+        pool.release(connection, discard=True)
+
+        self.assertTrue(connection.closed)
+        self.assertIsNot(pool.acquire(), connection)
+
+    def test_failed_reset_discards_the_connection(self):
+        db = FakeDatabase()
+        pool = make_pool(db)
+        pool.reset = lambda connection: (_ for _ in ()).throw(OSError("broken"))
+        connection = pool.acquire()
+        with self.assertLogs('api.core.db.pool', 'WARNING'):
+            pool.release(connection)
+
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.stats()['idle'], 0)
+
+    def test_dead_idle_connection_is_replaced_on_checkout(self):
+        db = FakeDatabase()
+        pool = make_pool(db)
+        connection = pool.acquire()
+        pool.release(connection)
+        connection.alive = False
+
+        replacement = pool.acquire()
+        self.assertIsNot(replacement, connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.stats()['ping_failures'], 1)
+
+    def test_failed_connect_frees_its_slot(self):
+        db = FakeDatabase()
+        pool = make_pool(db, MAX_SIZE=1, TIMEOUT=0.05)
+        connect, pool.connect = pool.connect, lambda: (_ for _ in ()).throw(OSError("refused"))
+        with self.assertRaises(OSError):
+            pool.acquire()
+
+        pool.connect = connect
+        self.assertIsNotNone(pool.acquire())
+
+
+class ReapTests(SimpleTestCase):
+    def test_idle_connections_are_reaped_down_to_min_size(self):
+        db = FakeDatabase()
+        pool = make_pool(db, MIN_SIZE=1, MAX_IDLE=0.01)
+        connections = [pool.acquire() for _ in range(3)]
+        for connection in connections:
+            pool.release(connection)
+        time.sleep(0.02)
+        pool.reap()
+
+        self.assertEqual(pool.stats()['idle'], 1)
+        self.assertEqual(sum(c.closed for c in connections), 2)
+
+    def test_connections_past_their_lifetime_are_closed(self):
+        db = FakeDatabase()
+        pool = make_pool(db, MIN_SIZE=1, MAX_LIFETIME=0.01)
+        connection = pool.acquire()
+        time.sleep(0.02)
+        pool.release(connection)
+
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.stats()['idle'], 0)
+
+    def test_fill_opens_min_size_connections(self):
+        db = FakeDatabase()
+        pool = make_pool(db, MIN_SIZE=2)
+        pool.fill()
+
+        self.assertEqual(len(db.opened), 2)
+        self.assertEqual(pool.stats()['idle'], 2)
+        pool.fill()
+        self.assertEqual(len(db.opened), 2)
+
+    def test_maintenance_thread_warms_up_and_reaps(self):
+        db = FakeDatabase()
+        pool = make_pool(db, MIN_SIZE=2, MAX_IDLE=0.01, REAP_INTERVAL=0.02)
+        extra = [pool.acquire() for _ in range(3)]
+        for connection in extra:
+            pool.release(connection)
+
+        deadline = time.monotonic() + 2
+        while time.monotonic() < deadline and pool.stats()['idle'] != 2:
+            time.sleep(0.01)
+        self.assertEqual(pool.stats()['idle'], 2)
+        self.assertTrue(any(c.closed for c in db.opened))
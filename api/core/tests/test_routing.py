@@ -0,0 +1,74 @@
+import time
+from unittest import mock
+
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from api.core.db import routing
+from api.core.db.routing import begin_request, end_request, mark_write, replica_alias
+from api.core.middleware import ReadYourWritesMiddleware
+
+
+@override_settings(DATABASE_REPLICAS=['replica_0', 'replica_1'], DATABASE_REPLICA_SELECTION='round_robin')
+class ReplicaRoutingTests(SimpleTestCase):
+    def test_reads_rotate_over_the_replicas(self):
+        self.assertEqual({replica_alias() for _ in range(4)}, {'replica_0', 'replica_1'})
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas_reads_go_to_the_primary(self):
+        self.assertEqual(replica_alias(), 'default')
+
+    def test_reads_after_a_write_stay_on_the_primary(self):
+        token = begin_request()
+        try:
+            self.assertTrue(replica_alias().startswith('replica_'))
+            mark_write()
+            self.assertEqual(replica_alias(), 'default')
+        finally:
+            self.assertTrue(end_request(token))
+
+    def test_pinned_request_reads_the_primary(self):
+        token = begin_request(pinned=True)
+        try:
+            self.assertEqual(replica_alias(), 'default')
+        finally:
+            self.assertFalse(end_request(token))
+
+    @override_settings(DATABASE_REPLICA_SELECTION='least_lag', DATABASE_REPLICA_MAX_LAG=5.0)
+    def test_least_lagging_replica_in_bounds(self):
+        lags = {'replica_0': 3.0, 'replica_1': 1.0}
+        with mock.patch.object(routing._lag_monitor, 'lag', lags.get):
+            self.assertEqual(replica_alias(), 'replica_1')
+            lags.update(replica_0=None, replica_1=9.0)
+            self.assertEqual(replica_alias(), 'default')
+
+
+@override_settings(DATABASE_REPLICAS=['replica_0'], READ_YOUR_WRITES_SECONDS=5)
+class ReadYourWritesMiddlewareTests(SimpleTestCase):
+    def call(self, write=False, cookies=None):
+        seen = {}
+
+        def get_response(request):
+            if write:
+                mark_write()
+            seen['alias'] = replica_alias()
+            return HttpResponse()
+
+        request = RequestFactory().get('/user/1/')
+        request.COOKIES.update(cookies or {})
+        return ReadYourWritesMiddleware(get_response)(request), seen['alias']
+
+    def test_write_sets_the_pin(self):
+        response, _ = self.call(write=True)
+        self.assertGreater(float(response.cookies['db_pin'].value), time.time())
+
+    def test_read_sets_no_pin(self):
+        response, alias = self.call()
+        self.assertNotIn('db_pin', response.cookies)
+        self.assertEqual(alias, 'replica_0')
+
+    def test_pinned_client_reads_the_primary(self):
+        _, alias = self.call(cookies={'db_pin': str(int(time.time()) + 5)})
+        self.assertEqual(alias, 'default')
+        _, alias = self.call(cookies={'db_pin': str(int(time.time()) - 5)})
+        self.assertEqual(alias, 'replica_0')
@@ -0,0 +1,147 @@
+import gzip
+import json
+import os
+import tempfile
+from unittest import mock
+
+from django.http import Http404
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from rest_framework import permissions
+
+from api.core import schema
+from api.core.schema import VERSION_FILE, SchemaCache, urlconf_version
+from api.urls import api_info
+
+
+def schema_cache():
+    return SchemaCache(api_info, public=True, permission_classes=[permissions.AllowAny], authentication_classes=[])
+
+
+class SchemaVersionTests(SimpleTestCase):
+    def setUp(self):
+        schema._versions.clear()
+        self.addCleanup(schema._versions.clear)
+
+    def test_view_source_is_part_of_the_version(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.py', delete=False) as f:
+            f.write("FIELDS = ('login',)\n")
+        self.addCleanup(os.unlink, f.name)
+
+        with mock.patch.object(schema, '_source_files', return_value=[('api.user.serializers', f.name)]):
+            before = urlconf_version()
+            self.assertEqual(urlconf_version(), before)
+            with open(f.name, 'a') as source:
+                source.write("FIELDS += ('email',)\n")
+            schema._versions.clear()
+            self.assertNotEqual(urlconf_version(), before)
+
+    def test_views_and_their_serializers_are_hashed(self):
+        modules = dict(schema._source_files(view for _, view in schema._views(schema.get_resolver())))
+        self.assertIn('api.user.views', modules)
+        self.assertIn('api.user_v2.serializers', modules)
+        self.assertNotIn('rest_framework.views', modules)
+
+    def test_swagger_settings_are_part_of_the_version(self):
+        version = schema_cache().version
+        with override_settings(SWAGGER_SETTINGS={'DEFAULT_API_URL': 'https://api.example.com'}):
+            self.assertNotEqual(schema_cache().version, version)
+
+
+class SchemaServingTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def api_schema(self, mode):
+        return override_settings(API_SCHEMA={'MODE': mode, 'DIR': self.directory, 'MAX_AGE': 60})
+
+    def get(self, cache, path='/swagger.json', format='.json', **headers):
+        return cache.spec_view()(RequestFactory().get(path, headers=headers), format=format)
+
+    def test_prebuilt_files_are_served_without_generating(self):
+        built = schema_cache()
+        built.write(self.directory)
+        with open(os.path.join(self.directory, 'openapi.json'), 'rb') as f:
+            content = f.read()
+
+        cache = schema_cache()
+        with self.api_schema('prebuilt'), mock.patch.object(SchemaCache, 'generate') as generate:
+            response = self.get(cache)
+            gzipped = self.get(cache, **{'accept-encoding': 'gzip, br'})
+        generate.assert_not_called()
+        self.assertEqual(response.content, content)
+        self.assertEqual(json.loads(content)['info']['title'], 'User API')
+        self.assertEqual(gzip.decompress(gzipped.content), content)
+        self.assertEqual(gzipped['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=60')
+        self.assertTrue(built.is_current(self.directory))
+
+    def test_stale_prebuilt_files_are_regenerated(self):
+        schema_cache().write(self.directory)
+        with open(os.path.join(self.directory, VERSION_FILE), 'w') as f:
+            f.write('0000000000000000\n')
+
+        cache = schema_cache()
+        with self.api_schema('prebuilt'), self.assertLogs('api.core.schema', 'WARNING'):
+            response = self.get(cache)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(cache.is_current(self.directory))
+
+    def test_memo_generates_once(self):
+        cache = schema_cache()
+        with self.api_schema('memo'), mock.patch.object(SchemaCache, 'generate', return_value=b'{}') as generate:
+            self.get(cache)
+            self.get(cache, **{'accept-encoding': 'gzip'})
+            yaml = self.get(cache, '/swagger.yaml', '.yaml')
+        self.assertEqual([call.args for call in generate.call_args_list], [('json',), ('yaml',)])
+        self.assertEqual(yaml['Content-Type'], 'application/yaml')
+
+    def test_dynamic_runs_drf_yasg_on_every_request(self):
+        cache = schema_cache()
+        with self.api_schema('dynamic'), mock.patch.object(SchemaCache, 'generate') as generate:
+            responses = [self.get(cache) for _ in range(2)]
+        generate.assert_not_called()
+        for response in responses:
+            response.render()
+            self.assertEqual(json.loads(response.content)['info']['title'], 'User API')
+
+    def test_unknown_format(self):
+        with self.api_schema('memo'), self.assertRaises(Http404):
+            self.get(schema_cache(), '/swagger.xml', '.xml')
+
+    def test_ui_page_fetches_the_cached_schema(self):
+        cache = schema_cache()
+        with self.api_schema('memo'), mock.patch.object(SchemaCache, 'generate', return_value=b'{}'):
+            response = cache.ui_view('redoc')(RequestFactory().get('/redoc/', {'format': 'openapi'}))
+        self.assertEqual(response.content, b'{}')
+
+
+@override_settings(API_SCHEMA={'MODE': 'memo'})
+class SchemaETagTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = schema_cache()
+        patcher = mock.patch.object(SchemaCache, 'generate', return_value=b'{"swagger": "2.0"}')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get(self, **headers):
+        return self.cache.spec_view()(RequestFactory().get('/swagger.json', headers=headers), format='.json')
+
+    def test_matching_etag_is_not_modified(self):
+        etag = self.get()['ETag']
+
+        response = self.get(**{'if-none-match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.get(**{'if-none-match': '"other"'}).status_code, 200)
+
+    def test_each_encoding_has_its_own_etag(self):
+        etag = self.get()['ETag']
+        gzip_etag = self.get(**{'accept-encoding': 'gzip'})['ETag']
+
+        self.assertEqual(gzip_etag, etag[:-1] + '-gzip"')
+        self.assertEqual(self.get(**{'accept-encoding': 'gzip', 'if-none-match': gzip_etag}).status_code, 304)
+        self.assertEqual(self.get(**{'accept-encoding': 'gzip', 'if-none-match': etag}).status_code, 200)
+        self.assertEqual(self.get(**{'accept-encoding': 'gzip'})['Vary'], 'Accept-Encoding')
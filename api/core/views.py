@@ -0,0 +1,10 @@
+from django.http import HttpResponse
+from django.views.decorators.http import require_GET
+
+from .metrics import render
+
+
+@require_GET
+def metrics(request):
+    """Metrics of all worker processes in the Prometheus text format"""
+    return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
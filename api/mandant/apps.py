@@ -1,6 +1,18 @@
 from django.apps import AppConfig
+from django.core.exceptions import ImproperlyConfigured
 
 
 class MandantConfig(AppConfig):
-    default_auto_field = "django.db.models.BigAutoField"
-    name = "mandant"
+    # Mandants (tenants): request resolution, shard routing and per mandant limits
+    name = "api.mandant"
+
+    def ready(self):
+        from django.conf import settings
+        options = settings.MANDANT
+        for alias in {options['DEFAULT_SHARD'], *options['SHARDS'].values()}:
+            if alias not in settings.DATABASES:
+                raise ImproperlyConfigured(f"MANDANT shard {alias!r} is not in DATABASES (DB_SHARDS)")
+        for mandant, limits in options['LIMITS'].items():
+            unknown = [name for name in limits if not name.startswith('USER_') or not hasattr(settings, name)]
+            if unknown:
+                raise ImproperlyConfigured(f"MANDANT_LIMITS of {mandant!r} names unknown limits: {', '.join(unknown)}")
@@ -0,0 +1,67 @@
+"""
+The mandant (tenant) of the current request or command.
+
+A mandant is known by its name. ``settings.MANDANT['SHARDS']`` maps it to
+the database alias holding its users, all other mandants live on the
+``DEFAULT_SHARD``. ``activate`` routes the queries of a block to that shard
+(``api.core.db.routing.use_shard``), so the services and caches need no
+mandant argument. ``mandant_limit`` reads a ``USER_*`` limit with the
+mandant's override from ``settings.MANDANT['LIMITS']``.
+"""
+import re
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import NamedTuple, Optional
+
+from django.conf import settings
+
+from api.core.db.routing import use_shard
+
+# Letters, digits, - and _, as in a path segment
+NAME_PATTERN = re.compile(r'^[a-z0-9][a-z0-9_-]{0,62}$')
+
+
+class InvalidMandant(ValueError):
+    """Raised for a malformed mandant name"""
+
+
+class Mandant(NamedTuple):
+    name: str
+    shard: str
+
+
+_current: ContextVar[Optional[Mandant]] = ContextVar('mandant', default=None)
+
+
+def get_mandant(name: str) -> Mandant:
+    """The mandant called ``name`` (case-insensitive) with its shard"""
+    name = name.strip().lower()
+    if not NAME_PATTERN.match(name):
+        raise InvalidMandant(f"Invalid mandant: {name}")
+    options = settings.MANDANT
+    return Mandant(name, options['SHARDS'].get(name, options['DEFAULT_SHARD']))
+
+
+def current_mandant() -> Optional[Mandant]:
+    return _current.get()
+
+
+@contextmanager
+def activate(mandant: Optional[Mandant]):
+    """Run the block as ``mandant``, on its shard (``None``: no mandant, the default shard)"""
+    token = _current.set(mandant)
+    try:
+        with use_shard(mandant.shard if mandant else settings.MANDANT['DEFAULT_SHARD']):
+            yield mandant
+    finally:
+        _current.reset(token)
+
+
+def mandant_limit(name: str) -> int:
+    """The setting ``name`` (e.g. ``USER_BULK_MAX_ITEMS``) for the current mandant"""
+    mandant = _current.get()
+    if mandant is not None:
+        overrides = settings.MANDANT['LIMITS'].get(mandant.name, {})
+        if name in overrides:
+            return overrides[name]
+    return getattr(settings, name)
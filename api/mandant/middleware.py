@@ -0,0 +1,101 @@
+import re
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from rest_framework import status
+
+from api.core.aio import json_response
+from .context import InvalidMandant, activate, get_mandant
+
+# /m/<mandant>/<rest of the path>
+PATH_PREFIX = re.compile(r'^/m/(?P<mandant>[^/]+)(?P<path>/.*)$')
+
+# Served without a mandant even when MANDANT['REQUIRED'] is set
+OPTIONAL_PATHS = ('/metrics', '/swagger', '/redoc')
+
+
+class MandantMiddleware:
+    """
+    Runs each request as its mandant, on the mandant's shard. The mandant
+    comes from a ``/m/<mandant>/`` path prefix or the ``MANDANT['HEADER']``
+    header. The prefix is stripped from ``path_info``, so both forms reach the
+    same routes, while links built from the request path keep it.
+
+    Streamed responses read the database after the view returned, their
+    content is produced as the mandant as well.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        try:
+            mandant = self._resolve(request)
+        except InvalidMandant as e:
+            return json_response({'error': str(e)}, status.HTTP_400_BAD_REQUEST)
+        with activate(mandant):
+            response = self.get_response(request)
+        return self._scope_stream(response, mandant)
+
+    async def __acall__(self, request):
+        try:
+            mandant = self._resolve(request)
+        except InvalidMandant as e:
+            return json_response({'error': str(e)}, status.HTTP_400_BAD_REQUEST)
+        with activate(mandant):
+            response = await self.get_response(request)
+        return self._scope_stream(response, mandant)
+
+    @staticmethod
+    def _resolve(request):
+        options = settings.MANDANT
+        name = request.headers.get(options['HEADER'])
+        match = PATH_PREFIX.match(request.path_info)
+        if match:
+            if name and name.strip().lower() != match['mandant'].lower():
+                raise InvalidMandant("Mandant of the path and the header differ")
+            name = match['mandant']
+            request.path_info = match['path']
+        if not name and options['REQUIRED'] and not request.path_info.startswith(OPTIONAL_PATHS):
+            raise InvalidMandant(f"Mandant required, in the {options['HEADER']} header or as /m/<mandant>/")
+        request.mandant = get_mandant(name) if name else None
+        return request.mandant
+
+    @staticmethod
+    def _scope_stream(response, mandant):
+        if not response.streaming:
+            return response
+        if response.is_async:
+            response.streaming_content = _ascoped(mandant, response.streaming_content)
+        else:
+            response.streaming_content = _scoped(mandant, response.streaming_content)
+        return response
+
+
+def _scoped(mandant, content):
+    iterator = iter(content)
+    while True:
+        with activate(mandant):
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+        yield chunk
+
+
+async def _ascoped(mandant, content):
+    iterator = content.__aiter__()
+    while True:
+        with activate(mandant):
+            try:
+                chunk = await iterator.__anext__()
+            except StopAsyncIteration:
+                return
+        yield chunk
@@ -1,3 +1,89 @@
-from django.test import TestCase
+from django.conf import settings
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
 
-# Create your tests here.
+from api.core.db.routing import replica_alias, shard_alias
+from .context import InvalidMandant, activate, current_mandant, get_mandant, mandant_limit
+from .middleware import MandantMiddleware
+
+MANDANT = {
+    'HEADER': 'X-Mandant',
+    'REQUIRED': False,
+    'SHARDS': {'acme': 'shard_1'},
+    'DEFAULT_SHARD': 'default',
+    'LIMITS': {'acme': {'USER_BULK_MAX_ITEMS': 5}},
+}
+
+
+@override_settings(MANDANT=MANDANT)
+class MandantTests(SimpleTestCase):
+    def test_mapped_mandant_gets_its_shard(self):
+        self.assertEqual(get_mandant(' ACME ').shard, 'shard_1')
+        self.assertEqual(get_mandant('other').shard, 'default')
+
+    def test_malformed_name_is_rejected(self):
+        for name in ('', '-acme', 'ac/me', 'a' * 64):
+            with self.subTest(name=name), self.assertRaises(InvalidMandant):
+                get_mandant(name)
+
+    def test_activate_routes_to_the_shard(self):
+        with activate(get_mandant('acme')):
+            self.assertEqual(shard_alias(), 'shard_1')
+            self.assertEqual(current_mandant().name, 'acme')
+            with activate(None):
+                self.assertEqual(shard_alias(), 'default')
+            self.assertEqual(shard_alias(), 'shard_1')
+        self.assertEqual(shard_alias(), 'default')
+        self.assertIsNone(current_mandant())
+
+    @override_settings(DATABASE_REPLICAS=['replica_0'])
+    def test_other_shards_read_their_primary(self):
+        self.assertEqual(replica_alias(), 'replica_0')
+        with activate(get_mandant('acme')):
+            self.assertEqual(replica_alias(), 'shard_1')
+
+    def test_limits_are_overridden_per_mandant(self):
+        with activate(get_mandant('acme')):
+            self.assertEqual(mandant_limit('USER_BULK_MAX_ITEMS'), 5)
+        with activate(get_mandant('other')):
+            self.assertEqual(mandant_limit('USER_BULK_MAX_ITEMS'), settings.USER_BULK_MAX_ITEMS)
+
+
+@override_settings(MANDANT=MANDANT)
+class MandantMiddlewareTests(SimpleTestCase):
+    def call(self, path, required=False, **headers):
+        seen = {}
+
+        def get_response(request):
+            seen.update(shard=shard_alias(), path_info=request.path_info, mandant=request.mandant)
+            return HttpResponse()
+
+        with override_settings(MANDANT={**MANDANT, 'REQUIRED': required}):
+            response = MandantMiddleware(get_response)(RequestFactory().get(path, headers=headers))
+        return response, seen
+
+    def test_path_prefix_selects_the_shard(self):
+        response, seen = self.call('/m/acme/user/1/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(seen['shard'], 'shard_1')
+        self.assertEqual(seen['path_info'], '/user/1/')
+
+    def test_header_selects_the_shard(self):
+        _, seen = self.call('/user/1/', x_mandant='acme')
+        self.assertEqual((seen['shard'], seen['mandant'].name), ('shard_1', 'acme'))
+
+    def test_no_mandant_uses_the_default_shard(self):
+        _, seen = self.call('/user/1/')
+        self.assertEqual((seen['shard'], seen['mandant']), ('default', None))
+
+    def test_path_and_header_must_agree(self):
+        response, seen = self.call('/m/acme/user/1/', x_mandant='other')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(seen, {})
+
+    def test_required_mandant(self):
+        response, _ = self.call('/user/1/', required=True)
+        self.assertEqual(response.status_code, 400)
+        _, seen = self.call('/metrics', required=True)
+        self.assertEqual(seen['shard'], 'default')
@@ -11,7 +11,8 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
+import json
 import os
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -24,8 +25,6 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = config('SECRET_KEY')
 
-print("DEBUG value from .env:", config('DEBUG'))
-
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = config('DEBUG', default=False, cast=bool)
 
@@ -35,7 +34,9 @@ ALLOWED_HOSTS = []
 INSTALLED_APPS = [
     "django.contrib.staticfiles",  # Required for serving swagger files
     "rest_framework", 
+    "api.core.apps.CoreConfig",  # shared helpers and management commands
     "api.user.apps.UserConfig",  # user app
+    "api.mandant.apps.MandantConfig",  # mandants (tenants) and their shards
     "drf_yasg",  # For Swagger/OpenAPI docs
 ]
 
@@ -44,8 +45,12 @@ MIGRATION_MODULES = {
 }
 
 MIDDLEWARE = [
+    "api.core.middleware.MetricsMiddleware",
+    "api.core.middleware.CompressionMiddleware",
+    "api.mandant.middleware.MandantMiddleware",  # before CommonMiddleware, it strips the /m/<mandant> prefix
     "django.middleware.security.SecurityMiddleware",  # Keep for security
     "django.middleware.common.CommonMiddleware",  # Keep for basic HTTP handling
+    "api.core.middleware.ReadYourWritesMiddleware",
     # "django.middleware.csrf.CsrfViewMiddleware",
 ]
 
@@ -73,12 +78,24 @@ WSGI_APPLICATION = "api.wsgi.application"
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.mysql',
+        'ENGINE': 'api.core.db.backends.mysql',
         'NAME': config('DB_NAME'),
         'USER': config('DB_USER'),
         'PASSWORD': config('DB_PASSWORD'),
         'HOST': config('DB_HOST'),
         'PORT': config('DB_PORT'),
+        # Requests give their connection back to the pool, keep CONN_MAX_AGE at 0.
+        # Size workers * MAX_SIZE below the server's max_connections.
+        'POOL': {
+            'MIN_SIZE': config('DB_POOL_MIN_SIZE', default=2, cast=int),
+            'MAX_SIZE': config('DB_POOL_MAX_SIZE', default=10, cast=int),
+            'TIMEOUT': config('DB_POOL_TIMEOUT', default=10.0, cast=float),
+            'MAX_LIFETIME': config('DB_POOL_MAX_LIFETIME', default=1800.0, cast=float),
+            'MAX_IDLE': config('DB_POOL_MAX_IDLE', default=300.0, cast=float),
+            'PRE_PING': config('DB_POOL_PRE_PING', default=True, cast=bool),
+            # Seconds between the background reaping and refilling to MIN_SIZE, 0 disables it
+            'REAP_INTERVAL': config('DB_POOL_REAP_INTERVAL', default=30.0, cast=float),
+        },
     }
     # "default": {
     #     "ENGINE": "django.db.backends.sqlite3",
@@ -86,6 +103,42 @@ DATABASES = {
     # }
 }
 
+# Read replicas as comma separated host[:port] list, same credentials as the primary
+DATABASE_REPLICAS = []
+for index, replica in enumerate(config('DB_REPLICA_HOSTS', default='', cast=Csv())):
+    host, _, port = replica.partition(':')
+    alias = f'replica_{index}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+# Shards as comma separated alias=host[:port][/name] list, same credentials as
+# the primary. Each holds the user table of the mandants MANDANT['SHARDS'] maps to it.
+for shard in config('DB_SHARDS', default='', cast=Csv()):
+    alias, _, location = shard.partition('=')
+    address, _, name = location.partition('/')
+    host, _, port = address.partition(':')
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'NAME': name or DATABASES['default']['NAME'],
+    }
+
+DATABASE_ROUTERS = ['api.core.db.routing.ReplicaRouter']
+# 'round_robin' or 'least_lag'
+DATABASE_REPLICA_SELECTION = config('DB_REPLICA_SELECTION', default='round_robin')
+# least_lag skips replicas further behind than this (seconds)
+DATABASE_REPLICA_MAX_LAG = config('DB_REPLICA_MAX_LAG', default=5.0, cast=float)
+DATABASE_REPLICA_LAG_CHECK_INTERVAL = config('DB_REPLICA_LAG_CHECK_INTERVAL', default=2.0, cast=float)
+# Clients read from the primary for this long after they wrote
+READ_YOUR_WRITES_SECONDS = config('READ_YOUR_WRITES_SECONDS', default=5, cast=int)
+READ_YOUR_WRITES_COOKIE = 'db_pin'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -126,6 +179,30 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [],
     'DEFAULT_PERMISSION_CLASSES': [],
     'UNAUTHENTICATED_USER': None,
+    # orjson with a stdlib fallback, the same JSON as DRF's renderer and parser
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.core.fastjson.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.core.fastjson.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+}
+
+# Response compression (api.core.middleware.CompressionMiddleware): the first
+# of ENCODINGS with the highest q-value in Accept-Encoding, for bodies of at
+# least MIN_SIZE bytes. br needs the brotli package, zstd the zstandard one
+# (or Python 3.14), codings without their package are skipped.
+COMPRESSION = {
+    'ENCODINGS': config('COMPRESSION_ENCODINGS', default='zstd,br,gzip', cast=Csv()),
+    'MIN_SIZE': config('COMPRESSION_MIN_SIZE', default=1024, cast=int),
+    'LEVELS': {
+        'gzip': config('COMPRESSION_GZIP_LEVEL', default=6, cast=int),
+        'br': config('COMPRESSION_BROTLI_QUALITY', default=4, cast=int),
+        'zstd': config('COMPRESSION_ZSTD_LEVEL', default=3, cast=int),
+    },
 }
 
 # Update SWAGGER_SETTINGS
@@ -142,10 +219,19 @@ REDOC_SETTINGS = {
    'LAZY_RENDERING': True,
 }
 
+# Schema of /swagger.json, /swagger/ and /redoc/. 'prebuilt' serves the files
+# `manage.py build_schema` writes to DIR at deploy time (and generates the
+# schema once per process if they are missing or stale), 'memo' generates it
+# once per process and URLconf, 'dynamic' on every request.
+API_SCHEMA = {
+    'MODE': config('API_SCHEMA_MODE', default='prebuilt'),
+    'DIR': config('API_SCHEMA_DIR', default=str(BASE_DIR / 'openapi')),
+    'MAX_AGE': config('API_SCHEMA_MAX_AGE', default=0, cast=int),
+}
+
 # Logging Configuration
+# Created with the first record written to a log file
 LOG_DIR = BASE_DIR / 'logs'
-if not os.path.exists(LOG_DIR):
-    os.makedirs(LOG_DIR)
 
 LOGGING = {
     'version': 1,
@@ -171,15 +257,18 @@ LOGGING = {
             'formatter': 'simple',
         },
         'file': {
-            'class': 'logging.FileHandler',
+            'class': 'api.core.log.LazyFileHandler',
             'filename': os.path.join(LOG_DIR, 'user_v2.log'),
             'formatter': 'verbose',
             'level': 'ERROR',
         },
         'mail_admins': {
-            'class': 'django.utils.log.AdminEmailHandler',
+            'class': 'api.core.log.ThrottledAdminEmailHandler',
             'formatter': 'email',
             'level': 'FATAL',
+            # One mail per error fingerprint and interval, at most max_mails per interval
+            'interval': config('LOG_MAIL_INTERVAL', default=300, cast=int),
+            'max_mails': config('LOG_MAIL_MAX', default=10, cast=int),
         }
     },
     'loggers': {
@@ -198,4 +287,99 @@ EMAIL_PORT = config('EMAIL_PORT', default=25, cast=int)
 EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
 EMAIL_USE_TLS = config('EMAIL_USE_TLS', default=False, cast=bool)
+EMAIL_TIMEOUT = config('EMAIL_TIMEOUT', default=10, cast=int)
 ADMINS = [('Admin', 'admin@foo.de')]
+
+# The handlers of these loggers run on a background thread behind a bounded
+# queue. When it is full, 'drop' discards records, 'block' waits up to
+# BLOCK_TIMEOUT seconds first.
+LOG_QUEUE = {
+    'LOGGERS': ['api.user_v2'],
+    'MAX_SIZE': config('LOG_QUEUE_MAX_SIZE', default=10000, cast=int),
+    'POLICY': config('LOG_QUEUE_POLICY', default='drop'),
+    'BLOCK_TIMEOUT': config('LOG_QUEUE_BLOCK_TIMEOUT', default=0.05, cast=float),
+}
+
+# Keyset pagination of the user list endpoints
+USER_LIST_PAGE_SIZE = config('USER_LIST_PAGE_SIZE', default=50, cast=int)
+USER_LIST_MAX_PAGE_SIZE = config('USER_LIST_MAX_PAGE_SIZE', default=500, cast=int)
+
+# Rows fetched per round trip from the server-side cursor of the user exports
+USER_EXPORT_CHUNK_SIZE = config('USER_EXPORT_CHUNK_SIZE', default=2000, cast=int)
+
+# Bulk create: largest accepted request and rows per multi-row INSERT
+USER_BULK_MAX_ITEMS = config('USER_BULK_MAX_ITEMS', default=10000, cast=int)
+USER_BULK_CHUNK_SIZE = config('USER_BULK_CHUNK_SIZE', default=500, cast=int)
+
+# Offline import (manage.py import_users): records per transaction and checkpoint,
+# rows per multi-row INSERT and records per validation task of a worker process
+USER_IMPORT_BATCH_SIZE = config('USER_IMPORT_BATCH_SIZE', default=5000, cast=int)
+USER_IMPORT_INSERT_SIZE = config('USER_IMPORT_INSERT_SIZE', default=1000, cast=int)
+USER_IMPORT_CHUNK_SIZE = config('USER_IMPORT_CHUNK_SIZE', default=1000, cast=int)
+
+# v2 change feed (GET /user/v2/changes/): entries per page, how far behind now
+# the feed ends so writes in flight commit first, and how many days tombstones
+# (and with them the watermarks) are kept, 0 keeps them forever
+USER_CHANGES_PAGE_SIZE = config('USER_CHANGES_PAGE_SIZE', default=200, cast=int)
+USER_CHANGES_MAX_PAGE_SIZE = config('USER_CHANGES_MAX_PAGE_SIZE', default=2000, cast=int)
+USER_CHANGES_SETTLE_SECONDS = config('USER_CHANGES_SETTLE_SECONDS', default=5, cast=int)
+USER_CHANGES_RETENTION_DAYS = config('USER_CHANGES_RETENTION_DAYS', default=30, cast=int)
+
+# Batch update/delete: most ids per request and per UPDATE ... WHERE id IN (...)
+USER_BATCH_MAX_IDS = config('USER_BATCH_MAX_IDS', default=10000, cast=int)
+USER_BATCH_CHUNK_SIZE = config('USER_BATCH_CHUNK_SIZE', default=1000, cast=int)
+
+# Read-through cache for single-user lookups. The LRU tier lives in each
+# worker, SHARED_ALIAS optionally names a CACHES alias shared by all workers.
+# Writes only clear the writing worker's LRU, the others can serve a row up
+# to TTL seconds (plus the replication lag) stale, a client's reads after its
+# own write bypass the cache. SHARED_TTL applies to rows read from the primary,
+# rows read from a replica are shared for TTL seconds.
+USER_CACHE = {
+    'MAX_ENTRIES': config('USER_CACHE_MAX_ENTRIES', default=10000, cast=int),  # 0 disables the LRU tier
+    'TTL': config('USER_CACHE_TTL', default=30, cast=int),
+    'NEGATIVE_TTL': config('USER_CACHE_NEGATIVE_TTL', default=5, cast=int),
+    'SHARED_ALIAS': config('USER_CACHE_SHARED_ALIAS', default=''),
+    'SHARED_TTL': config('USER_CACHE_SHARED_TTL', default=300, cast=int),
+}
+
+# Bloom filter of the existing logins in front of the duplicate check of
+# user creation. Each worker builds it from the table in the background and
+# rebuilds it every REBUILD_INTERVAL seconds, dropping deleted logins.
+USER_LOGIN_FILTER = {
+    'ENABLED': config('USER_LOGIN_FILTER_ENABLED', default=True, cast=bool),
+    'CAPACITY': config('USER_LOGIN_FILTER_CAPACITY', default=1000000, cast=int),  # grows with the table
+    'ERROR_RATE': config('USER_LOGIN_FILTER_ERROR_RATE', default=0.01, cast=float),
+    'REBUILD_INTERVAL': config('USER_LOGIN_FILTER_REBUILD_INTERVAL', default=3600, cast=int),
+}
+
+# Group commit of v2 user creates: concurrent POST /user/v2/ in one worker
+# process wait up to MAX_DELAY seconds for up to MAX_BATCH creates and share
+# one multi-row INSERT and commit. Only threads of a process batch together
+# (threaded WSGI workers or the ASYNC_DB_MAX_WORKERS executor of asgi mode).
+USER_CREATE_COALESCING = {
+    'ENABLED': config('USER_CREATE_COALESCING_ENABLED', default=False, cast=bool),
+    'MAX_BATCH': config('USER_CREATE_COALESCING_MAX_BATCH', default=64, cast=int),
+    'MAX_DELAY': config('USER_CREATE_COALESCING_MAX_DELAY', default=0.002, cast=float),
+}
+
+# 'wsgi' serves the sync DRF views, 'asgi' routes the user endpoints to the
+# async views, whose DB work runs on a bounded thread pool
+SERVER_MODE = config('SERVER_MODE', default='wsgi')
+ASYNC_DB_MAX_WORKERS = config('ASYNC_DB_MAX_WORKERS', default=10, cast=int)
+
+# Mandant (tenant) of a request, from the HEADER or a /m/<mandant>/ path prefix.
+# SHARDS maps mandants to database aliases (DB_SHARDS), the others live on
+# DEFAULT_SHARD. LIMITS overrides the USER_* limits per mandant, as JSON like
+# {"acme": {"USER_BULK_MAX_ITEMS": 50000}}.
+MANDANT = {
+    'HEADER': config('MANDANT_HEADER', default='X-Mandant'),
+    'REQUIRED': config('MANDANT_REQUIRED', default=False, cast=bool),
+    'SHARDS': dict(pair.split('=', 1) for pair in config('MANDANT_SHARDS', default='', cast=Csv())),
+    'DEFAULT_SHARD': config('MANDANT_DEFAULT_SHARD', default='default'),
+    'LIMITS': config('MANDANT_LIMITS', default='{}', cast=json.loads),
+}
+
+# Per-process metrics files merged by /metrics, empty it on (re)start
+METRICS_DIR = config('METRICS_DIR', default='')
+METRICS_FLUSH_INTERVAL = config('METRICS_FLUSH_INTERVAL', default=5.0, cast=float)
@@ -0,0 +1,29 @@
+"""
+Settings of the test suite: the project settings on SQLite without replicas.
+Run with ``python manage.py test --settings=api.test_settings``.
+"""
+import os
+
+os.environ.setdefault('SECRET_KEY', 'test')
+os.environ.setdefault('DEBUG', 'False')
+for name in ('DB_NAME', 'DB_USER', 'DB_PASSWORD', 'DB_HOST', 'DB_PORT'):
+    os.environ.setdefault(name, '')
+
+from api.settings import *  # noqa: E402,F401,F403
+from api.settings import BASE_DIR, MANDANT, USER_CACHE, USER_LOGIN_FILTER  # noqa: E402
+
+ALLOWED_HOSTS = ['*']
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': str(BASE_DIR / 'test.sqlite3'),
+    }
+}
+DATABASE_REPLICAS = []
+MANDANT = {**MANDANT, 'SHARDS': {}, 'DEFAULT_SHARD': 'default', 'REQUIRED': False}
+
+# The filter is rebuilt on a thread of its own, which would read the test
+# database outside the test's transaction
+USER_LOGIN_FILTER = {**USER_LOGIN_FILTER, 'ENABLED': False}
+USER_CACHE = {**USER_CACHE, 'SHARED_ALIAS': ''}
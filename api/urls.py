@@ -16,22 +16,25 @@ Including another URLconf
 """
 
 from django.urls import path, include
-from rest_framework.routers import DefaultRouter
-from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 from django.conf import settings
 from rest_framework import permissions
+from api.core.schema import SchemaCache
+from api.core.views import metrics
 
-# Create schema view for Swagger documentation
-schema_view = get_schema_view(
-    openapi.Info(
-        title="User API",
-        default_version='v1',
-        description="API documentation for User Management",
-        terms_of_service="https://www.google.com/policies/terms/",
-        contact=openapi.Contact(email="contact@example.com"),
-        license=openapi.License(name="BSD License"),
-    ),
+api_info = openapi.Info(
+    title="User API",
+    default_version='v1',
+    description="API documentation for User Management",
+    terms_of_service="https://www.google.com/policies/terms/",
+    contact=openapi.Contact(email="contact@example.com"),
+    license=openapi.License(name="BSD License"),
+)
+
+# Swagger documentation, serves the prebuilt (manage.py build_schema) or
+# memoized schema, see settings.API_SCHEMA
+schema = SchemaCache(
+    api_info,
     public=True,
     permission_classes=[permissions.AllowAny],
     authentication_classes=[],  # No authentication
@@ -40,8 +43,9 @@ schema_view = get_schema_view(
 urlpatterns = [
     path('user/', include('api.user.urls')),
     path('user/v2/', include('api.user_v2.urls')),
+    path('metrics', metrics, name='metrics'),
     # Swagger documentation URLs
-    path('swagger<format>/', schema_view.without_ui(cache_timeout=0), name='schema-json'),
-    path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
-    path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
+    path('swagger<format>/', schema.spec_view(), name='schema-json'),
+    path('swagger/', schema.ui_view('swagger'), name='schema-swagger-ui'),
+    path('redoc/', schema.ui_view('redoc'), name='schema-redoc'),
 ]
@@ -0,0 +1,135 @@
+"""
+Async-native counterparts of UserListView and UserView, routed instead of
+them when settings.SERVER_MODE is 'asgi'. They validate and render with the
+same serializers, and the DB work runs on the bounded executor of api.core.aio.
+"""
+from django.http import HttpResponse
+from django.views import View
+from rest_framework import status
+from api.core.aio import json_response, parse_json_body
+from api.core.filtering import InvalidFilter
+from api.core.logins import DuplicateLogin
+from api.core.pagination import InvalidCursor, KeysetPaginator
+from api.core.sparse import InvalidFields, sparse_fields
+from .serializers import UserReadSerializer, UserCreateSerializer, UserUpdateSerializer, represent_user, represent_users
+from .services import AsyncUserService
+from .filters import USER_FILTERS
+from .views import USER_ORDERING_TYPES, USER_ORDERINGS
+
+
+def _invalid_json():
+    return json_response({'error': 'Invalid input data', 'detail': 'Malformed JSON'}, status.HTTP_400_BAD_REQUEST)
+
+
+def _not_found():
+    return json_response({'error': 'User not found'}, status.HTTP_404_NOT_FOUND)
+
+
+def _duplicate_login():
+    return json_response({'error': 'User already exists'}, status.HTTP_409_CONFLICT)
+
+
+def _database_error(e):
+    return json_response({'error': 'Database error', 'detail': str(e)}, status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class AsyncUserListView(View):
+    async def get(self, request):
+        """List filtered users, one keyset page at a time"""
+        try:
+            paginator = KeysetPaginator(request, USER_ORDERINGS, key_types=USER_ORDERING_TYPES)
+            filters = USER_FILTERS.parse(request.GET)
+            fields = sparse_fields(request.GET, UserReadSerializer)
+        except (InvalidCursor, InvalidFilter, InvalidFields) as e:
+            return json_response({'error': str(e)}, status.HTTP_400_BAD_REQUEST)
+
+        try:
+            users = await AsyncUserService.get_users_page(
+                paginator.fields, paginator.fetch_size, key=paginator.key,
+                backwards=paginator.backwards, filters=filters, fields=fields
+            )
+            users = paginator.paginate(users)
+            return json_response(paginator.get_response_data(represent_users(users, fields)))
+        except Exception as e:
+            return _database_error(e)
+
+    async def post(self, request):
+        """Create a new user"""
+        data = parse_json_body(request)
+        if data is None:
+            return _invalid_json()
+        serializer = UserCreateSerializer(data=data)
+        if not serializer.is_valid():
+            return json_response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+        try:
+            user = await AsyncUserService.create_user(serializer.validated_data)
+        except DuplicateLogin:
+            return _duplicate_login()
+        except Exception as e:
+            return _database_error(e)
+        return json_response(represent_user(user), status.HTTP_201_CREATED)
+
+
+class AsyncUserView(View):
+    async def get(self, request, user_id):
+        """Get a specific user by ID"""
+        try:
+            fields = sparse_fields(request.GET, UserReadSerializer)
+        except InvalidFields as e:
+            return json_response({'error': str(e)}, status.HTTP_400_BAD_REQUEST)
+        try:
+            user = await AsyncUserService.get_user(user_id)
+        except Exception as e:
+            return _database_error(e)
+        if not user:
+            return _not_found()
+        return json_response(represent_user(user, fields))
+
+    async def put(self, request, user_id):
+        """Full update of a user"""
+        data = parse_json_body(request)
+        if data is None:
+            return _invalid_json()
+        serializer = UserUpdateSerializer(data=data)
+        if not serializer.is_valid():
+            return json_response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+        try:
+            user = await AsyncUserService.update_user(user_id, serializer.validated_data)
+        except DuplicateLogin:
+            return _duplicate_login()
+        except Exception as e:
+            return _database_error(e)
+        if not user:
+            return _not_found()
+        return json_response(represent_user(user))
+
+    async def patch(self, request, user_id):
+        """Partial update of a user"""
+        data = parse_json_body(request)
+        if data is None:
+            return _invalid_json()
+        serializer = UserReadSerializer(data=data, partial=True)
+        if not serializer.is_valid():
+            return json_response(
+                {'error': 'Invalid input data', 'detail': serializer.errors},
+                status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            user = await AsyncUserService.update_user(user_id, serializer.validated_data)
+        except DuplicateLogin:
+            return _duplicate_login()
+        except Exception as e:
+            return _database_error(e)
+        if not user:
+            return _not_found()
+        return json_response(represent_user(user))
+
+    async def delete(self, request, user_id):
+        """Delete a user"""
+        try:
+            deleted = await AsyncUserService.delete_user(user_id)
+        except Exception as e:
+            return _database_error(e)
+        if deleted:
+            return HttpResponse(status=status.HTTP_204_NO_CONTENT)
+        return _not_found()
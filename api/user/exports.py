@@ -0,0 +1,14 @@
+from typing import Any, Dict, Iterator, List
+from .serializers import UserReadSerializer, represent_user
+from .services import UserService
+
+
+def export_fieldnames() -> List[str]:
+    """Columns of an export, in the order the JSON API emits them"""
+    return [name for name, field in UserReadSerializer().fields.items() if not field.write_only]
+
+
+def iter_export_records(chunk_size: int = 2000) -> Iterator[Dict[str, Any]]:
+    """Yield every active user rendered exactly like the JSON API (test_bool as ja/nein)"""
+    for user in UserService.iter_active_users(chunk_size):
+        yield represent_user(user)
@@ -1,5 +1,8 @@
 # This file can be empty since we're using raw SQL queries
 
+from datetime import datetime
+from typing import NamedTuple, Optional
+
 from django.db import models
 
 class User(models.Model):
@@ -17,3 +20,17 @@ class User(models.Model):
     class Meta:
         managed = False
         db_table = 'user'
+
+
+class UserRow(NamedTuple):
+    """
+    A user as returned by UserService, one tuple per row in the column order
+    of its SELECTs. Much cheaper to build than a ``User`` model instance.
+    """
+    id: int
+    login: str
+    first_name: str
+    last_name: str
+    created_at: datetime
+    is_active: bool
+    test_bool: Optional[bool]
@@ -1,6 +1,8 @@
 from rest_framework import serializers
+from api.core.compiled import CompiledListSerializer, CompiledSerializerMixin, compile_serializer
+from api.core.serializer_fields import JaNeinToBooleanField
 
-class UserBaseSerializer(serializers.Serializer):
+class UserBaseSerializer(CompiledSerializerMixin, serializers.Serializer):
     """Base serializer with common fields"""
     id = serializers.IntegerField(read_only=True)
     login = serializers.EmailField(max_length=100, required=False)
@@ -8,16 +10,7 @@ class UserBaseSerializer(serializers.Serializer):
     last_name = serializers.CharField(max_length=100, required=False)
     created_at = serializers.DateTimeField(read_only=True)
     is_active = serializers.BooleanField(read_only=True, default=True)
-    test_bool = serializers.CharField(required=False, allow_null=True)
-
-    def validate_test_bool(self, value):
-        if value is None:
-            return None
-        if value.lower() == 'ja':
-            return True
-        if value.lower() == 'nein':
-            return False
-        raise serializers.ValidationError("test_bool must be 'ja' or 'nein'")
+    test_bool = JaNeinToBooleanField(required=False, allow_null=True)
 
 class UserCreateSerializer(UserBaseSerializer):
     """Serializer for user creation - all fields required except defaults"""
@@ -35,11 +28,15 @@ class UserUpdateSerializer(UserBaseSerializer):
 
 class UserReadSerializer(UserBaseSerializer):
     """Serializer for reading user data - no password"""
-    pass
-
-    def to_representation(self, instance):
-        """Convert boolean back to ja/nein for test_bool field"""
-        data = super().to_representation(instance)
-        if 'test_bool' in data and data['test_bool'] is not None:
-            data['test_bool'] = 'ja' if data['test_bool'] else 'nein'
-        return data
\ No newline at end of file
+
+    class Meta:
+        list_serializer_class = CompiledListSerializer
+
+
+def represent_user(user, fields=None) -> dict:
+    """``UserReadSerializer(user).data`` of a UserRow as a plain dict, only ``fields`` if given"""
+    return compile_serializer(UserReadSerializer).to_representation(user, fields)
+
+
+def represent_users(users, fields=None) -> list:
+    return compile_serializer(UserReadSerializer).represent_many(users, fields)
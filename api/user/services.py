@@ -1,34 +1,100 @@
-from django.db import connection
+from django.db import IntegrityError, transaction
 from django.contrib.auth.hashers import make_password
 from django.utils import timezone
-from typing import List, Optional
-from .models import User
+from typing import Any, Iterator, List, Optional, Sequence, Set, Tuple
+from api.core.aio import run_db
+from api.core.cache import build_cache
+from api.core.db.routing import primary, reader, shard_alias, writer
+from api.core.filtering import Condition, where_clause
+from api.core.logins import DuplicateLogin, is_duplicate_key, login_filter, normalize
+from api.core.metrics import instrument_service
+from api.core.batching import chunked, in_placeholders, unique, values_placeholders
+from api.core.pagination import keyset_sql
+from api.core.sparse import select_list
+from api.core.streaming import stream_rows
+from .models import UserRow
 
+user_cache = build_cache('user:v1')
+
+@instrument_service
 class UserService:
     @staticmethod
-    def create_user(user_data: dict) -> User:
-        with connection.cursor() as cursor:
-            cursor.execute("""
+    def create_user(user_data: dict) -> UserRow:
+        """Insert a user, raising DuplicateLogin when the login is taken"""
+        if UserService.login_exists(user_data['login']):
+            raise DuplicateLogin(user_data['login'])
+        try:
+            with writer().cursor() as cursor:
+                cursor.execute("""
+                    INSERT INTO user (
+                        login, password, first_name, last_name, 
+                        createdAt, isActive, testBool
+                    )
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                    RETURNING id, login, first_name, last_name, createdAt, isActive, testBool
+                """, UserService._insert_values(user_data, timezone.now()))
+                user = UserService._create_user_from_row(cursor.fetchone())
+        except IntegrityError as e:
+            # A concurrent create of the same login won
+            if is_duplicate_key(e):
+                raise DuplicateLogin(user_data['login']) from e
+            raise
+        login_filter.add(user.login)
+        # Drop a cached 404 for the new id
+        user_cache.invalidate_on_commit(user.id)
+        return user
+
+    @staticmethod
+    def login_exists(login: str) -> bool:
+        """Look up the login on the primary, unless the login filter rules it out"""
+        if not login_filter.might_exist(login):
+            return False
+        with primary().cursor() as cursor:
+            cursor.execute("SELECT 1 FROM user WHERE login = %s", [login])
+            return cursor.fetchone() is not None
+
+    @staticmethod
+    def existing_logins(logins: List[str], chunk_size: int = 1000) -> Set[str]:
+        """The normalized logins of ``logins`` already taken, looked up on the primary"""
+        taken = set()
+        with primary().cursor() as cursor:
+            for chunk in chunked(unique(logins), chunk_size):
+                cursor.execute(f"SELECT login FROM user WHERE login IN ({in_placeholders(len(chunk))})", chunk)
+                taken.update(normalize(row[0]) for row in cursor.fetchall())
+        return taken
+
+    @staticmethod
+    def create_users(users_data: List[dict]) -> List[UserRow]:
+        """Insert all users with one multi-row INSERT, returned in input order"""
+        if not users_data:
+            return []
+
+        now = timezone.now()
+        values = []
+        for user_data in users_data:
+            values.extend(UserService._insert_values(user_data, now))
+
+        with writer().cursor() as cursor:
+            cursor.execute(f"""
                 INSERT INTO user (
                     login, password, first_name, last_name, 
                     createdAt, isActive, testBool
                 )
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                VALUES {values_placeholders(len(users_data), 7)}
                 RETURNING id, login, first_name, last_name, createdAt, isActive, testBool
-            """, [
-                user_data['login'],
-                user_data['password'],
-                user_data['first_name'],
-                user_data['last_name'],
-                timezone.now(),
-                user_data.get('is_active', True),
-                user_data.get('test_bool')
-            ])
-            return UserService._create_user_from_row(cursor.fetchone())
-
-    @staticmethod
-    def get_user(user_id: int) -> Optional[User]:
-        with connection.cursor() as cursor:
+            """, values)
+            users = list(map(UserRow._make, cursor.fetchall()))
+        login_filter.add(*[user.login for user in users])
+        user_cache.invalidate_on_commit(*[user.id for user in users])
+        return users
+
+    @staticmethod
+    def get_user(user_id: int) -> Optional[UserRow]:
+        return user_cache.get(user_id, UserService._fetch_user)
+
+    @staticmethod
+    def _fetch_user(user_id: int) -> Optional[UserRow]:
+        with reader().cursor() as cursor:
             cursor.execute("""
                 SELECT id, login, first_name, last_name, createdAt, isActive, testBool 
                 FROM user WHERE id = %s AND isActive = 1
@@ -37,55 +103,179 @@ class UserService:
             return UserService._create_user_from_row(row) if row else None
 
     @staticmethod
-    def get_all_users() -> List[User]:
-        with connection.cursor() as cursor:
-            cursor.execute("""
-                SELECT id, login, first_name, last_name, createdAt, isActive, testBool 
-                FROM user WHERE isActive = 1
-            """)
-            return [UserService._create_user_from_row(row) for row in cursor.fetchall()]
+    def iter_active_users(chunk_size: int = 2000) -> Iterator[UserRow]:
+        """Yield every active user from a server-side cursor, ordered by id"""
+        rows = stream_rows(reader(), """
+            SELECT id, login, first_name, last_name, createdAt, isActive, testBool 
+            FROM user WHERE isActive = 1
+            ORDER BY id
+        """, chunk_size=chunk_size)
+        for row in rows:
+            yield UserService._create_user_from_row(row)
+
+    # Sort columns of the keyset paginated list, by ordering name
+    ORDERINGS = {
+        'id': 'id',
+        'created_at': 'createdAt',
+        'login': 'login',
+        'first_name': 'first_name',
+        'last_name': 'last_name',
+    }
+    ACTIVE = Condition('isActive = 1', [])
+    # Column of each UserRow field, in row order
+    COLUMNS = {
+        'id': 'id',
+        'login': 'login',
+        'first_name': 'first_name',
+        'last_name': 'last_name',
+        'created_at': 'createdAt',
+        'is_active': 'isActive',
+        'test_bool': 'testBool',
+    }
 
     @staticmethod
-    def update_user(user_id: int, user_data: dict) -> Optional[User]:
-        fields = []
-        values = []
-        for key, value in user_data.items():
-            if key in ['login', 'password', 'first_name', 'last_name', 'test_bool']:
-                fields.append(f"{key if key != 'test_bool' else 'testBool'} = %s")
-                values.append(value)
+    def get_users_page(ordering: Sequence[Tuple[str, bool]] = (('id', False),), limit: int = 50,
+                       key: Optional[Sequence[Any]] = None, backwards: bool = False,
+                       filters: Optional[Condition] = None,
+                       fields: Optional[Sequence[str]] = None) -> List[UserRow]:
+        """
+        Fetch one page of users seeking past ``key`` in ``ordering``, a list of
+        ``(name, descending)``. ``filters`` defaults to the active users.
+        Only the columns of ``fields`` and the sort key are read if given, the
+        others are ``None``.
+        """
+        columns = [UserService.ORDERINGS[name] for name, _ in ordering]
+        seek, order_by, params = keyset_sql(columns, key, [desc for _, desc in ordering], backwards)
+        where = where_clause(filters or UserService.ACTIVE, Condition(seek, params))
+        select = select_list(UserService.COLUMNS, fields, required=[name for name, _ in ordering])
+        with reader().cursor() as cursor:
+            cursor.execute(f"""
+                SELECT {select}
+                FROM user {where.sql}
+                ORDER BY {order_by}
+                LIMIT %s
+            """, where.params + [limit])
+            return list(map(UserRow._make, cursor.fetchall()))
 
+    @staticmethod
+    def update_user(user_id: int, user_data: dict) -> Optional[UserRow]:
+        fields, values = UserService._update_assignments(user_data)
         if not fields:
             return None
 
-        with connection.cursor() as cursor:
-            values.append(user_id)
-            cursor.execute(f"""
-                UPDATE user 
-                SET {', '.join(fields)}
-                WHERE id = %s AND isActive = 1
-                RETURNING id, login, first_name, last_name, createdAt, isActive, testBool
-            """, values)
-            row = cursor.fetchone()
-            return UserService._create_user_from_row(row) if row else None
+        try:
+            with writer().cursor() as cursor:
+                values.append(user_id)
+                cursor.execute(f"""
+                    UPDATE user 
+                    SET {', '.join(fields)}
+                    WHERE id = %s AND isActive = 1
+                    RETURNING id, login, first_name, last_name, createdAt, isActive, testBool
+                """, values)
+                row = cursor.fetchone()
+        except IntegrityError as e:
+            if is_duplicate_key(e):
+                raise DuplicateLogin(user_data.get('login')) from e
+            raise
+        user_cache.invalidate_on_commit(user_id)
+        if row and 'login' in user_data:
+            login_filter.add(row[1])
+        return UserService._create_user_from_row(row) if row else None
 
     @staticmethod
     def delete_user(user_id: int) -> bool:
-        with connection.cursor() as cursor:
+        with writer().cursor() as cursor:
             cursor.execute("""
                 UPDATE user 
                 SET isActive = 0 
                 WHERE id = %s AND isActive = 1
             """, [user_id])
-            return cursor.rowcount > 0
-
-    @staticmethod
-    def _create_user_from_row(row) -> User:
-        return User(
-            id=row[0],
-            login=row[1],
-            first_name=row[2],
-            last_name=row[3],
-            created_at=row[4],
-            is_active=row[5],
-            test_bool=row[6]
-        ) 
\ No newline at end of file
+            deleted = cursor.rowcount > 0
+        user_cache.invalidate_on_commit(user_id)
+        return deleted
+
+    @staticmethod
+    def update_users(user_ids: List[int], user_data: dict, chunk_size: int = 1000) -> List[int]:
+        """Apply the same changes to all given active users, returning the updated ids"""
+        fields, values = UserService._update_assignments(user_data)
+        if not fields:
+            return []
+
+        updated = []
+        with transaction.atomic(using=shard_alias()), writer().cursor() as cursor:
+            for chunk in chunked(unique(user_ids), chunk_size):
+                cursor.execute(f"""
+                    UPDATE user 
+                    SET {', '.join(fields)}
+                    WHERE id IN ({in_placeholders(len(chunk))}) AND isActive = 1
+                    RETURNING id
+                """, values + chunk)
+                updated.extend(row[0] for row in cursor.fetchall())
+            user_cache.invalidate_on_commit(*updated)
+        return updated
+
+    @staticmethod
+    def delete_users(user_ids: List[int], chunk_size: int = 1000) -> List[int]:
+        """Soft delete all given active users, returning the deactivated ids"""
+        deleted = []
+        with transaction.atomic(using=shard_alias()), writer().cursor() as cursor:
+            for chunk in chunked(unique(user_ids), chunk_size):
+                cursor.execute(f"""
+                    UPDATE user 
+                    SET isActive = 0 
+                    WHERE id IN ({in_placeholders(len(chunk))}) AND isActive = 1
+                    RETURNING id
+                """, chunk)
+                deleted.extend(row[0] for row in cursor.fetchall())
+            user_cache.invalidate_on_commit(*deleted)
+        return deleted
+
+    @staticmethod
+    def _update_assignments(user_data: dict):
+        fields = []
+        values = []
+        for key, value in user_data.items():
+            if key in ['login', 'password', 'first_name', 'last_name', 'test_bool']:
+                fields.append(f"{key if key != 'test_bool' else 'testBool'} = %s")
+                values.append(value)
+        return fields, values
+
+    @staticmethod
+    def _insert_values(user_data: dict, created_at) -> list:
+        return [
+            user_data['login'],
+            user_data['password'],
+            user_data['first_name'],
+            user_data['last_name'],
+            created_at,
+            user_data.get('is_active', True),
+            user_data.get('test_bool')
+        ]
+
+    @staticmethod
+    def _create_user_from_row(row) -> UserRow:
+        return UserRow._make(row)
+
+
+class AsyncUserService:
+    """Awaitable UserService for the async views, DB work runs on the bounded executor"""
+
+    @staticmethod
+    async def create_user(user_data: dict) -> UserRow:
+        return await run_db(UserService.create_user, user_data)
+
+    @staticmethod
+    async def get_user(user_id: int) -> Optional[UserRow]:
+        return await run_db(UserService.get_user, user_id)
+
+    @staticmethod
+    async def get_users_page(*args, **kwargs) -> List[UserRow]:
+        return await run_db(UserService.get_users_page, *args, **kwargs)
+
+    @staticmethod
+    async def update_user(user_id: int, user_data: dict) -> Optional[UserRow]:
+        return await run_db(UserService.update_user, user_id, user_data)
+
+    @staticmethod
+    async def delete_user(user_id: int) -> bool:
+        return await run_db(UserService.delete_user, user_id)
@@ -1,3 +1,259 @@
-from django.test import TestCase
+from datetime import datetime, timezone
+from unittest import mock
 
-# Create your tests here.
+from django.http import QueryDict
+from django.test import SimpleTestCase, override_settings
+from rest_framework import serializers
+
+from api.core.filtering import Condition
+from api.core.pagination import encode_cursor
+from api.core.testing import UserTableTestCase
+from .filters import USER_FILTERS
+from .models import UserRow
+from .serializers import UserReadSerializer, represent_user, represent_users
+from .services import UserService
+
+
+def user_data(login, **fields):
+    return {'login': login, 'password': 'Secret123!', 'first_name': 'Anna', 'last_name': 'Müller', **fields}
+
+
+class RepresentUserTests(SimpleTestCase):
+    row = UserRow(7, 'anna@example.com', 'Anna', 'Müller', datetime(2024, 3, 1, 12, tzinfo=timezone.utc), 1, None)
+
+    def drf(self, row):
+        # The regular DRF path, without the compiled converter
+        return serializers.Serializer.to_representation(UserReadSerializer(), row)
+
+    def test_row_matches_drf(self):
+        self.assertEqual(represent_user(self.row), self.drf(self.row))
+        self.assertEqual(represent_user(self.row)['is_active'], True)
+
+    def test_rows_match_drf(self):
+        rows = [self.row, self.row._replace(id=8, is_active=0, test_bool=True), self.row._replace(test_bool=0)]
+        self.assertEqual(represent_users(rows), [self.drf(row) for row in rows])
+        self.assertEqual(UserReadSerializer(rows, many=True).data, [self.drf(row) for row in rows])
+
+    def test_sparse_fields(self):
+        self.assertEqual(represent_user(self.row, ('id', 'login')), {'id': 7, 'login': 'anna@example.com'})
+
+
+class UserTestCase(UserTableTestCase):
+    def create_user(self, login, **fields):
+        response = self.client.post('/user/', user_data(login, **fields), content_type='application/json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()
+
+
+class UserViewTests(UserTestCase):
+    def test_create_and_get(self):
+        user = self.create_user('anna@example.com', test_bool='ja')
+        response = self.client.get(f"/user/{user['id']}/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), user)
+        self.assertEqual(user['test_bool'], 'ja')
+        self.assertNotIn('password', user)
+
+    def test_duplicate_login_is_a_conflict(self):
+        self.create_user('anna@example.com')
+        response = self.client.post('/user/', user_data('anna@example.com'), content_type='application/json')
+        self.assertEqual(response.status_code, 409)
+
+    @override_settings(DATABASE_REPLICAS=['replica_0'])
+    def test_taken_login_does_not_pin_the_client(self):
+        self.create_user('anna@example.com')
+
+        response = self.client.post('/user/', user_data('anna@example.com'), content_type='application/json')
+        self.assertEqual(response.status_code, 409)
+        # The lookup reads the primary, nothing was written
+        self.assertNotIn('db_pin', response.cookies)
+
+    def test_patch_to_a_taken_login_is_a_conflict(self):
+        self.create_user('anna@example.com')
+        ben = self.create_user('ben@example.com')
+
+        response = self.client.patch(f"/user/{ben['id']}/", {'login': 'anna@example.com'},
+                                     content_type='application/json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.client.get(f"/user/{ben['id']}/").json()['login'], 'ben@example.com')
+
+    def test_read_after_update(self):
+        user = self.create_user('anna@example.com')
+        self.client.get(f"/user/{user['id']}/")
+        self.client.patch(f"/user/{user['id']}/", {'first_name': 'Greta'}, content_type='application/json')
+
+        self.assertEqual(self.client.get(f"/user/{user['id']}/").json()['first_name'], 'Greta')
+
+    def test_list_pages(self):
+        ids = [self.create_user(f'user{i}@example.com')['id'] for i in range(3)]
+
+        first = self.client.get('/user/?limit=2').json()
+        self.assertEqual([user['id'] for user in first['results']], ids[:2])
+        self.assertIsNone(first['previous'])
+        second = self.client.get(first['next']).json()
+        self.assertEqual([user['id'] for user in second['results']], ids[2:])
+        self.assertIsNone(second['next'])
+        self.assertEqual([user['id'] for user in self.client.get(second['previous']).json()['results']], ids[:2])
+
+    def test_descending_list(self):
+        ids = [self.create_user(f'user{i}@example.com')['id'] for i in range(3)]
+
+        page = self.client.get('/user/?ordering=-created_at&limit=2').json()
+        self.assertEqual([user['id'] for user in page['results']], ids[:0:-1])
+        page = self.client.get(page['next']).json()
+        self.assertEqual([user['id'] for user in page['results']], ids[:1])
+
+    def test_tampered_cursor_is_rejected(self):
+        for cursor in ('garbage', encode_cursor({'o': 'id', 'k': [1, 2]}), encode_cursor({'o': 'password', 'k': [1]}),
+                       encode_cursor({'o': 'id', 'k': ['1 OR 1=1']}), encode_cursor({'o': 'login', 'k': [1, 1]})):
+            with self.subTest(cursor=cursor):
+                response = self.client.get('/user/', {'cursor': cursor})
+                self.assertEqual(response.status_code, 400)
+
+    def test_cursor_value_of_the_wrong_type(self):
+        response = self.client.get('/user/', {'cursor': encode_cursor({'o': 'created_at', 'k': ['yesterday', 1]})})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Invalid cursor'})
+
+
+class UserFilterTests(UserTestCase):
+    def setUp(self):
+        super().setUp()
+        self.anna = self.create_user('anna@example.com', test_bool='ja')
+        self.ben = self.create_user('ben@example.com', first_name='Ben', last_name='Weber', test_bool='nein')
+        self.carl = self.create_user('carl@example.com', first_name='Carl', last_name='Becker')
+
+    def ids(self, **params):
+        response = self.client.get('/user/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return [user['id'] for user in response.json()['results']]
+
+    def test_condition(self):
+        self.assertEqual(
+            USER_FILTERS.parse(QueryDict('test_bool=ja&created_at__gte=2024-01-01T00:00:00Z&last_name__startswith=M_')),
+            Condition("testBool = %s AND createdAt >= %s AND last_name LIKE %s ESCAPE '!' AND isActive = %s",
+                      [True, datetime(2024, 1, 1, tzinfo=timezone.utc), 'M!_%', True])
+        )
+
+    def test_text_filters(self):
+        anna, ben, carl = self.anna['id'], self.ben['id'], self.carl['id']
+        for params, ids in (({'login': 'ben@example.com'}, [ben]), ({'login__startswith': 'c'}, [carl]),
+                            ({'first_name': 'Anna'}, [anna]), ({'first_name__startswith': 'B'}, [ben]),
+                            ({'last_name': 'Becker'}, [carl]), ({'last_name__startswith': 'Mü'}, [anna]),
+                            ({'search': 'be'}, [ben, carl]), ({'search': 'Bec', 'first_name': 'Ben'}, [])):
+            with self.subTest(params=params):
+                self.assertEqual(self.ids(**params), ids)
+
+    def test_prefix_wildcards_are_literal(self):
+        underscore = self.create_user('a_b@example.com')['id']
+        bang = self.create_user('a!b@example.com')['id']
+        self.create_user('axb@example.com')
+
+        self.assertEqual(self.ids(login__startswith='a_'), [underscore])
+        self.assertEqual(self.ids(login__startswith='a!'), [bang])
+        self.assertEqual(self.ids(search='a%'), [])
+
+    def test_test_bool(self):
+        self.assertEqual(self.ids(test_bool='ja'), [self.anna['id']])
+        self.assertEqual(self.ids(test_bool='nein'), [self.ben['id']])
+
+    def test_created_at_range(self):
+        all_ids = [self.anna['id'], self.ben['id'], self.carl['id']]
+        self.assertEqual(self.ids(created_at__gte='2000-01-01T00:00:00Z'), all_ids)
+        self.assertEqual(self.ids(created_at__lt='2000-01-01T00:00:00Z'), [])
+        self.assertEqual(self.ids(created_at__lte=self.carl['created_at']), all_ids)
+
+    def test_inactive_users_only_on_request(self):
+        self.assertEqual(self.client.delete(f"/user/{self.ben['id']}/").status_code, 204)
+
+        self.assertEqual(self.ids(), [self.anna['id'], self.carl['id']])
+        self.assertEqual(self.ids(is_active='false'), [self.ben['id']])
+
+    def test_invalid_filters(self):
+        for params in ({'test_bool': 'vielleicht'}, {'is_active': 'maybe'}, {'created_at__gt': 'yesterday'},
+                       {'login__gt': 'a'}, {'search': 'x' * 256}):
+            with self.subTest(params=params):
+                response = self.client.get('/user/', params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+
+
+@override_settings(USER_BULK_CHUNK_SIZE=2)
+class BulkCreateTests(UserTableTestCase):
+    def bulk(self, items, mode=None):
+        path = '/user/bulk/' if mode is None else f'/user/bulk/?mode={mode}'
+        return self.client.post(path, items, content_type='application/json')
+
+    def statuses(self, response):
+        return [result['status'] for result in response.json()['results']]
+
+    def logins(self):
+        return [user['login'] for user in self.client.get('/user/?limit=100').json()['results']]
+
+    def test_chunked_inserts(self):
+        items = [user_data(f'user{i}@example.com') for i in range(5)]
+        with mock.patch.object(UserService, 'create_users', wraps=UserService.create_users) as create_users:
+            response = self.bulk(items)
+
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.json()['created'], 5)
+        self.assertEqual([len(call.args[0]) for call in create_users.call_args_list], [2, 2, 1])
+        self.assertEqual([result['data']['login'] for result in response.json()['results']],
+                         [item['login'] for item in items])
+        self.assertEqual(self.logins(), [item['login'] for item in items])
+
+    def test_atomic_invalid_item_creates_nothing(self):
+        response = self.bulk([user_data('anna@example.com'), user_data('no email')])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.statuses(response), [424, 400])
+        self.assertIn('login', response.json()['results'][1]['errors'])
+        self.assertEqual(self.logins(), [])
+
+    def test_atomic_taken_login_creates_nothing(self):
+        self.bulk([user_data('anna@example.com')])
+        response = self.bulk([user_data('ben@example.com'), user_data('anna@example.com')])
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.statuses(response), [424, 409])
+        self.assertEqual(self.logins(), ['anna@example.com'])
+
+    def test_partial_creates_the_valid_items(self):
+        self.bulk([user_data('anna@example.com')])
+        response = self.bulk([user_data('ben@example.com'), user_data('no email'), user_data('anna@example.com'),
+                              user_data('Ben@example.com')], mode='partial')
+
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.json()['created'], 1)
+        self.assertEqual(self.statuses(response), [201, 400, 409, 409])
+        self.assertEqual(response.json()['results'][3]['errors'], {'error': 'Duplicate login in the request'})
+        self.assertEqual(self.logins(), ['anna@example.com', 'ben@example.com'])
+
+    def test_partial_retries_a_failing_chunk_row_by_row(self):
+        self.bulk([user_data('anna@example.com')])
+        # Taken after the login check, the chunk's INSERT fails on the unique key
+        with mock.patch.object(UserService, 'existing_logins', return_value=set()):
+            response = self.bulk([user_data('ben@example.com'), user_data('anna@example.com'),
+                                  user_data('carl@example.com')], mode='partial')
+
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(self.statuses(response), [201, 409, 201])
+        self.assertEqual(self.logins(), ['anna@example.com', 'ben@example.com', 'carl@example.com'])
+
+    def test_atomic_login_taken_after_the_check_rolls_back(self):
+        self.bulk([user_data('anna@example.com')])
+        # The check misses the login, the lookup after the rollback finds it
+        with mock.patch.object(UserService, 'existing_logins', side_effect=[set(), {'anna@example.com'}]):
+            response = self.bulk([user_data('ben@example.com'), user_data('anna@example.com')])
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.statuses(response), [424, 409])
+        self.assertEqual(self.logins(), ['anna@example.com'])
+
+    @override_settings(USER_BULK_MAX_ITEMS=2)
+    def test_rejected_requests(self):
+        self.assertEqual(self.bulk([user_data('anna@example.com')], mode='sometimes').status_code, 400)
+        self.assertEqual(self.bulk(user_data('anna@example.com')).status_code, 400)
+        self.assertEqual(self.bulk([user_data(f'user{i}@example.com') for i in range(3)]).status_code, 400)
+        self.assertEqual(self.logins(), [])
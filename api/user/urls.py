@@ -1,7 +1,18 @@
+from django.conf import settings
 from django.urls import path
-from .views import UserView, UserListView
+from .views import (
+    UserView, UserListView, UserBulkCreateView, UserBatchDeleteView, UserBatchUpdateView, UserExportView
+)
+
+if settings.SERVER_MODE == 'asgi':
+    # Async-native list and detail views, DB work on a bounded executor
+    from .async_views import AsyncUserListView as UserListView, AsyncUserView as UserView
 
 urlpatterns = [
     path('', UserListView.as_view(), name='user-list'),  # Only GET (list), POST (create)
+    path('bulk/', UserBulkCreateView.as_view(), name='user-bulk-create'),  # POST, list of users
+    path('batch/update/', UserBatchUpdateView.as_view(), name='user-batch-update'),  # PATCH, ids + fields
+    path('batch/delete/', UserBatchDeleteView.as_view(), name='user-batch-delete'),  # POST, ids
+    path('export/', UserExportView.as_view(), name='user-export'),  # GET, streamed NDJSON or CSV
     path('<int:user_id>/', UserView.as_view(), name='user-detail'),  # GET, PUT, PATCH, DELETE for single user
-] 
\ No newline at end of file
+]
@@ -1,28 +1,104 @@
+from datetime import datetime
+
 from django.shortcuts import render
+from django.conf import settings
+from django.http import StreamingHttpResponse
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.db import connection
 from django.contrib.auth.hashers import make_password
-from .serializers import UserReadSerializer, UserCreateSerializer, UserUpdateSerializer
+from .serializers import UserReadSerializer, UserCreateSerializer, UserUpdateSerializer, represent_user, represent_users
 from django.utils import timezone
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
+from api.core.bulk import MODE_ATOMIC, MODES, bulk_create
+from api.core.filtering import InvalidFilter
+from api.core.logins import DuplicateLogin
+from api.core.pagination import InvalidCursor, KeysetPaginator
+from api.core.serializer import IdListSerializer
+from api.core.sparse import InvalidFields, sparse_fields, openapi_parameters as sparse_parameters
+from api.core.streaming import CSVRenderer, NDJSONRenderer, export_chunks
+from api.mandant.context import mandant_limit
+from .exports import export_fieldnames, iter_export_records
+from .filters import USER_FILTERS
 from .services import UserService
 from .models import User
 
 # Create your views here.
 
+# Sort value of a user for each ordering offered by the list endpoint
+USER_ORDERINGS = {
+    'id': lambda user: user.id,
+    'created_at': lambda user: user.created_at,
+    'login': lambda user: user.login,
+    'first_name': lambda user: user.first_name,
+    'last_name': lambda user: user.last_name,
+}
+
+# Type of the sort values, checked on the values of a cursor
+USER_ORDERING_TYPES = {
+    'id': int,
+    'created_at': datetime,
+    'login': str,
+    'first_name': str,
+    'last_name': str,
+}
+
 class UserListView(APIView):
     @swagger_auto_schema(
-        operation_description="List all active users",
-        responses={200: UserReadSerializer(many=True)}
+        operation_description="List users (active ones unless is_active is given), filtered and sorted, one keyset page at a time",
+        manual_parameters=[
+            openapi.Parameter(
+                'cursor', openapi.IN_QUERY,
+                description="Opaque cursor taken from a previous next/previous link",
+                type=openapi.TYPE_STRING
+            ),
+            openapi.Parameter(
+                'limit', openapi.IN_QUERY,
+                description="Page size, capped by the server",
+                type=openapi.TYPE_INTEGER
+            ),
+            openapi.Parameter(
+                'ordering', openapi.IN_QUERY,
+                description="Comma separated sort fields (id, created_at, login, first_name, last_name), "
+                            "- for descending, e.g. last_name,-created_at (ignored when a cursor is given)",
+                type=openapi.TYPE_STRING
+            ),
+            *USER_FILTERS.openapi_parameters(),
+            *sparse_parameters(UserReadSerializer)
+        ],
+        responses={
+            200: openapi.Response(
+                description="One page of users",
+                schema=openapi.Schema(
+                    type=openapi.TYPE_OBJECT,
+                    properties={
+                        'next': openapi.Schema(type=openapi.TYPE_STRING, format=openapi.FORMAT_URI, x_nullable=True),
+                        'previous': openapi.Schema(type=openapi.TYPE_STRING, format=openapi.FORMAT_URI, x_nullable=True),
+                        'results': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_OBJECT)),
+                    }
+                )
+            ),
+            400: "Invalid cursor, ordering, filter or fields"
+        }
     )
     def get(self, request):
-        """List all active users"""
+        """List filtered users, one keyset page at a time"""
+        try:
+            paginator = KeysetPaginator(request, USER_ORDERINGS, key_types=USER_ORDERING_TYPES)
+            filters = USER_FILTERS.parse(request.query_params)
+            fields = sparse_fields(request.query_params, UserReadSerializer)
+        except (InvalidCursor, InvalidFilter, InvalidFields) as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
         try:
-            users = UserService.get_all_users()
-            return Response(UserReadSerializer(users, many=True).data)
+            users = UserService.get_users_page(
+                paginator.fields, paginator.fetch_size, key=paginator.key,
+                backwards=paginator.backwards, filters=filters, fields=fields
+            )
+            users = paginator.paginate(users)
+            return Response(paginator.get_response_data(represent_users(users, fields)))
         except Exception as e:
             return Response(
                 {'error': 'Database error', 'detail': str(e)},
@@ -48,17 +124,145 @@ class UserListView(APIView):
         """Create a new user"""
         serializer = UserCreateSerializer(data=request.data)
         if serializer.is_valid():
-            user = UserService.create_user(serializer.validated_data)
-            return Response(UserReadSerializer(user).data, status=status.HTTP_201_CREATED)
+            try:
+                user = UserService.create_user(serializer.validated_data)
+            except DuplicateLogin:
+                return Response({'error': 'User already exists'}, status=status.HTTP_409_CONFLICT)
+            return Response(represent_user(user), status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+class UserBulkCreateView(APIView):
+    @swagger_auto_schema(
+        request_body=UserCreateSerializer(many=True),
+        operation_description="Create many users with chunked multi-row inserts in one transaction",
+        manual_parameters=[
+            openapi.Parameter(
+                'mode', openapi.IN_QUERY,
+                description="atomic (default): all or nothing, partial: create every valid item",
+                type=openapi.TYPE_STRING,
+                enum=list(MODES)
+            )
+        ],
+        responses={
+            201: "All users created, one result per item",
+            207: "Some items failed, one result per item",
+            400: "Invalid input data, nothing was created",
+            409: "Atomic mode: logins repeated or already taken, nothing was created"
+        }
+    )
+    def post(self, request):
+        """Create many users at once"""
+        mode = request.query_params.get('mode', MODE_ATOMIC)
+        if mode not in MODES:
+            return Response({'error': f"mode must be one of {', '.join(MODES)}"}, status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(request.data, list):
+            return Response({'error': 'Expected a list of users'}, status=status.HTTP_400_BAD_REQUEST)
+        max_items = mandant_limit('USER_BULK_MAX_ITEMS')
+        if len(request.data) > max_items:
+            return Response(
+                {'error': f"At most {max_items} users per request"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            http_status, body = bulk_create(
+                request.data, UserCreateSerializer, UserService.create_users,
+                lambda users: represent_users(users),
+                mode=mode, chunk_size=settings.USER_BULK_CHUNK_SIZE,
+                existing_logins=UserService.existing_logins
+            )
+            return Response(body, status=http_status)
+        except Exception as e:
+            return Response(
+                {'error': 'Database error', 'detail': str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+class UserBatchDeleteView(APIView):
+    @swagger_auto_schema(
+        request_body=IdListSerializer,
+        operation_description="Deactivate many users by id",
+        responses={
+            200: openapi.Response(
+                description="Ids of the users that were deactivated",
+                examples={"application/json": {"affected_ids": [1, 2, 3]}}
+            ),
+            400: "Invalid input data"
+        }
+    )
+    def post(self, request):
+        """Deactivate many users by id"""
+        serializer = IdListSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            user_ids = UserService.delete_users(serializer.validated_data['ids'], settings.USER_BATCH_CHUNK_SIZE)
+            return Response({'affected_ids': user_ids})
+        except Exception as e:
+            return Response(
+                {'error': 'Database error', 'detail': str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+class UserBatchUpdateView(APIView):
+    @swagger_auto_schema(
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            required=['ids', 'patch'],
+            properties={
+                'ids': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_INTEGER)),
+                'patch': openapi.Schema(
+                    type=openapi.TYPE_OBJECT,
+                    description="Fields to set on every user, as for PATCH /user/<id>/"
+                ),
+            }
+        ),
+        operation_description="Apply the same partial update to many users",
+        responses={
+            200: openapi.Response(
+                description="Ids of the users that were updated",
+                examples={"application/json": {"affected_ids": [1, 2, 3]}}
+            ),
+            400: "Invalid input data"
+        }
+    )
+    def patch(self, request):
+        """Apply the same partial update to many users"""
+        ids = IdListSerializer(data=request.data)
+        patch = UserUpdateSerializer(data=request.data.get('patch'), partial=True)
+        ids_valid = ids.is_valid()
+        if not patch.is_valid() or not ids_valid:
+            errors = dict(ids.errors)
+            if patch.errors:
+                errors['patch'] = patch.errors
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+        if not patch.validated_data:
+            return Response({'error': 'No valid fields to update'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            user_ids = UserService.update_users(
+                ids.validated_data['ids'], patch.validated_data, settings.USER_BATCH_CHUNK_SIZE
+            )
+            return Response({'affected_ids': user_ids})
+        except Exception as e:
+            return Response(
+                {'error': 'Database error', 'detail': str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
 class UserView(APIView):
     @swagger_auto_schema(
         operation_description="Get a specific user by ID",
-        responses={200: UserReadSerializer}
+        manual_parameters=sparse_parameters(UserReadSerializer),
+        responses={200: UserReadSerializer, 400: "Unknown fields"}
     )
     def get(self, request, user_id):
         """Get a specific user by ID"""
+        try:
+            fields = sparse_fields(request.query_params, UserReadSerializer)
+        except InvalidFields as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         try:
             user = UserService.get_user(user_id)
             if not user:
@@ -66,7 +270,7 @@ class UserView(APIView):
                     {'error': 'User not found'},
                     status=status.HTTP_404_NOT_FOUND
                 )
-            return Response(UserReadSerializer(user).data)
+            return Response(represent_user(user, fields))
         except Exception as e:
             return Response(
                 {'error': 'Database error', 'detail': str(e)},
@@ -87,20 +291,27 @@ class UserView(APIView):
         responses={
             200: UserReadSerializer,
             400: "Invalid input data",
-            404: "User not found"
+            404: "User not found",
+            409: openapi.Response(
+                description="Conflict",
+                examples={"application/json": {"error": "User already exists"}}
+            )
         }
     )
     def put(self, request, user_id):
         """Full update of a user"""
         serializer = UserUpdateSerializer(data=request.data)
         if serializer.is_valid():
-            user = UserService.update_user(user_id, serializer.validated_data)
+            try:
+                user = UserService.update_user(user_id, serializer.validated_data)
+            except DuplicateLogin:
+                return Response({'error': 'User already exists'}, status=status.HTTP_409_CONFLICT)
             if not user:
                 return Response(
                     {'error': 'User not found'},
                     status=status.HTTP_404_NOT_FOUND
                 )
-            return Response(UserReadSerializer(user).data)
+            return Response(represent_user(user))
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     @swagger_auto_schema(
@@ -117,7 +328,11 @@ class UserView(APIView):
         responses={
             200: UserReadSerializer,
             400: "Invalid input data",
-            404: "User not found"
+            404: "User not found",
+            409: openapi.Response(
+                description="Conflict",
+                examples={"application/json": {"error": "User already exists"}}
+            )
         }
     )
     def patch(self, request, user_id):
@@ -136,7 +351,9 @@ class UserView(APIView):
                     {'error': 'User not found'},
                     status=status.HTTP_404_NOT_FOUND
                 )
-            return Response(UserReadSerializer(user).data)
+            return Response(represent_user(user))
+        except DuplicateLogin:
+            return Response({'error': 'User already exists'}, status=status.HTTP_409_CONFLICT)
         except Exception as e:
             return Response(
                 {'error': 'Database error', 'detail': str(e)},
@@ -172,3 +389,22 @@ class UserView(APIView):
                 {'error': 'Database error', 'detail': str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+
+class UserExportView(APIView):
+    renderer_classes = [NDJSONRenderer, CSVRenderer]
+
+    @swagger_auto_schema(
+        operation_description="Stream all active users as NDJSON (default) or CSV, "
+                              "chosen by the Accept header or ?format=ndjson|csv",
+        responses={200: "Stream of users, one per line"}
+    )
+    def get(self, request):
+        """Stream all active users"""
+        export_format = request.accepted_renderer.format
+        records = iter_export_records(settings.USER_EXPORT_CHUNK_SIZE)
+        response = StreamingHttpResponse(
+            export_chunks(export_format, records, export_fieldnames()),
+            content_type=request.accepted_renderer.media_type
+        )
+        response['Content-Disposition'] = f'attachment; filename="users.{export_format}"'
+        return response
@@ -0,0 +1,141 @@
+"""
+Async-native counterparts of user_list and user_detail, routed instead of
+them when settings.SERVER_MODE is 'asgi'. They validate and render with the
+same serializers, and the DB work runs on the bounded executor of api.core.aio.
+"""
+from django.http import HttpResponse
+from django.views import View
+from rest_framework import status
+from api.core.aio import json_response, parse_json_body
+from api.core.conditional import not_modified, page_etag, row_etag, set_validators
+from api.core.filtering import InvalidFilter
+from api.core.logins import DuplicateLogin
+from api.core.pagination import InvalidCursor, KeysetPaginator
+from api.core.sparse import InvalidFields, sparse_fields
+from .serializers import UserV2Serializer
+from .services import AsyncUserV2Service
+from .logger import logger
+from .filters import USER_FILTERS
+from .views import USER_ORDERING_TYPES, USER_ORDERINGS
+
+
+def _invalid_json():
+    return json_response({'error': 'Malformed JSON'}, status.HTTP_400_BAD_REQUEST)
+
+
+def _not_found(user_id):
+    logger.info("User not found: %s", user_id)
+    return json_response({'error': 'User not found'}, status.HTTP_404_NOT_FOUND)
+
+
+def _duplicate_login():
+    return json_response({'error': 'User already exists'}, status.HTTP_409_CONFLICT)
+
+
+def _internal_error(view, e):
+    # CancelledError (client disconnect) is no Exception and passes through
+    logger.error("Error in %s view: %s", view, str(e), exc_info=True)
+    return json_response({'error': 'Internal server error'}, status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class AsyncUserListView(View):
+    async def get(self, request):
+        """List filtered users, one keyset page at a time"""
+        try:
+            paginator = KeysetPaginator(request, USER_ORDERINGS, key_types=USER_ORDERING_TYPES)
+            filters = USER_FILTERS.parse(request.GET)
+            fields = sparse_fields(request.GET, UserV2Serializer)
+        except (InvalidCursor, InvalidFilter, InvalidFields) as e:
+            return json_response({'error': str(e)}, status.HTTP_400_BAD_REQUEST)
+
+        page_args = dict(
+            ordering=paginator.fields, limit=paginator.fetch_size, key=paginator.key,
+            backwards=paginator.backwards, filters=filters
+        )
+        try:
+            if request.headers.get('If-None-Match'):
+                versions = await AsyncUserV2Service.get_users_page_versions(**page_args)
+                response = not_modified(request, page_etag(versions, request.get_full_path()))
+                if response:
+                    return response
+
+            users = await AsyncUserV2Service.get_users_page(**page_args, fields=fields)
+        except Exception as e:
+            return _internal_error('list_users', e)
+
+        etag = page_etag([(user['id'], user['changed_at']) for user in users], request.get_full_path())
+        users = paginator.paginate(users)
+        last_modified = max((user['changed_at'] for user in users if user['changed_at']), default=None)
+        response = json_response(paginator.get_response_data(UserV2Serializer(users, many=True, fields=fields).data))
+        return set_validators(response, etag, last_modified)
+
+    async def post(self, request):
+        """Create a new user"""
+        data = parse_json_body(request)
+        if data is None:
+            return _invalid_json()
+        serializer = UserV2Serializer(data=data)
+        if not serializer.is_valid():
+            return json_response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+        try:
+            user = await AsyncUserV2Service.create_user(serializer.validated_data)
+        except DuplicateLogin:
+            return _duplicate_login()
+        except Exception as e:
+            return _internal_error('create_user', e)
+        if user:
+            return json_response(user, status.HTTP_201_CREATED)
+        return json_response({'error': 'Failed to create user'}, status.HTTP_400_BAD_REQUEST)
+
+
+class AsyncUserDetailView(View):
+    async def get(self, request, user_id):
+        """Get user details"""
+        try:
+            fields = sparse_fields(request.GET, UserV2Serializer)
+        except InvalidFields as e:
+            return json_response({'error': str(e)}, status.HTTP_400_BAD_REQUEST)
+        try:
+            if request.headers.get('If-None-Match') or request.headers.get('If-Modified-Since'):
+                exists, changed_at = await AsyncUserV2Service.get_user_version(user_id)
+                if exists:
+                    response = not_modified(request, row_etag(user_id, changed_at), changed_at)
+                    if response:
+                        return response
+
+            user = await AsyncUserV2Service.get_user(user_id)
+        except Exception as e:
+            return _internal_error('user_detail', e)
+        if not user:
+            return _not_found(user_id)
+        return set_validators(
+            json_response(UserV2Serializer(user, fields=fields).data), row_etag(user['id'], user['changed_at']), user['changed_at']
+        )
+
+    async def patch(self, request, user_id):
+        """Partially update user"""
+        data = parse_json_body(request)
+        if data is None:
+            return _invalid_json()
+        serializer = UserV2Serializer(data=data, partial=True, context={'request': request})
+        if not serializer.is_valid():
+            return json_response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+        try:
+            user = await AsyncUserV2Service.update_user(user_id, serializer.validated_data)
+        except DuplicateLogin:
+            return _duplicate_login()
+        except Exception as e:
+            return _internal_error('user_detail', e)
+        if not user:
+            return _not_found(user_id)
+        return set_validators(json_response(user), row_etag(user['id'], user['changed_at']), user['changed_at'])
+
+    async def delete(self, request, user_id):
+        """Delete user"""
+        try:
+            deleted = await AsyncUserV2Service.delete_user(user_id)
+        except Exception as e:
+            return _internal_error('user_detail', e)
+        if deleted:
+            return HttpResponse(status=status.HTTP_204_NO_CONTENT)
+        return _not_found(user_id)
@@ -0,0 +1,15 @@
+from typing import Any, Dict, Iterator, List
+from .serializers import UserV2Serializer
+from .services import UserV2Service
+
+
+def export_fieldnames() -> List[str]:
+    """Columns of an export, in the order the JSON API emits them"""
+    return [name for name, field in UserV2Serializer().fields.items() if not field.write_only]
+
+
+def iter_export_records(chunk_size: int = 2000) -> Iterator[Dict[str, Any]]:
+    """Yield every active user rendered exactly like the JSON API (str_bool as true/false)"""
+    serializer = UserV2Serializer()
+    for user in UserV2Service.iter_active_users(chunk_size):
+        yield serializer.to_representation(user)
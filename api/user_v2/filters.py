@@ -0,0 +1,18 @@
+from rest_framework import serializers
+from api.core.filtering import Filter, FilterSet
+from api.core.serializer_fields import YesNoToBooleanField
+
+RANGE = ('exact', 'gt', 'gte', 'lt', 'lte')
+
+# Query parameters of GET /user/v2/, values as in the API (str_bool=true)
+USER_FILTERS = FilterSet(
+    {
+        'login': Filter('login', serializers.CharField(max_length=100), ('exact', 'startswith')),
+        'first_name': Filter('first_name', serializers.CharField(max_length=100), ('exact', 'startswith')),
+        'last_name': Filter('last_name', serializers.CharField(max_length=100), ('exact', 'startswith')),
+        'is_active': Filter('isActive', serializers.BooleanField(), default=True),
+        'created_at': Filter('created_at', serializers.DateTimeField(), RANGE),
+        'str_bool': Filter('strBool', YesNoToBooleanField()),
+    },
+    search=('login', 'first_name', 'last_name'),
+)
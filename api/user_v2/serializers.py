@@ -1,8 +1,9 @@
 from rest_framework import serializers
+from api.core.compiled import CompiledListSerializer, CompiledSerializerMixin
 from api.core.serializer import BaseSerializer
 from api.core.serializer_fields import YesNoToBooleanField
 
-class UserV2Serializer(BaseSerializer):
+class UserV2Serializer(CompiledSerializerMixin, BaseSerializer):
     id = serializers.IntegerField(read_only=True)
     login = serializers.EmailField(max_length=100)
     password_sha256 = serializers.CharField(max_length=64, write_only=True)  # SHA256 length
@@ -15,4 +16,12 @@ class UserV2Serializer(BaseSerializer):
         # fields = ['id', 'login', 'password', 'first_name', 'last_name', 
         #          'is_active', 'str_bool', 'created_at', 'created_from', 
         #          'updated_at', 'updated_from'] 
-        fields = '__all__' 
\ No newline at end of file
+        fields = '__all__'
+        list_serializer_class = CompiledListSerializer 
+
+
+class UserV2TombstoneSerializer(serializers.Serializer):
+    """A deleted user in the change feed"""
+    id = serializers.IntegerField(read_only=True)
+    changed_at = serializers.DateTimeField(read_only=True)
+    deleted = serializers.BooleanField(read_only=True)
@@ -1,16 +1,39 @@
-from django.db import connection
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, transaction
 from django.utils import timezone
-from typing import Dict, Optional, Any
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Any, Sequence, Set, Tuple
+from api.core.aio import run_db
+from api.core.cache import build_cache
+from api.core.coalescer import WriteCoalescer
+from api.core.db.routing import primary, reader, shard_alias, writer
+from api.core.db.tombstones import TOMBSTONE_TABLE, record_deletions
+from api.core.filtering import Condition, where_clause
+from api.core.logins import DuplicateLogin, is_duplicate_key, login_filter, normalize
+from api.core.metrics import instrument_service
+from api.core.batching import chunked, in_placeholders, unique, values_placeholders
+from api.core.pagination import keyset_sql
+from api.core.sparse import select_list
+from api.core.streaming import stream_rows
 from .logger import logger
 
+user_cache = build_cache('user:v2')
+
+@instrument_service
 class UserV2Service:
     @staticmethod
     def create_user(data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """Create a new user with the provided data"""
-        logger.debug("Creating new user with data: %s", data)
-        
+        logger.debug("Creating new user, fields: %s", list(data))
+
+        if UserV2Service.login_exists(data['login']):
+            logger.info("Login already exists")
+            raise DuplicateLogin(data['login'])
+        if create_coalescer.can_coalesce():
+            # Shares one INSERT and commit with the concurrent creates of this worker
+            return create_coalescer.submit(data)
         try:
-            with connection.cursor() as cursor:
+            with writer().cursor() as cursor:
                 cursor.execute("""
                     INSERT INTO user (
                         login, password_sha256, first_name, last_name, 
@@ -19,48 +42,169 @@ class UserV2Service:
                     ) VALUES (
                         %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
                     )
-                    RETURNING id, login, first_name, last_name, created_at, isActive, strBool
-                """, [
-                    data['login'],
-                    data['password_sha256'],
-                    data['first_name'],
-                    data['last_name'],
-                    timezone.now(),  # created_at
-                    timezone.now(),  # changed_at
-                    data['created_from'],
-                    data['created_from'],  # Initial changed_from same as created_from
-                    data.get('str_bool'),  # Optional field
-                    True  # isActive
-                ])
+                    RETURNING id, login, first_name, last_name, created_at, isActive, strBool, changed_at
+                """, UserV2Service._insert_values(data, timezone.now()))
                 
                 row = cursor.fetchone()
                 if not row:
                     logger.error("Failed to create user: No row returned")
                     return None
 
-                return {
-                    'id': row[0],
-                    'login': row[1],
-                    'first_name': row[2],
-                    'last_name': row[3],
-                    'created_at': row[4],
-                    'is_active': row[5],
-                    'str_bool': row[6]
-                }
-                
+            login_filter.add(row[1])
+            # Drop a cached 404 for the new id
+            user_cache.invalidate_on_commit(row[0])
+            return UserV2Service._create_user_from_row(row)
+
+        except IntegrityError as e:
+            if is_duplicate_key(e):
+                # A concurrent create of the same login won
+                logger.info("Login already exists")
+                raise DuplicateLogin(data['login']) from e
+            logger.fatal("Fatal error creating user: %s", str(e), exc_info=True)
+            raise
         except Exception as e:
             logger.fatal("Fatal error creating user: %s", str(e), exc_info=True)
             raise
 
+    @staticmethod
+    def login_exists(login: str) -> bool:
+        """Look up the login on the primary, unless the login filter rules it out"""
+        if not login_filter.might_exist(login):
+            return False
+        try:
+            with primary().cursor() as cursor:
+                cursor.execute("SELECT 1 FROM user WHERE login = %s", [login])
+                return cursor.fetchone() is not None
+
+        except Exception as e:
+            logger.fatal("Fatal error checking login: %s", str(e), exc_info=True)
+            raise
+
+    @staticmethod
+    def existing_logins(logins: List[str], chunk_size: int = 1000) -> Set[str]:
+        """The normalized logins of ``logins`` already taken, looked up on the primary"""
+        taken = set()
+        try:
+            with primary().cursor() as cursor:
+                for chunk in chunked(unique(logins), chunk_size):
+                    cursor.execute(f"SELECT login FROM user WHERE login IN ({in_placeholders(len(chunk))})", chunk)
+                    taken.update(normalize(row[0]) for row in cursor.fetchall())
+            return taken
+
+        except Exception as e:
+            logger.fatal("Fatal error checking logins: %s", str(e), exc_info=True)
+            raise
+
+    @staticmethod
+    def create_users(data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Create all users with one multi-row INSERT, returned in input order"""
+        logger.debug("Creating %s users", len(data))
+        if not data:
+            return []
+
+        try:
+            users = UserV2Service._insert_users(data)
+            login_filter.add(*[user['login'] for user in users])
+            user_cache.invalidate_on_commit(*[user['id'] for user in users])
+            return users
+
+        except IntegrityError as e:
+            logger.info("Integrity error creating users: %s", str(e))
+            raise
+        except Exception as e:
+            logger.fatal("Fatal error creating users: %s", str(e), exc_info=True)
+            raise
+
+    @staticmethod
+    def _insert_users(data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """One multi-row INSERT of ``data``, the rows in input order"""
+        now = timezone.now()
+        values = []
+        for user_data in data:
+            values.extend(UserV2Service._insert_values(user_data, now))
+
+        with writer().cursor() as cursor:
+            cursor.execute(f"""
+                INSERT INTO user (
+                    login, password_sha256, first_name, last_name, 
+                    created_at, changed_at, created_from, changed_from,
+                    strBool, isActive
+                ) VALUES {values_placeholders(len(data), 10)}
+                RETURNING id, login, first_name, last_name, created_at, isActive, strBool, changed_at
+            """, values)
+            return [UserV2Service._create_user_from_row(row) for row in cursor.fetchall()]
+
+    @staticmethod
+    def _create_batch(batch: List[Dict[str, Any]]) -> List[Any]:
+        """
+        Flush of ``create_coalescer``: the users of ``batch`` with one INSERT
+        and commit, returning each one's row or exception (``DuplicateLogin``
+        for a taken login). Should the INSERT fail, the rows are retried one
+        by one in savepoints of the same transaction, so a failing row only
+        fails its own create. Only a failed commit fails them all.
+        """
+        logger.debug("Creating a batch of %s users", len(batch))
+
+        results: List[Any] = [None] * len(batch)
+        pending = []
+        seen = set()
+        for i, data in enumerate(batch):
+            login = normalize(data['login'])
+            if login in seen:
+                results[i] = DuplicateLogin(data['login'])
+            else:
+                seen.add(login)
+                pending.append(i)
+
+        try:
+            with transaction.atomic(using=shard_alias()):
+                try:
+                    with transaction.atomic(using=shard_alias()):
+                        for i, user in zip(pending, UserV2Service._insert_users([batch[i] for i in pending])):
+                            results[i] = user
+                except DatabaseError:
+                    for i in pending:
+                        results[i] = UserV2Service._create_in_savepoint(batch[i])
+        except Exception as e:
+            logger.fatal("Fatal error creating users: %s", str(e), exc_info=True)
+            raise
+
+        created = [user for user in results if isinstance(user, dict)]
+        login_filter.add(*[user['login'] for user in created])
+        # Drop cached 404s for the new ids
+        user_cache.invalidate_on_commit(*[user['id'] for user in created])
+        return results
+
+    @staticmethod
+    def _create_in_savepoint(data: Dict[str, Any]) -> Any:
+        """The created user, or the exception creating it raised"""
+        try:
+            with transaction.atomic(using=shard_alias()):
+                return UserV2Service._insert_users([data])[0]
+        except IntegrityError as e:
+            if is_duplicate_key(e):
+                logger.info("Login already exists")
+                return DuplicateLogin(data['login'])
+            logger.error("Integrity error creating user: %s", str(e))
+            return e
+        except DatabaseError as e:
+            logger.error("Database error creating user: %s", str(e))
+            return e
+
     @staticmethod
     def get_user(user_id: int) -> Optional[Dict[str, Any]]:
-        """Get user by ID"""
+        """Get user by ID, served from the user cache when possible"""
+        return user_cache.get(user_id, UserV2Service._fetch_user)
+
+    @staticmethod
+    def _fetch_user(user_id: int) -> Optional[Dict[str, Any]]:
+        """Get user by ID from the database"""
         logger.debug("Fetching user with ID: %s", user_id)
         
         try:
-            with connection.cursor() as cursor:
+            with reader().cursor() as cursor:
                 cursor.execute("""
-                    SELECT id, login, first_name, last_name, created_at, isActive, strBool 
+                    SELECT id, login, first_name, last_name, created_at, isActive, strBool, changed_at 
                     FROM user 
                     WHERE id = %s AND isActive = 1
                 """, [user_id])
@@ -70,81 +214,408 @@ class UserV2Service:
                     logger.info("No active user found with ID: %s", user_id)
                     return None
 
-                return {
-                    'id': row[0],
-                    'login': row[1],
-                    'first_name': row[2],
-                    'last_name': row[3],
-                    'created_at': row[4],
-                    'is_active': row[5],
-                    'str_bool': row[6]
-                }
+                return UserV2Service._create_user_from_row(row)
                 
         except Exception as e:
             logger.fatal("Fatal error fetching user: %s", str(e), exc_info=True)
             raise
 
     @staticmethod
-    def update_user(user_id: int, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-        """Update user with the provided data"""
-        logger.debug("Updating user %s with data: %s", user_id, data)
-        
+    def get_user_version(user_id: int) -> Tuple[bool, Optional[datetime]]:
+        """
+        ``(exists, changed_at)`` of an active user for conditional requests,
+        a one-column SELECT. Not from the user cache: another worker's copy
+        can be up to its TTL old and would answer 304 for a changed row.
+        """
         try:
-            with connection.cursor() as cursor:
+            with reader().cursor() as cursor:
                 cursor.execute("""
+                    SELECT changed_at 
+                    FROM user 
+                    WHERE id = %s AND isActive = 1
+                """, [user_id])
+                row = cursor.fetchone()
+                return (True, row[0]) if row else (False, None)
+
+        except Exception as e:
+            logger.fatal("Fatal error fetching user version: %s", str(e), exc_info=True)
+            raise
+
+    @staticmethod
+    def iter_active_users(chunk_size: int = 2000) -> Iterator[Dict[str, Any]]:
+        """Yield every active user from a server-side cursor, ordered by id"""
+        logger.debug("Streaming all active users in chunks of %s", chunk_size)
+
+        rows = stream_rows(reader(), """
+            SELECT id, login, first_name, last_name, created_at, isActive, strBool, changed_at 
+            FROM user 
+            WHERE isActive = 1
+            ORDER BY id
+        """, chunk_size=chunk_size)
+        try:
+            for row in rows:
+                yield UserV2Service._create_user_from_row(row)
+        except Exception as e:
+            logger.fatal("Fatal error streaming users: %s", str(e), exc_info=True)
+            raise
+
+    # Sort columns of the keyset paginated list, by ordering name
+    ORDERINGS = {
+        'id': 'id',
+        'created_at': 'created_at',
+        'login': 'login',
+        'first_name': 'first_name',
+        'last_name': 'last_name',
+    }
+    ACTIVE = Condition('isActive = 1', [])
+    # Column of each row field, in row order
+    COLUMNS = {
+        'id': 'id',
+        'login': 'login',
+        'first_name': 'first_name',
+        'last_name': 'last_name',
+        'created_at': 'created_at',
+        'is_active': 'isActive',
+        'str_bool': 'strBool',
+        'changed_at': 'changed_at',
+    }
+
+    @staticmethod
+    def _page_query(ordering: Sequence[Tuple[str, bool]], key: Optional[Sequence[Any]], backwards: bool,
+                    filters: Optional[Condition]) -> Tuple[str, str, List[Any]]:
+        """``(where, order_by, params)`` of a keyset page"""
+        columns = [UserV2Service.ORDERINGS[name] for name, _ in ordering]
+        seek, order_by, params = keyset_sql(columns, key, [desc for _, desc in ordering], backwards)
+        where = where_clause(filters or UserV2Service.ACTIVE, Condition(seek, params))
+        return where.sql, order_by, where.params
+
+    @staticmethod
+    def get_users_page(ordering: Sequence[Tuple[str, bool]] = (('id', False),), limit: int = 50,
+                       key: Optional[Sequence[Any]] = None, backwards: bool = False,
+                       filters: Optional[Condition] = None,
+                       fields: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Get one page of users seeking past key in the ordering, a list of
+        ``(name, descending)``. ``filters`` defaults to the active users.
+        Only the columns of ``fields``, the sort key and ``changed_at`` (for
+        the validators) are read if given, the others are ``None``.
+        """
+        logger.debug("Fetching user page ordering=%s limit=%s fields=%s", ordering, limit, fields)
+
+        where, order_by, params = UserV2Service._page_query(ordering, key, backwards, filters)
+        select = select_list(UserV2Service.COLUMNS, fields,
+                             required=[name for name, _ in ordering] + ['changed_at'])
+        try:
+            with reader().cursor() as cursor:
+                cursor.execute(f"""
+                    SELECT {select}
+                    FROM user 
+                    {where}
+                    ORDER BY {order_by}
+                    LIMIT %s
+                """, params + [limit])
+                return [UserV2Service._create_user_from_row(row) for row in cursor.fetchall()]
+
+        except Exception as e:
+            logger.fatal("Fatal error fetching user page: %s", str(e), exc_info=True)
+            raise
+
+    @staticmethod
+    def get_users_page_versions(ordering: Sequence[Tuple[str, bool]] = (('id', False),), limit: int = 50,
+                                key: Optional[Sequence[Any]] = None, backwards: bool = False,
+                                filters: Optional[Condition] = None) -> List[Tuple[int, Any]]:
+        """``(id, changed_at)`` of the rows get_users_page would return, for ETags"""
+        where, order_by, params = UserV2Service._page_query(ordering, key, backwards, filters)
+        try:
+            with reader().cursor() as cursor:
+                cursor.execute(f"""
+                    SELECT id, changed_at 
+                    FROM user 
+                    {where}
+                    ORDER BY {order_by}
+                    LIMIT %s
+                """, params + [limit])
+                return [(row[0], row[1]) for row in cursor.fetchall()]
+
+        except Exception as e:
+            logger.fatal("Fatal error fetching user page versions: %s", str(e), exc_info=True)
+            raise
+
+    @staticmethod
+    def get_changes(key: Optional[Sequence[Any]], until: datetime, limit: int) -> List[Dict[str, Any]]:
+        """
+        Users changed and deleted after the ``(changed_at, id)`` watermark
+        ``key`` up to ``until``, in that order. Deleted users come from the
+        tombstones as ``{'id', 'changed_at', 'deleted': True}``, the others
+        with ``'deleted': False``. Both sides are index range scans of at
+        most ``limit`` rows, read from the primary so no committed change is
+        skipped for replication lag.
+        """
+        logger.debug("Fetching changes after %s until %s limit=%s", key, until, limit)
+
+        user_seek, user_order, user_params = keyset_sql(['changed_at', 'id'], key, False, False)
+        user_where = where_clause(Condition('changed_at <= %s', [until]), Condition(user_seek, user_params))
+        tomb_seek, tomb_order, tomb_params = keyset_sql(['deleted_at', 'user_id'], key, False, False)
+        tomb_where = where_clause(Condition('deleted_at <= %s', [until]), Condition(tomb_seek, tomb_params))
+        try:
+            with primary().cursor() as cursor:
+                cursor.execute(f"""
+                    SELECT * FROM (
+                        SELECT id, login, first_name, last_name, created_at, isActive, strBool, changed_at, 
+                               0 AS deleted 
+                        FROM user 
+                        {user_where.sql}
+                        ORDER BY {user_order}
+                        LIMIT %s
+                    ) AS changed
+                    UNION ALL
+                    SELECT * FROM (
+                        SELECT user_id, NULL, NULL, NULL, NULL, NULL, NULL, deleted_at, 1 
+                        FROM {TOMBSTONE_TABLE} 
+                        {tomb_where.sql}
+                        ORDER BY {tomb_order}
+                        LIMIT %s
+                    ) AS deleted
+                    ORDER BY changed_at, id
+                    LIMIT %s
+                """, user_where.params + [limit] + tomb_where.params + [limit, limit])
+                return [
+                    {'id': row[0], 'changed_at': row[7], 'deleted': True} if row[8]
+                    else {**UserV2Service._create_user_from_row(row), 'deleted': False}
+                    for row in cursor.fetchall()
+                ]
+
+        except Exception as e:
+            logger.fatal("Fatal error fetching changes: %s", str(e), exc_info=True)
+            raise
+
+    @staticmethod
+    def prune_tombstones(before: datetime, chunk_size: int = 10000) -> int:
+        """Drop the tombstones of deletions before ``before``, returning how many"""
+        pruned = 0
+        try:
+            with writer().cursor() as cursor:
+                while True:
+                    # Short deletes, the feed keeps reading meanwhile
+                    cursor.execute(f"""
+                        DELETE FROM {TOMBSTONE_TABLE} 
+                        WHERE id IN (
+                            SELECT id FROM (
+                                SELECT id FROM {TOMBSTONE_TABLE} WHERE deleted_at < %s ORDER BY deleted_at LIMIT %s
+                            ) AS expired
+                        )
+                    """, [before, chunk_size])
+                    pruned += cursor.rowcount
+                    if cursor.rowcount < chunk_size:
+                        return pruned
+
+        except Exception as e:
+            logger.fatal("Fatal error pruning tombstones: %s", str(e), exc_info=True)
+            raise
+
+    @staticmethod
+    def update_user(user_id: int, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Update only the supplied fields of a user, returning the updated row"""
+        logger.debug("Updating user %s, fields: %s", user_id, list(data))
+
+        fields, values = UserV2Service._update_assignments(data)
+        try:
+            with writer().cursor() as cursor:
+                cursor.execute(f"""
                     UPDATE user 
-                    SET login = %s,
-                        password_sha256 = %s,
-                        first_name = %s,
-                        last_name = %s,
-                        strBool = %s,
-                        changed_at = %s,
-                        changed_from = %s
+                    SET {', '.join(fields)}
                     WHERE id = %s AND isActive = 1
-                    RETURNING id, login, first_name, last_name, created_at, isActive, strBool
-                """, [
-                    data['login'],
-                    data['password_sha256'],
-                    data['first_name'],
-                    data['last_name'],
-                    data.get('str_bool'),
-                    timezone.now(),
-                    data['changed_from'],
-                    user_id
-                ])
+                    RETURNING id, login, first_name, last_name, created_at, isActive, strBool, changed_at
+                """, values + [user_id])
                 
                 row = cursor.fetchone()
-                if not row:
-                    logger.info("No user found to update with ID: %s", user_id)
-                    return None
+            user_cache.invalidate_on_commit(user_id)
+            if not row:
+                logger.info("No user found to update with ID: %s", user_id)
+                return None
 
-                return {
-                    'id': row[0],
-                    'login': row[1],
-                    'first_name': row[2],
-                    'last_name': row[3],
-                    'created_at': row[4],
-                    'is_active': row[5],
-                    'str_bool': row[6]
-                }
-                
+            if 'login' in data:
+                login_filter.add(row[1])
+            return UserV2Service._create_user_from_row(row)
+
+        except IntegrityError as e:
+            if is_duplicate_key(e):
+                logger.info("Login already exists")
+                raise DuplicateLogin(data.get('login')) from e
+            logger.fatal("Fatal error updating user: %s", str(e), exc_info=True)
+            raise
         except Exception as e:
             logger.fatal("Fatal error updating user: %s", str(e), exc_info=True)
             raise
 
     @staticmethod
     def delete_user(user_id: int) -> bool:
-        """delete a user from the database"""
+        """delete a user from the database, leaving a tombstone for the change feed"""
         logger.debug("deleting user %s", user_id)
         
         try:
-            with connection.cursor() as cursor:
+            with transaction.atomic(using=shard_alias()), writer().cursor() as cursor:
                 cursor.execute("""
                     DELETE FROM user 
-                    WHERE id = %s
+                    WHERE id = %s AND isActive = 1
                 """, [user_id])
-                return cursor.rowcount > 0
+                deleted = cursor.rowcount > 0
+                if deleted:
+                    record_deletions(cursor, [user_id], timezone.now())
+                user_cache.invalidate_on_commit(user_id)
+            return deleted
                 
         except Exception as e:
             logger.fatal("Fatal error deleting user: %s", str(e), exc_info=True)
-            raise 
\ No newline at end of file
+            raise
+
+    @staticmethod
+    def update_users(user_ids: List[int], data: Dict[str, Any], chunk_size: int = 1000) -> List[int]:
+        """
+        Apply the same changes to all given active users, returning the updated
+        ids. Raises DuplicateLogin when a new login is taken.
+        """
+        logger.debug("Updating %s users, fields: %s", len(user_ids), list(data))
+
+        fields, values = UserV2Service._update_assignments(data)
+        try:
+            updated = []
+            with transaction.atomic(using=shard_alias()), writer().cursor() as cursor:
+                for chunk in chunked(unique(user_ids), chunk_size):
+                    cursor.execute(f"""
+                        UPDATE user 
+                        SET {', '.join(fields)}
+                        WHERE id IN ({in_placeholders(len(chunk))}) AND isActive = 1
+                        RETURNING id
+                    """, values + chunk)
+                    updated.extend(row[0] for row in cursor.fetchall())
+                user_cache.invalidate_on_commit(*updated)
+            if 'login' in data and updated:
+                login_filter.add(data['login'])
+            return updated
+
+        except IntegrityError as e:
+            if is_duplicate_key(e):
+                logger.info("Login already exists")
+                raise DuplicateLogin(data.get('login')) from e
+            logger.fatal("Fatal error updating users: %s", str(e), exc_info=True)
+            raise
+        except Exception as e:
+            logger.fatal("Fatal error updating users: %s", str(e), exc_info=True)
+            raise
+
+    @staticmethod
+    def delete_users(user_ids: List[int], chunk_size: int = 1000) -> List[int]:
+        """delete all given users from the database with tombstones, returning the deleted ids"""
+        logger.debug("deleting %s users", len(user_ids))
+
+        try:
+            deleted = []
+            now = timezone.now()
+            with transaction.atomic(using=shard_alias()), writer().cursor() as cursor:
+                for chunk in chunked(unique(user_ids), chunk_size):
+                    cursor.execute(f"""
+                        DELETE FROM user 
+                        WHERE id IN ({in_placeholders(len(chunk))}) AND isActive = 1
+                        RETURNING id
+                    """, chunk)
+                    chunk_deleted = [row[0] for row in cursor.fetchall()]
+                    record_deletions(cursor, chunk_deleted, now)
+                    deleted.extend(chunk_deleted)
+                user_cache.invalidate_on_commit(*deleted)
+            return deleted
+
+        except Exception as e:
+            logger.fatal("Fatal error deleting users: %s", str(e), exc_info=True)
+            raise
+
+    # API field -> column for the fields a PATCH may change
+    UPDATABLE_COLUMNS = {
+        'login': 'login',
+        'password_sha256': 'password_sha256',
+        'first_name': 'first_name',
+        'last_name': 'last_name',
+        'str_bool': 'strBool',
+        'changed_from': 'changed_from',
+    }
+
+    @staticmethod
+    def _update_assignments(data: Dict[str, Any]):
+        """SET clauses for the supplied fields only, always stamping changed_at"""
+        fields = ['changed_at = %s']
+        values = [timezone.now()]
+        for key, value in data.items():
+            column = UserV2Service.UPDATABLE_COLUMNS.get(key)
+            if column:
+                fields.append(f"{column} = %s")
+                values.append(value)
+        return fields, values
+
+    @staticmethod
+    def _insert_values(data: Dict[str, Any], now) -> list:
+        return [
+            data['login'],
+            data['password_sha256'],
+            data['first_name'],
+            data['last_name'],
+            now,  # created_at
+            now,  # changed_at
+            data['created_from'],
+            data['created_from'],  # Initial changed_from same as created_from
+            data.get('str_bool'),  # Optional field
+            True  # isActive
+        ]
+
+    @staticmethod
+    def _create_user_from_row(row) -> Dict[str, Any]:
+        return {
+            'id': row[0],
+            'login': row[1],
+            'first_name': row[2],
+            'last_name': row[3],
+            'created_at': row[4],
+            'is_active': row[5],
+            'str_bool': row[6],
+            'changed_at': row[7]
+        }
+
+
+# Group commit of concurrent create_user calls, see settings.USER_CREATE_COALESCING
+create_coalescer = WriteCoalescer(
+    'user:v2:create', UserV2Service._create_batch,
+    enabled=settings.USER_CREATE_COALESCING['ENABLED'],
+    max_batch=settings.USER_CREATE_COALESCING['MAX_BATCH'],
+    max_delay=settings.USER_CREATE_COALESCING['MAX_DELAY'],
+)
+
+
+class AsyncUserV2Service:
+    """Awaitable UserV2Service for the async views, DB work runs on the bounded executor"""
+
+    @staticmethod
+    async def create_user(data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        return await run_db(UserV2Service.create_user, data)
+
+    @staticmethod
+    async def get_user(user_id: int) -> Optional[Dict[str, Any]]:
+        return await run_db(UserV2Service.get_user, user_id)
+
+    @staticmethod
+    async def get_user_version(user_id: int) -> Tuple[bool, Optional[datetime]]:
+        return await run_db(UserV2Service.get_user_version, user_id)
+
+    @staticmethod
+    async def get_users_page(**kwargs) -> List[Dict[str, Any]]:
+        return await run_db(UserV2Service.get_users_page, **kwargs)
+
+    @staticmethod
+    async def get_users_page_versions(**kwargs) -> List[Tuple[int, Any]]:
+        return await run_db(UserV2Service.get_users_page_versions, **kwargs)
+
+    @staticmethod
+    async def update_user(user_id: int, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        return await run_db(UserV2Service.update_user, user_id, data)
+
+    @staticmethod
+    async def delete_user(user_id: int) -> bool:
+        return await run_db(UserV2Service.delete_user, user_id)
@@ -1,3 +1,282 @@
-from django.test import TestCase
+from datetime import datetime, timedelta, timezone as dt_timezone
+from hashlib import sha256
+from unittest import mock
 
-# Create your tests here.
+from django.http import QueryDict
+from django.test import override_settings
+from django.utils import timezone
+
+from api.core.changefeed import encode_watermark
+from api.core.filtering import Condition
+from api.core.pagination import encode_cursor
+from api.core.testing import UserTableTestCase
+from .filters import USER_FILTERS
+from .services import UserV2Service
+
+
+def user_data(login, **fields):
+    return {
+        'login': login, 'password_sha256': sha256(login.encode()).hexdigest(),
+        'first_name': 'Anna', 'last_name': 'Müller', 'created_from': 'tests', **fields,
+    }
+
+
+class UserV2TestCase(UserTableTestCase):
+    def create_user(self, login, **fields):
+        response = self.client.post('/user/v2/', user_data(login, **fields), content_type='application/json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()
+
+
+class UserDetailTests(UserV2TestCase):
+    def test_create_and_get(self):
+        user = self.create_user('anna@example.com', str_bool=True)
+        response = self.client.get(f"/user/v2/{user['id']}/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['login'], 'anna@example.com')
+        self.assertIs(response.json()['str_bool'], True)
+        self.assertNotIn('password_sha256', response.json())
+
+    def test_duplicate_login_is_a_conflict(self):
+        self.create_user('anna@example.com')
+        response = self.client.post('/user/v2/', user_data('anna@example.com'), content_type='application/json')
+        self.assertEqual(response.status_code, 409)
+
+    @override_settings(DATABASE_REPLICAS=['replica_0'])
+    def test_taken_login_does_not_pin_the_client(self):
+        self.create_user('anna@example.com')
+
+        response = self.client.post('/user/v2/', user_data('anna@example.com'), content_type='application/json')
+        self.assertEqual(response.status_code, 409)
+        self.assertNotIn('db_pin', response.cookies)
+
+    def test_missing_user(self):
+        self.assertEqual(self.client.get('/user/v2/999/').status_code, 404)
+
+    def test_cursor_value_of_the_wrong_type(self):
+        response = self.client.get('/user/v2/', {'cursor': encode_cursor({'o': 'last_name', 'k': [{'$x': 1}, 1]})})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Invalid cursor'})
+
+
+class UserFilterTests(UserV2TestCase):
+    def setUp(self):
+        super().setUp()
+        self.anna = self.create_user('anna@example.com', str_bool=True)
+        self.ben = self.create_user('ben@example.com', first_name='Ben', last_name='Weber', str_bool=False)
+        self.carl = self.create_user('carl@example.com', first_name='Carl', last_name='Becker')
+
+    def ids(self, **params):
+        response = self.client.get('/user/v2/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return [user['id'] for user in response.json()['results']]
+
+    def test_condition(self):
+        self.assertEqual(
+            USER_FILTERS.parse(QueryDict('str_bool=true&created_at__lt=2024-01-01T00:00:00Z&is_active=false')),
+            Condition('strBool = %s AND created_at < %s AND isActive = %s',
+                      ['yes', datetime(2024, 1, 1, tzinfo=dt_timezone.utc), False])
+        )
+
+    def test_text_filters(self):
+        anna, ben, carl = self.anna['id'], self.ben['id'], self.carl['id']
+        for params, ids in (({'login': 'ben@example.com'}, [ben]), ({'login__startswith': 'c'}, [carl]),
+                            ({'first_name': 'Anna'}, [anna]), ({'first_name__startswith': 'B'}, [ben]),
+                            ({'last_name': 'Becker'}, [carl]), ({'last_name__startswith': 'Mü'}, [anna]),
+                            ({'search': 'be'}, [ben, carl]), ({'search': 'a_'}, [])):
+            with self.subTest(params=params):
+                self.assertEqual(self.ids(**params), ids)
+
+    def test_str_bool(self):
+        self.assertEqual(self.ids(str_bool='true'), [self.anna['id']])
+        self.assertEqual(self.ids(str_bool='false'), [self.ben['id']])
+
+    def test_created_at_range(self):
+        self.assertEqual(self.ids(created_at__gt='2000-01-01T00:00:00Z'),
+                         [self.anna['id'], self.ben['id'], self.carl['id']])
+        self.assertEqual(self.ids(created_at__lte='2000-01-01T00:00:00Z'), [])
+
+    def test_deleted_users_are_not_listed(self):
+        self.assertEqual(self.client.delete(f"/user/v2/{self.ben['id']}/").status_code, 204)
+
+        self.assertEqual(self.ids(), [self.anna['id'], self.carl['id']])
+        self.assertEqual(self.ids(is_active='false'), [])
+
+    def test_invalid_filters(self):
+        for params in ({'str_bool': 'ja'}, {'is_active': 'maybe'}, {'created_at__gte': 'yesterday'},
+                       {'first_name__lt': 'B'}):
+            with self.subTest(params=params):
+                response = self.client.get('/user/v2/', params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+
+
+@override_settings(USER_BULK_CHUNK_SIZE=2)
+class BulkCreateTests(UserV2TestCase):
+    def bulk(self, items, mode=None):
+        path = '/user/v2/bulk/' if mode is None else f'/user/v2/bulk/?mode={mode}'
+        return self.client.post(path, items, content_type='application/json')
+
+    def statuses(self, response):
+        return [result['status'] for result in response.json()['results']]
+
+    def logins(self):
+        return [user['login'] for user in self.client.get('/user/v2/?limit=100').json()['results']]
+
+    def test_chunked_inserts(self):
+        items = [user_data(f'user{i}@example.com') for i in range(3)]
+        with mock.patch.object(UserV2Service, 'create_users', wraps=UserV2Service.create_users) as create_users:
+            response = self.bulk(items)
+
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual([len(call.args[0]) for call in create_users.call_args_list], [2, 1])
+        self.assertEqual([result['data']['login'] for result in response.json()['results']],
+                         [item['login'] for item in items])
+        self.assertNotIn('password_sha256', response.json()['results'][0]['data'])
+
+    def test_atomic_failure_creates_nothing(self):
+        self.create_user('anna@example.com')
+
+        response = self.bulk([user_data('ben@example.com'), user_data('anna@example.com')])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.statuses(response), [424, 409])
+        response = self.bulk([user_data('ben@example.com'), {'login': 'carl@example.com'}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.statuses(response), [424, 400])
+        self.assertEqual(self.logins(), ['anna@example.com'])
+
+    def test_partial_creates_the_valid_items(self):
+        self.create_user('anna@example.com')
+
+        response = self.bulk([user_data('ben@example.com'), {'login': 'carl@example.com'},
+                              user_data('anna@example.com'), user_data('ben@example.com')], mode='partial')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual((response.json()['created'], self.statuses(response)), (1, [201, 400, 409, 409]))
+        self.assertEqual(self.logins(), ['anna@example.com', 'ben@example.com'])
+
+    def test_partial_retries_a_failing_chunk_row_by_row(self):
+        self.create_user('anna@example.com')
+        # Taken after the login check, the chunk's INSERT fails on the unique key
+        with mock.patch.object(UserV2Service, 'existing_logins', return_value=set()):
+            response = self.bulk([user_data('anna@example.com'), user_data('ben@example.com')], mode='partial')
+
+        self.assertEqual(self.statuses(response), [409, 201])
+        self.assertEqual(response.json()['results'][0]['errors'], {'error': 'User already exists'})
+        self.assertEqual(self.logins(), ['anna@example.com', 'ben@example.com'])
+
+
+class BatchUpdateTests(UserV2TestCase):
+    def batch_update(self, ids, **patch):
+        return self.client.patch('/user/v2/batch/update/', {'ids': ids, 'patch': {'changed_from': 'tests', **patch}},
+                                 content_type='application/json')
+
+    def test_same_fields_for_every_user(self):
+        ids = [self.create_user(f'user{i}@example.com')['id'] for i in range(2)]
+
+        response = self.batch_update(ids, first_name='Greta')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertCountEqual(response.json()['affected_ids'], ids)
+        self.assertEqual({self.client.get(f"/user/v2/{i}/").json()['first_name'] for i in ids}, {'Greta'})
+
+    def test_login_of_many_users_is_rejected(self):
+        ids = [self.create_user(f'user{i}@example.com')['id'] for i in range(2)]
+
+        response = self.batch_update(ids, login='greta@example.com')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('login', response.json()['patch'])
+        self.assertEqual(self.batch_update(ids[:1] * 2, login='greta@example.com').status_code, 200)
+
+    def test_taken_login_is_a_conflict(self):
+        self.create_user('anna@example.com')
+        ben = self.create_user('ben@example.com')
+
+        with self.assertNoLogs('api.user_v2', 'ERROR'):
+            response = self.batch_update([ben['id']], login='anna@example.com')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.client.get(f"/user/v2/{ben['id']}/").json()['login'], 'ben@example.com')
+
+
+class ConditionalGetTests(UserV2TestCase):
+    def test_matching_etag_is_not_modified(self):
+        user = self.create_user('anna@example.com')
+        etag = self.client.get(f"/user/v2/{user['id']}/")['ETag']
+
+        response = self.client.get(f"/user/v2/{user['id']}/", headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertFalse(response.content)
+
+    def test_changed_user_is_sent_again(self):
+        user = self.create_user('anna@example.com')
+        etag = self.client.get(f"/user/v2/{user['id']}/")['ETag']
+        response = self.client.patch(f"/user/v2/{user['id']}/", {'first_name': 'Greta', 'changed_from': 'tests'},
+                                     content_type='application/json')
+        self.assertEqual(response.status_code, 200, response.content)
+
+        response = self.client.get(f"/user/v2/{user['id']}/", headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['first_name'], 'Greta')
+
+    def test_if_modified_since(self):
+        user = self.create_user('anna@example.com')
+        last_modified = self.client.get(f"/user/v2/{user['id']}/")['Last-Modified']
+
+        response = self.client.get(f"/user/v2/{user['id']}/", headers={'if-modified-since': last_modified})
+        self.assertEqual(response.status_code, 304)
+
+    def test_list_page_etag(self):
+        self.create_user('anna@example.com')
+        self.create_user('ben@example.com')
+        etag = self.client.get('/user/v2/?limit=1')['ETag']
+
+        self.assertEqual(self.client.get('/user/v2/?limit=1', headers={'if-none-match': etag}).status_code, 304)
+        # Another page, another tag
+        self.assertEqual(self.client.get('/user/v2/?limit=2', headers={'if-none-match': etag}).status_code, 200)
+
+
+@override_settings(USER_CHANGES_SETTLE_SECONDS=0)
+class ChangeFeedTests(UserV2TestCase):
+    def changes(self, **params):
+        return self.client.get('/user/v2/changes/', params)
+
+    def test_changes_and_tombstones(self):
+        anna = self.create_user('anna@example.com')
+        ben = self.create_user('ben@example.com')
+        self.assertEqual(self.client.delete(f"/user/v2/{ben['id']}/").status_code, 204)
+
+        response = self.changes()
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([(change['id'], change['deleted']) for change in results],
+                         [(anna['id'], False), (ben['id'], True)])
+        self.assertEqual(results[0]['login'], 'anna@example.com')
+        self.assertEqual(set(results[1]), {'id', 'changed_at', 'deleted'})
+
+    def test_since_continues_after_the_watermark(self):
+        self.create_user('anna@example.com')
+        ben = self.create_user('ben@example.com')
+
+        first = self.changes(limit=1).json()
+        self.assertTrue(first['has_more'])
+        second = self.changes(since=first['since'], limit=1).json()
+        self.assertEqual([change['id'] for change in second['results']], [ben['id']])
+
+        caught_up = self.changes(since=second['since']).json()
+        self.assertEqual(caught_up['results'], [])
+        self.assertFalse(caught_up['has_more'])
+        # Nothing new, poll again with the same watermark
+        self.assertEqual(caught_up['since'], second['since'])
+
+    def test_invalid_since(self):
+        for since in ('garbage', encode_watermark(timezone.now(), 1)[:-4]):
+            with self.subTest(since=since):
+                response = self.changes(since=since)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {'error': 'Invalid since'})
+
+    @override_settings(USER_CHANGES_RETENTION_DAYS=30)
+    def test_expired_since_is_gone(self):
+        since = encode_watermark(timezone.now() - timedelta(days=31), 1)
+        self.assertEqual(self.changes(since=since).status_code, 410)
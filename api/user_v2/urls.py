@@ -1,7 +1,22 @@
-from django.urls import path
-from . import views
-
-urlpatterns = [
-    path('', views.create_user, name='user-v2-create'),
-    path('<int:user_id>/', views.user_detail, name='user-v2-detail'),
-] 
\ No newline at end of file
+from django.conf import settings
+from django.urls import path
+from . import views
+
+user_list = views.user_list
+user_detail = views.user_detail
+if settings.SERVER_MODE == 'asgi':
+    # Async-native list and detail views, DB work on a bounded executor
+    from .async_views import AsyncUserListView, AsyncUserDetailView
+
+    user_list = AsyncUserListView.as_view()
+    user_detail = AsyncUserDetailView.as_view()
+
+urlpatterns = [
+    path('', user_list, name='user-v2-list'),  # GET (list), POST (create)
+    path('bulk/', views.bulk_create_users, name='user-v2-bulk-create'),  # POST, list of users
+    path('batch/update/', views.batch_update_users, name='user-v2-batch-update'),  # PATCH, ids + fields
+    path('batch/delete/', views.batch_delete_users, name='user-v2-batch-delete'),  # POST, ids
+    path('export/', views.export_users, name='user-v2-export'),  # GET, streamed NDJSON or CSV
+    path('changes/', views.user_changes, name='user-v2-changes'),  # GET, changes after ?since=
+    path('<int:user_id>/', user_detail, name='user-v2-detail'),
+]
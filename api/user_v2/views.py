@@ -1,17 +1,94 @@
+from datetime import datetime
+
 from django.shortcuts import render
+from django.conf import settings
+from django.http import StreamingHttpResponse
 from rest_framework import status
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, renderer_classes
 from rest_framework.response import Response
 from django.db import connection
 from django.utils import timezone
-from .serializers import UserV2Serializer
+from .serializers import UserV2Serializer, UserV2TombstoneSerializer
 from .services import UserV2Service
 from .logger import logger
+from api.core.bulk import MODE_ATOMIC, MODES, bulk_create
+from api.core.changefeed import ChangeFeed, ExpiredWatermark, InvalidWatermark
+from api.core.conditional import not_modified, page_etag, row_etag, set_validators
+from api.core.filtering import InvalidFilter
+from api.core.logins import DuplicateLogin
+from api.core.pagination import InvalidCursor, KeysetPaginator
+from api.core.serializer import IdListSerializer
+from api.core.sparse import InvalidFields, sparse_fields, openapi_parameters as sparse_parameters
+from api.core.streaming import CSVRenderer, NDJSONRenderer, export_chunks
+from api.mandant.context import mandant_limit
+from .exports import export_fieldnames, iter_export_records
+from .filters import USER_FILTERS
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
 # Create your views here.
 
+# Sort value of a user for each ordering offered by the list endpoint
+USER_ORDERINGS = {
+    'id': lambda user: user['id'],
+    'created_at': lambda user: user['created_at'],
+    'login': lambda user: user['login'],
+    'first_name': lambda user: user['first_name'],
+    'last_name': lambda user: user['last_name'],
+}
+
+# Type of the sort values, checked on the values of a cursor
+USER_ORDERING_TYPES = {
+    'id': int,
+    'created_at': datetime,
+    'login': str,
+    'first_name': str,
+    'last_name': str,
+}
+
+@swagger_auto_schema(
+    method='get',
+    operation_description="List users (active ones unless is_active is given), filtered and sorted, one keyset page at a time",
+    manual_parameters=[
+        openapi.Parameter(
+            'cursor', openapi.IN_QUERY,
+            description="Opaque cursor taken from a previous next/previous link",
+            type=openapi.TYPE_STRING
+        ),
+        openapi.Parameter(
+            'limit', openapi.IN_QUERY,
+            description="Page size, capped by the server",
+            type=openapi.TYPE_INTEGER
+        ),
+        openapi.Parameter(
+            'ordering', openapi.IN_QUERY,
+            description="Comma separated sort fields (id, created_at, login, first_name, last_name), "
+                        "- for descending, e.g. last_name,-created_at (ignored when a cursor is given)",
+            type=openapi.TYPE_STRING
+        ),
+        *USER_FILTERS.openapi_parameters(),
+        *sparse_parameters(UserV2Serializer)
+    ],
+    responses={
+        200: openapi.Response(
+            description="One page of users",
+            schema=openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    'next': openapi.Schema(type=openapi.TYPE_STRING, format=openapi.FORMAT_URI, x_nullable=True),
+                    'previous': openapi.Schema(type=openapi.TYPE_STRING, format=openapi.FORMAT_URI, x_nullable=True),
+                    'results': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_OBJECT)),
+                }
+            )
+        ),
+        400: openapi.Response(
+            description="Invalid cursor, ordering, filter or fields"
+        ),
+        500: openapi.Response(
+            description="Internal Server Error"
+        )
+    }
+)
 @swagger_auto_schema(
     method='post',
     request_body=UserV2Serializer,
@@ -30,12 +107,56 @@ from drf_yasg import openapi
         400: openapi.Response(
             description="Bad Request"
         ),
+        409: openapi.Response(
+            description="Conflict",
+            examples={"application/json": {"error": "User already exists"}}
+        ),
         500: openapi.Response(
             description="Internal Server Error"
         )
     }
 )
-@api_view(['POST'])
+@api_view(['GET', 'POST'])
+def user_list(request):
+    """Handle GET (list) and POST (create) requests for users"""
+    if request.method == 'GET':
+        return list_users(request)
+    return create_user(request)
+
+def list_users(request):
+    """List filtered users, one keyset page at a time"""
+    try:
+        paginator = KeysetPaginator(request, USER_ORDERINGS, key_types=USER_ORDERING_TYPES)
+        filters = USER_FILTERS.parse(request.query_params)
+        fields = sparse_fields(request.query_params, UserV2Serializer)
+    except (InvalidCursor, InvalidFilter, InvalidFields) as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    page_args = dict(
+        ordering=paginator.fields, limit=paginator.fetch_size, key=paginator.key,
+        backwards=paginator.backwards, filters=filters
+    )
+    try:
+        if request.headers.get('If-None-Match'):
+            # Compare against the (id, changed_at) of the page before loading it
+            etag = page_etag(UserV2Service.get_users_page_versions(**page_args), request.get_full_path())
+            response = not_modified(request, etag)
+            if response:
+                return response
+
+        users = UserV2Service.get_users_page(**page_args, fields=fields)
+        etag = page_etag([(user['id'], user['changed_at']) for user in users], request.get_full_path())
+        users = paginator.paginate(users)
+        last_modified = max((user['changed_at'] for user in users if user['changed_at']), default=None)
+        response = Response(paginator.get_response_data(UserV2Serializer(users, many=True, fields=fields).data))
+        return set_validators(response, etag, last_modified)
+    except Exception as e:
+        logger.error("Error in list_users view: %s", str(e), exc_info=True)
+        return Response(
+            {'error': 'Internal server error'}, 
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
 def create_user(request):
     """Create a new user"""
     try:
@@ -49,6 +170,11 @@ def create_user(request):
                     {'error': 'Failed to create user'}, 
                     status=status.HTTP_400_BAD_REQUEST
                 )
+            except DuplicateLogin:
+                return Response(
+                    {'error': 'User already exists'},
+                    status=status.HTTP_409_CONFLICT
+                )
             except Exception as e:
                 logger.error("Error in create_user view: %s", str(e), exc_info=True)
                 return Response(
@@ -63,11 +189,175 @@ def create_user(request):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+@swagger_auto_schema(
+    method='post',
+    request_body=UserV2Serializer(many=True),
+    operation_description="Create many users with chunked multi-row inserts in one transaction",
+    manual_parameters=[
+        openapi.Parameter(
+            'mode', openapi.IN_QUERY,
+            description="atomic (default): all or nothing, partial: create every valid item",
+            type=openapi.TYPE_STRING,
+            enum=list(MODES)
+        )
+    ],
+    responses={
+        201: openapi.Response(
+            description="All users created, one result per item"
+        ),
+        207: openapi.Response(
+            description="Some items failed, one result per item"
+        ),
+        400: openapi.Response(
+            description="Invalid input data, nothing was created"
+        ),
+        409: openapi.Response(
+            description="Atomic mode: logins repeated or already taken, nothing was created"
+        ),
+        500: openapi.Response(
+            description="Internal Server Error"
+        )
+    }
+)
+@api_view(['POST'])
+def bulk_create_users(request):
+    """Create many users at once"""
+    mode = request.query_params.get('mode', MODE_ATOMIC)
+    if mode not in MODES:
+        return Response({'error': f"mode must be one of {', '.join(MODES)}"}, status=status.HTTP_400_BAD_REQUEST)
+    if not isinstance(request.data, list):
+        return Response({'error': 'Expected a list of users'}, status=status.HTTP_400_BAD_REQUEST)
+    max_items = mandant_limit('USER_BULK_MAX_ITEMS')
+    if len(request.data) > max_items:
+        return Response(
+            {'error': f"At most {max_items} users per request"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        http_status, body = bulk_create(
+            request.data, UserV2Serializer, UserV2Service.create_users,
+            lambda users: UserV2Serializer(users, many=True).data,
+            mode=mode, chunk_size=settings.USER_BULK_CHUNK_SIZE,
+            context={'request': request}, existing_logins=UserV2Service.existing_logins
+        )
+        return Response(body, status=http_status)
+    except Exception as e:
+        logger.error("Error in bulk_create_users view: %s", str(e), exc_info=True)
+        return Response(
+            {'error': 'Internal server error'}, 
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+@swagger_auto_schema(
+    method='post',
+    request_body=IdListSerializer,
+    operation_description="Delete many users by id",
+    responses={
+        200: openapi.Response(
+            description="Ids of the users that were deleted",
+            examples={"application/json": {"affected_ids": [1, 2, 3]}}
+        ),
+        400: openapi.Response(
+            description="Bad Request"
+        ),
+        500: openapi.Response(
+            description="Internal Server Error"
+        )
+    }
+)
+@api_view(['POST'])
+def batch_delete_users(request):
+    """Delete many users by id"""
+    serializer = IdListSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        user_ids = UserV2Service.delete_users(serializer.validated_data['ids'], settings.USER_BATCH_CHUNK_SIZE)
+        return Response({'affected_ids': user_ids})
+    except Exception as e:
+        logger.error("Error in batch_delete_users view: %s", str(e), exc_info=True)
+        return Response(
+            {'error': 'Internal server error'}, 
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+@swagger_auto_schema(
+    method='patch',
+    request_body=openapi.Schema(
+        type=openapi.TYPE_OBJECT,
+        required=['ids', 'patch'],
+        properties={
+            'ids': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_INTEGER)),
+            'patch': openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                description="Fields to set on every user, as for PATCH /user/v2/<id>/ (changed_from is required). "
+                            "login can only be set with a single id"
+            ),
+        }
+    ),
+    operation_description="Apply the same partial update to many users",
+    responses={
+        200: openapi.Response(
+            description="Ids of the users that were updated",
+            examples={"application/json": {"affected_ids": [1, 2, 3]}}
+        ),
+        400: openapi.Response(
+            description="Bad Request"
+        ),
+        409: openapi.Response(
+            description="Login already exists"
+        ),
+        500: openapi.Response(
+            description="Internal Server Error"
+        )
+    }
+)
+@api_view(['PATCH'])
+def batch_update_users(request):
+    """Apply the same partial update to many users"""
+    ids = IdListSerializer(data=request.data)
+    patch = UserV2Serializer(data=request.data.get('patch'), partial=True, context={'request': request})
+    ids_valid = ids.is_valid()
+    if not patch.is_valid() or not ids_valid:
+        errors = dict(ids.errors)
+        if patch.errors:
+            errors['patch'] = patch.errors
+        return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+    # One login on many users can only fail on the unique key
+    if 'login' in patch.validated_data and len(set(ids.validated_data['ids'])) > 1:
+        return Response(
+            {'patch': {'login': ["Can only be changed for a single id."]}},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        user_ids = UserV2Service.update_users(
+            ids.validated_data['ids'], patch.validated_data, settings.USER_BATCH_CHUNK_SIZE
+        )
+        return Response({'affected_ids': user_ids})
+    except DuplicateLogin:
+        return Response(
+            {'error': 'User already exists'},
+            status=status.HTTP_409_CONFLICT
+        )
+    except Exception as e:
+        logger.error("Error in batch_update_users view: %s", str(e), exc_info=True)
+        return Response(
+            {'error': 'Internal server error'}, 
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
 @swagger_auto_schema(
     method='get',
     operation_description="Get user details",
+    manual_parameters=sparse_parameters(UserV2Serializer),
     responses={
         200: UserV2Serializer,
+        400: openapi.Response(
+            description="Unknown fields"
+        ),
         404: openapi.Response(
             description="User not found"
         ),
@@ -89,6 +379,10 @@ def create_user(request):
         404: openapi.Response(
             description="User not found",
             examples={"application/json": {"error": "User not found"}}
+        ),
+        409: openapi.Response(
+            description="Conflict",
+            examples={"application/json": {"error": "User already exists"}}
         )
     }
 )
@@ -107,47 +401,67 @@ def create_user(request):
 def user_detail(request, user_id):
     """Handle GET, PATCH, and DELETE requests for a user"""
     try:
-        # First check if user exists
-        user = UserV2Service.get_user(user_id)
-        if not user:
-            logger.info("User not found: %s", user_id)
-            return Response(
-                {'error': 'User not found'}, 
-                status=status.HTTP_404_NOT_FOUND
-            )
-
         if request.method == 'GET':
-            serializer = UserV2Serializer(user)
-            return Response(serializer.data)
+            try:
+                fields = sparse_fields(request.query_params, UserV2Serializer)
+            except InvalidFields as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+            if request.headers.get('If-None-Match') or request.headers.get('If-Modified-Since'):
+                # Answer revalidations from changed_at alone
+                exists, changed_at = UserV2Service.get_user_version(user_id)
+                if exists:
+                    response = not_modified(request, row_etag(user_id, changed_at), changed_at)
+                    if response:
+                        return response
+
+            user = UserV2Service.get_user(user_id)
+            if not user:
+                logger.info("User not found: %s", user_id)
+                return Response(
+                    {'error': 'User not found'}, 
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            serializer = UserV2Serializer(user, fields=fields)
+            return set_validators(
+                Response(serializer.data), row_etag(user['id'], user['changed_at']), user['changed_at']
+            )
 
         elif request.method == 'DELETE':
+            # One statement, a missing user shows up as an untouched row count
             if UserV2Service.delete_user(user_id):
                 return Response(status=status.HTTP_204_NO_CONTENT)
+            logger.info("User not found: %s", user_id)
             return Response(
-                {'error': 'Failed to delete user'}, 
-                status=status.HTTP_400_BAD_REQUEST
+                {'error': 'User not found'}, 
+                status=status.HTTP_404_NOT_FOUND
             )
 
         elif request.method == 'PATCH':
-            # Get current user data first
-            current_user = UserV2Service.get_user(user_id)
-            serializer = UserV2Serializer(data=request.data, partial=True)
+            serializer = UserV2Serializer(data=request.data, partial=True, context={'request': request})
             if not serializer.is_valid():
                 return Response(
                     serializer.errors, 
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            
-            # Merge current data with updates
-            update_data = current_user.copy()
-            update_data.update(serializer.validated_data)
-            
-            updated_user = UserV2Service.update_user(user_id, update_data)
+
+            # Only the supplied columns are written, the row comes back via RETURNING
+            try:
+                updated_user = UserV2Service.update_user(user_id, serializer.validated_data)
+            except DuplicateLogin:
+                return Response(
+                    {'error': 'User already exists'},
+                    status=status.HTTP_409_CONFLICT
+                )
             if updated_user:
-                return Response(updated_user)
+                return set_validators(
+                    Response(updated_user),
+                    row_etag(updated_user['id'], updated_user['changed_at']), updated_user['changed_at']
+                )
+            logger.info("User not found: %s", user_id)
             return Response(
-                {'error': 'Failed to update user'}, 
-                status=status.HTTP_400_BAD_REQUEST
+                {'error': 'User not found'}, 
+                status=status.HTTP_404_NOT_FOUND
             )
     except Exception as e:
         logger.error("Error in user_detail view: %s", str(e), exc_info=True)
@@ -155,3 +469,92 @@ def user_detail(request, user_id):
             {'error': 'Internal server error'}, 
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
+
+@swagger_auto_schema(
+    method='get',
+    operation_description="Stream all active users as NDJSON (default) or CSV, "
+                          "chosen by the Accept header or ?format=ndjson|csv",
+    responses={
+        200: openapi.Response(
+            description="Stream of users, one per line"
+        )
+    }
+)
+@api_view(['GET'])
+@renderer_classes([NDJSONRenderer, CSVRenderer])
+def export_users(request):
+    """Stream all active users"""
+    export_format = request.accepted_renderer.format
+    records = iter_export_records(settings.USER_EXPORT_CHUNK_SIZE)
+    response = StreamingHttpResponse(
+        export_chunks(export_format, records, export_fieldnames()),
+        content_type=request.accepted_renderer.media_type
+    )
+    response['Content-Disposition'] = f'attachment; filename="users_v2.{export_format}"'
+    return response
+
+@swagger_auto_schema(
+    method='get',
+    operation_description="Users created, changed or deleted after a watermark, ordered by (changed_at, id). "
+                          "Start without since, then pass the since of each response to get the changes after it",
+    manual_parameters=[
+        openapi.Parameter(
+            'since', openapi.IN_QUERY,
+            description="Opaque watermark taken from a previous response, none for all users",
+            type=openapi.TYPE_STRING
+        ),
+        openapi.Parameter(
+            'limit', openapi.IN_QUERY,
+            description="Page size, capped by the server",
+            type=openapi.TYPE_INTEGER
+        ),
+    ],
+    responses={
+        200: openapi.Response(
+            description="One page of changes, users with deleted false and tombstones with deleted true",
+            schema=openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    'since': openapi.Schema(type=openapi.TYPE_STRING, x_nullable=True),
+                    'next': openapi.Schema(type=openapi.TYPE_STRING, format=openapi.FORMAT_URI, x_nullable=True),
+                    'has_more': openapi.Schema(type=openapi.TYPE_BOOLEAN),
+                    'results': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_OBJECT)),
+                }
+            )
+        ),
+        400: openapi.Response(
+            description="Invalid since"
+        ),
+        410: openapi.Response(
+            description="since is older than the tombstone retention, resync without since",
+            examples={"application/json": {"error": "since is older than 30 days, resync from the start"}}
+        ),
+        500: openapi.Response(
+            description="Internal Server Error"
+        )
+    }
+)
+@api_view(['GET'])
+def user_changes(request):
+    """Incremental sync: the changes after a watermark"""
+    try:
+        feed = ChangeFeed(request)
+    except InvalidWatermark as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except ExpiredWatermark as e:
+        return Response({'error': str(e)}, status=status.HTTP_410_GONE)
+
+    try:
+        changes = feed.paginate(UserV2Service.get_changes(feed.key, feed.until, feed.fetch_size))
+        users = iter(UserV2Serializer([change for change in changes if not change['deleted']], many=True).data)
+        results = [
+            UserV2TombstoneSerializer(change).data if change['deleted'] else {**next(users), 'deleted': False}
+            for change in changes
+        ]
+        return Response(feed.get_response_data(results))
+    except Exception as e:
+        logger.error("Error in user_changes view: %s", str(e), exc_info=True)
+        return Response(
+            {'error': 'Internal server error'}, 
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
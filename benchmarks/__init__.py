@@ -0,0 +1,9 @@
+"""
+Benchmark suite for the user and user_v2 APIs.
+
+    python -m benchmarks --rows 100000 --drivers client,wsgi --concurrency 8 \
+        --requests 2000 --save baseline.json
+    python -m benchmarks --rows 100000 --compare baseline.json --threshold 0.1
+
+See ``python -m benchmarks --help``.
+"""
@@ -0,0 +1,107 @@
+import argparse
+import os
+import sys
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description="Benchmark the user APIs")
+    parser.add_argument('--rows', type=int, default=1000, help="Users to seed (1000 to 10000000)")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the data and the request ids")
+    parser.add_argument('--reuse', action='store_true',
+                        help="Keep the existing table if it already holds --rows users")
+    parser.add_argument('--database', choices=('sqlite', 'default'), default='sqlite',
+                        help="Local SQLite file, or the configured (MySQL) database")
+    parser.add_argument('--db-file', help="SQLite file, default benchmark.sqlite3 in the project")
+    parser.add_argument('--recreate', action='store_true',
+                        help="Drop and reseed the user table of --database default")
+    parser.add_argument('--server-mode', choices=('wsgi', 'asgi'), help="SERVER_MODE to route the views for")
+    parser.add_argument('--drivers', default='client,wsgi', help="Comma separated: client, wsgi, asgi")
+    parser.add_argument('--scenarios', help="Comma separated scenarios or prefixes, e.g. v1,v2.list")
+    parser.add_argument('--concurrency', type=int, default=8, help="Client threads of the server drivers")
+    parser.add_argument('--requests', type=int, default=500, help="Timed requests per scenario")
+    parser.add_argument('--warmup', type=int, default=20, help="Untimed requests per scenario")
+    parser.add_argument('--save', metavar='FILE', help="Write the results as a JSON baseline")
+    parser.add_argument('--compare', metavar='FILE', help="Compare against a JSON baseline")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="Allowed regression as a fraction (0.1 = 10%% slower p95 or lower throughput)")
+    args = parser.parse_args(argv)
+    if not 1 <= args.rows <= 10_000_000:
+        parser.error("--rows must be between 1 and 10000000")
+    unknown = set(args.drivers.split(',')) - {'client', 'wsgi', 'asgi'}
+    if unknown:
+        parser.error(f"unknown drivers: {', '.join(sorted(unknown))}")
+    return args
+
+
+def setup(args: argparse.Namespace) -> None:
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'benchmarks.settings'
+    os.environ['BENCHMARK_DATABASE'] = args.database
+    if args.db_file:
+        os.environ['BENCHMARK_DB'] = args.db_file
+    if args.server_mode:
+        os.environ['SERVER_MODE'] = args.server_mode
+
+    import django
+
+    django.setup()
+
+
+def prepare_data(args: argparse.Namespace) -> int:
+    """Seed the table unless it can be reused, returning the highest seeded id"""
+    from . import seed
+
+    if args.database == 'default' and not args.recreate:
+        # Never drop a real table implicitly, benchmark what is there
+        count = seed.row_count()
+        print(f"using {count} existing users (--recreate to reseed)")
+        return count
+    if args.reuse:
+        try:
+            if seed.row_count() >= args.rows:
+                print("reusing the seeded users")
+                return args.rows
+        except Exception:
+            pass
+    print(f"seeding {args.rows} users ...", flush=True)
+    seed.seed(args.rows, args.seed)
+    return args.rows
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    setup(args)
+
+    from django.conf import settings
+
+    from . import runner, scenarios
+
+    max_id = prepare_data(args)
+    results = runner.run(
+        [name.strip() for name in args.drivers.split(',')],
+        scenarios.select(args.scenarios),
+        args.requests, args.concurrency, max_id, args.seed, args.warmup,
+    )
+    data = runner.baseline(
+        results, rows=max_id, requests=args.requests, concurrency=args.concurrency,
+        database=args.database, server_mode=settings.SERVER_MODE,
+    )
+    if args.save:
+        runner.save(args.save, data)
+        print(f"saved {args.save}")
+
+    if args.compare:
+        previous = runner.load(args.compare)
+        for mismatch in runner.mismatched_meta(previous, data):
+            print(f"warning: run differs from the baseline in {mismatch}")
+        regressions = runner.compare(previous, data, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regressions over {args.threshold:.0%}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print(f"no regressions over {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
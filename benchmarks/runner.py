@@ -0,0 +1,285 @@
+"""
+Drivers sending the scenario requests, latency statistics and baselines.
+
+* ``client``: Django's test client in this process, one request at a time.
+  Measures the application without any server or network.
+* ``wsgi``: the WSGI application behind a threaded ``wsgiref`` server,
+  loaded over HTTP by ``concurrency`` client threads.
+* ``asgi``: the ASGI application behind uvicorn (if installed), loaded the
+  same way. Run with ``--server-mode asgi`` to route the async views.
+"""
+import http.client
+import json
+import math
+import platform
+import socketserver
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+import django
+from django.db import connections
+
+from .scenarios import Request, Scenario
+
+SUCCESS = range(200, 400)
+
+
+class DriverUnavailable(Exception):
+    pass
+
+
+def percentile(ordered: List[float], p: float) -> float:
+    """Nearest-rank percentile of sorted values"""
+    if not ordered:
+        return 0.0
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    ordered = sorted(latencies)
+    ms = lambda value: round(value * 1000, 3)  # noqa: E731
+    return {
+        'requests': len(ordered),
+        'errors': errors,
+        'throughput': round(len(ordered) / elapsed, 1) if elapsed else 0.0,
+        'mean_ms': ms(sum(ordered) / len(ordered)) if ordered else 0.0,
+        'p50_ms': ms(percentile(ordered, 50)),
+        'p95_ms': ms(percentile(ordered, 95)),
+        'p99_ms': ms(percentile(ordered, 99)),
+        'max_ms': ms(ordered[-1]) if ordered else 0.0,
+    }
+
+
+class ClientDriver:
+    name = 'client'
+
+    def __init__(self, concurrency: int):
+        from django.test import Client
+
+        # The test client is not thread-safe, it always runs sequentially
+        self.client = Client()
+
+    def send(self, request: Request) -> int:
+        method, path, body = request
+        kwargs = {'content_type': 'application/json', 'data': json.dumps(body)} if body is not None else {}
+        return getattr(self.client, method.lower())(path, **kwargs).status_code
+
+    def run(self, requests: List[Request]) -> Tuple[List[float], int, float]:
+        latencies, errors = [], 0
+        started = time.perf_counter()
+        for request in requests:
+            t0 = time.perf_counter()
+            status = self.send(request)
+            latencies.append(time.perf_counter() - t0)
+            errors += status not in SUCCESS
+        return latencies, errors, time.perf_counter() - started
+
+    def close(self) -> None:
+        pass
+
+
+class _HTTPDriver:
+    """Concurrent HTTP load against a server on localhost, one connection per client thread"""
+
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self.port = 0
+        self._local = threading.local()
+
+    def _connection(self) -> http.client.HTTPConnection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+        return conn
+
+    def send(self, request: Request) -> Tuple[float, int]:
+        method, path, body = request
+        payload = json.dumps(body).encode() if body is not None else None
+        headers = {'Content-Type': 'application/json'} if payload is not None else {}
+        conn = self._connection()
+        t0 = time.perf_counter()
+        # Reconnects by itself when the server closed the connection
+        conn.request(method, path, body=payload, headers=headers)
+        response = conn.getresponse()
+        response.read()
+        return time.perf_counter() - t0, response.status
+
+    def run(self, requests: List[Request]) -> Tuple[List[float], int, float]:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(self.concurrency) as executor:
+            results = list(executor.map(self.send, requests))
+        elapsed = time.perf_counter() - started
+        return [latency for latency, _ in results], sum(status not in SUCCESS for _, status in results), elapsed
+
+    def wait_until_ready(self, timeout: float = 10.0) -> None:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=1)
+                conn.request('GET', '/metrics')
+                conn.getresponse().read()
+                conn.close()
+                return
+            except OSError:
+                time.sleep(0.05)
+        raise DriverUnavailable(f"{self.name} server did not start on port {self.port}")
+
+
+class _ThreadingWSGIServer(socketserver.ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class _QuietHandler(WSGIRequestHandler):
+    # One request per connection (HTTP/1.0), wsgiref has no keep-alive
+
+    def log_message(self, format, *args):
+        pass
+
+
+class WSGIDriver(_HTTPDriver):
+    name = 'wsgi'
+
+    def __init__(self, concurrency: int):
+        super().__init__(concurrency)
+        from django.core.wsgi import get_wsgi_application
+
+        self.server = make_server('127.0.0.1', 0, get_wsgi_application(),
+                                  server_class=_ThreadingWSGIServer, handler_class=_QuietHandler)
+        self.port = self.server.server_port
+        self.thread = threading.Thread(target=self.server.serve_forever, name='benchmark-wsgi', daemon=True)
+        self.thread.start()
+        self.wait_until_ready()
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class ASGIDriver(_HTTPDriver):
+    name = 'asgi'
+
+    def __init__(self, concurrency: int):
+        super().__init__(concurrency)
+        try:
+            import uvicorn
+        except ImportError:
+            raise DriverUnavailable("asgi needs uvicorn (pip install uvicorn)")
+        from django.core.asgi import get_asgi_application
+
+        config = uvicorn.Config(get_asgi_application(), host='127.0.0.1', port=0, log_level='warning',
+                                lifespan='off', access_log=False)
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, name='benchmark-asgi', daemon=True)
+        self.thread.start()
+        deadline = time.monotonic() + 10
+        while not self.server.started and time.monotonic() < deadline:
+            time.sleep(0.05)
+        if not self.server.started:
+            raise DriverUnavailable("asgi server did not start")
+        self.port = self.server.servers[0].sockets[0].getsockname()[1]
+        self.wait_until_ready()
+
+    def close(self) -> None:
+        self.server.should_exit = True
+        self.thread.join(10)
+
+
+DRIVERS = {driver.name: driver for driver in (ClientDriver, WSGIDriver, ASGIDriver)}
+
+
+def run(driver_names: List[str], scenarios: List[Scenario], count: int, concurrency: int,
+        max_id: int, seed: int, warmup: int, out=print) -> Dict[str, Dict[str, Any]]:
+    """``{driver: {scenario: summary}}`` of ``count`` timed requests per scenario"""
+    results: Dict[str, Dict[str, Any]] = {}
+    for driver_name in driver_names:
+        try:
+            driver = DRIVERS[driver_name](concurrency)
+        except DriverUnavailable as e:
+            out(f"skipping {driver_name}: {e}")
+            continue
+        results[driver_name] = {}
+        try:
+            for scenario in scenarios:
+                scenario.prepare(warmup + count, max_id, seed)
+                # Rows written by prepare must be visible to the server threads
+                connections.close_all()
+                requests = [scenario.request(i) for i in range(warmup + count)]
+                if warmup:
+                    driver.run(requests[:warmup])
+                latencies, errors, elapsed = driver.run(requests[warmup:])
+                summary = results[driver_name][scenario.name] = summarize(latencies, errors, elapsed)
+                out(format_line(driver_name, scenario.name, summary))
+        finally:
+            driver.close()
+    return results
+
+
+def format_line(driver: str, scenario: str, summary: Dict[str, Any]) -> str:
+    return (
+        f"{driver:<7} {scenario:<10} {summary['throughput']:>9.1f} req/s  "
+        f"p50 {summary['p50_ms']:>8.2f}  p95 {summary['p95_ms']:>8.2f}  p99 {summary['p99_ms']:>8.2f} ms"
+        + (f"  {summary['errors']} errors" if summary['errors'] else '')
+    )
+
+
+def baseline(results: Dict[str, Dict[str, Any]], **meta) -> Dict[str, Any]:
+    return {
+        'meta': {
+            **meta,
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'platform': platform.platform(),
+        },
+        'results': results,
+    }
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any], threshold: float) -> List[str]:
+    """
+    Regressions of ``new`` against the ``old`` baseline: a p95 latency more
+    than ``threshold`` (a fraction) above it, or a throughput more than
+    ``threshold`` below it. Pairs missing on either side are not compared.
+    """
+    regressions = []
+    for driver, scenarios in new['results'].items():
+        for name, current in scenarios.items():
+            previous = old.get('results', {}).get(driver, {}).get(name)
+            if not previous:
+                continue
+            if previous['p95_ms'] and current['p95_ms'] > previous['p95_ms'] * (1 + threshold):
+                regressions.append(
+                    f"{driver} {name}: p95 {previous['p95_ms']:.2f} -> {current['p95_ms']:.2f} ms"
+                )
+            if current['throughput'] < previous['throughput'] * (1 - threshold):
+                regressions.append(
+                    f"{driver} {name}: throughput {previous['throughput']:.1f} -> {current['throughput']:.1f} req/s"
+                )
+            if current['errors'] > previous['errors']:
+                regressions.append(f"{driver} {name}: errors {previous['errors']} -> {current['errors']}")
+    return regressions
+
+
+def mismatched_meta(old: Dict[str, Any], new: Dict[str, Any]) -> List[str]:
+    """Run parameters that differ from the baseline's, making the comparison less meaningful"""
+    keys = ('rows', 'requests', 'concurrency', 'database', 'server_mode')
+    return [
+        f"{key}: {old['meta'].get(key)} -> {new['meta'].get(key)}"
+        for key in keys if old.get('meta', {}).get(key) != new['meta'].get(key)
+    ]
+
+
+def load(path: str) -> Optional[Dict[str, Any]]:
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save(path: str, data: Dict[str, Any]) -> None:
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+        f.write('\n')
@@ -0,0 +1,101 @@
+"""
+One scenario per endpoint and operation. ``request(i)`` returns the
+``(method, path, body)`` of the i-th request of a run. ``prepare(n)`` runs
+untimed before it, e.g. to create the users a delete scenario removes.
+"""
+import itertools
+import random
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from django.db import connection
+from django.utils import timezone
+
+Request = Tuple[str, str, Optional[Dict[str, Any]]]
+
+
+class Scenario:
+    def __init__(self, name: str, request: Callable[['Scenario', int], Request],
+                 prepare: Optional[Callable[['Scenario', int], None]] = None):
+        self.name = name
+        self._request = request
+        self._prepare = prepare
+        self.ids: List[int] = []
+        self.rng = random.Random(name)
+        self.max_id = 0
+
+    def prepare(self, count: int, max_id: int, seed: int) -> None:
+        self.rng = random.Random(f'{self.name}:{seed}')
+        self.max_id = max_id
+        if self._prepare:
+            self._prepare(self, count)
+
+    def request(self, i: int) -> Request:
+        return self._request(self, i)
+
+    def random_id(self) -> int:
+        return self.rng.randint(1, self.max_id)
+
+
+_run = uuid.uuid4().hex[:8]
+_logins = itertools.count()
+
+
+def _login(tag: str = 'new') -> str:
+    # Unique across runs on a reused database
+    return f'bench-{_run}-{tag}-{next(_logins)}@example.com'
+
+
+def _create_targets(scenario: Scenario, count: int) -> None:
+    """Insert ``count`` active users for the delete scenario, untimed"""
+    sql = """
+        INSERT INTO user (login, password, password_sha256, first_name, last_name,
+                          createdAt, created_at, changed_at, created_from, changed_from, isActive)
+        VALUES (%s, 'x', 'x', 'Delete', 'Me', %s, %s, %s, 'benchmark', 'benchmark', 1)
+    """
+    # A fresh tag per run of the scenario, earlier targets may be soft deleted
+    tag = f'{scenario.name}-{uuid.uuid4().hex[:8]}'
+    now = timezone.now()
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [[_login(tag), now, now, now] for _ in range(count)])
+        cursor.execute("SELECT id FROM user WHERE login LIKE %s", [f'bench-{_run}-{tag}-%'])
+        scenario.ids = sorted(row[0] for row in cursor.fetchall())
+
+
+def _v1_body() -> Dict[str, Any]:
+    return {'login': _login(), 'password': 'x' * 64, 'first_name': 'Bench', 'last_name': 'Mark', 'test_bool': 'ja'}
+
+
+def _v2_body() -> Dict[str, Any]:
+    return {'login': _login(), 'password_sha256': 'x' * 64, 'first_name': 'Bench', 'last_name': 'Mark',
+            'created_from': 'benchmark', 'str_bool': True}
+
+
+SCENARIOS = [
+    Scenario('v1.list', lambda s, i: ('GET', '/user/?limit=50', None)),
+    Scenario('v1.filter', lambda s, i: ('GET', '/user/?limit=50&search=Sch&ordering=last_name,-created_at', None)),
+    Scenario('v1.detail', lambda s, i: ('GET', f'/user/{s.random_id()}/', None)),
+    Scenario('v1.create', lambda s, i: ('POST', '/user/', _v1_body())),
+    Scenario('v1.update', lambda s, i: ('PUT', f'/user/{s.random_id()}/',
+                                        {'first_name': 'Put', 'last_name': f'Run{i}', 'test_bool': 'nein'})),
+    Scenario('v1.patch', lambda s, i: ('PATCH', f'/user/{s.random_id()}/', {'first_name': f'Patch{i}'})),
+    Scenario('v1.delete', lambda s, i: ('DELETE', f'/user/{s.ids[i]}/', None), _create_targets),
+    Scenario('v2.list', lambda s, i: ('GET', '/user/v2/?limit=50', None)),
+    Scenario('v2.filter', lambda s, i: ('GET', '/user/v2/?limit=50&str_bool=true&ordering=-created_at', None)),
+    Scenario('v2.detail', lambda s, i: ('GET', f'/user/v2/{s.random_id()}/', None)),
+    Scenario('v2.create', lambda s, i: ('POST', '/user/v2/', _v2_body())),
+    Scenario('v2.patch', lambda s, i: ('PATCH', f'/user/v2/{s.random_id()}/',
+                                       {'first_name': f'Patch{i}', 'changed_from': 'benchmark'})),
+    Scenario('v2.delete', lambda s, i: ('DELETE', f'/user/v2/{s.ids[i]}/', None), _create_targets),
+]
+
+
+def select(names: Optional[str]) -> List[Scenario]:
+    """Scenarios matching the comma separated names or prefixes (``v1``, ``v2.list``)"""
+    if not names:
+        return list(SCENARIOS)
+    wanted = [name.strip() for name in names.split(',') if name.strip()]
+    chosen = [s for s in SCENARIOS if any(s.name == w or s.name.startswith(w + '.') for w in wanted)]
+    if not chosen:
+        raise ValueError(f"No scenario matches {names!r}")
+    return chosen
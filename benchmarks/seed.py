@@ -0,0 +1,121 @@
+"""
+Schema and deterministic test data for the benchmarks.
+"""
+import hashlib
+import random
+from datetime import datetime, timedelta, timezone
+
+from django.db import connection
+
+from api.core.db.indexes import USER_INDEXES, create_index_sql
+from api.core.db.tombstones import TOMBSTONE_TABLE, create_table_sql
+
+SCHEMA = {
+    'sqlite': [
+        "DROP TABLE IF EXISTS user",
+        """
+        CREATE TABLE user (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            login VARCHAR(100) NOT NULL UNIQUE,
+            password VARCHAR(64),
+            password_sha256 VARCHAR(64),
+            first_name VARCHAR(100) NOT NULL,
+            last_name VARCHAR(100) NOT NULL,
+            createdAt DATETIME,
+            created_at DATETIME,
+            changed_at DATETIME,
+            created_from VARCHAR(255),
+            changed_from VARCHAR(255),
+            isActive BOOLEAN NOT NULL DEFAULT 1,
+            testBool BOOLEAN,
+            strBool VARCHAR(3)
+        )
+        """,
+    ],
+    'mysql': [
+        "DROP TABLE IF EXISTS user",
+        """
+        CREATE TABLE user (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            login VARCHAR(100) NOT NULL UNIQUE,
+            password VARCHAR(64),
+            password_sha256 VARCHAR(64),
+            first_name VARCHAR(100) NOT NULL,
+            last_name VARCHAR(100) NOT NULL,
+            createdAt DATETIME(6),
+            created_at DATETIME(6),
+            changed_at DATETIME(6),
+            created_from VARCHAR(255),
+            changed_from VARCHAR(255),
+            isActive TINYINT(1) NOT NULL DEFAULT 1,
+            testBool TINYINT(1),
+            strBool VARCHAR(3)
+        )
+        """,
+    ],
+}
+
+FIRST_NAMES = ['Anna', 'Ben', 'Clara', 'David', 'Emma', 'Felix', 'Greta', 'Hannes', 'Ida', 'Jonas']
+LAST_NAMES = ['Müller', 'Schmidt', 'Schneider', 'Fischer', 'Weber', 'Meyer', 'Wagner', 'Becker']
+
+
+def create_schema() -> None:
+    """The user and tombstone tables with the indexes of ``manage.py user_indexes``"""
+    with connection.cursor() as cursor:
+        for statement in SCHEMA[connection.vendor]:
+            cursor.execute(statement)
+        for name, columns in USER_INDEXES.items():
+            cursor.execute(create_index_sql(connection.vendor, name, columns))
+        cursor.execute(f"DROP TABLE IF EXISTS {TOMBSTONE_TABLE}")
+        for statement in create_table_sql(connection.vendor):
+            cursor.execute(statement)
+
+
+def rows(count: int, seed: int = 0):
+    """``count`` reproducible user rows, all active"""
+    rng = random.Random(seed)
+    # Aware like the timestamps the services write
+    start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    password = hashlib.sha256(b'benchmark').hexdigest()
+    for i in range(1, count + 1):
+        created = start + timedelta(seconds=i * 37 + rng.randrange(30))
+        yield (
+            f'user{i}@example.com', password, password,
+            rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES),
+            created, created, created, 'seed', 'seed',
+            True, rng.choice((True, False, None)), rng.choice(('yes', 'no', None)),
+        )
+
+
+def seed(count: int, seed: int = 0, batch_size: int = 10000) -> None:
+    """Recreate the user table holding ``count`` rows"""
+    create_schema()
+    sql = """
+        INSERT INTO user (
+            login, password, password_sha256, first_name, last_name,
+            createdAt, created_at, changed_at, created_from, changed_from,
+            isActive, testBool, strBool
+        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """
+    batch = []
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute("PRAGMA synchronous=OFF")
+        for row in rows(count, seed):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                cursor.executemany(sql, batch)
+                batch = []
+        if batch:
+            cursor.executemany(sql, batch)
+        if connection.vendor == 'sqlite':
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.execute("ANALYZE")
+        else:
+            cursor.execute("ANALYZE TABLE user")
+
+
+def row_count() -> int:
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM user")
+        return cursor.fetchone()[0]
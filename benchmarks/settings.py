@@ -0,0 +1,31 @@
+"""
+Settings of the benchmark runs: the project settings on a local SQLite
+database (``BENCHMARK_DB``) without replicas. Run with ``--database default``
+to benchmark the configured MySQL database instead.
+"""
+import os
+
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+os.environ.setdefault('DEBUG', 'False')
+for name in ('DB_NAME', 'DB_USER', 'DB_PASSWORD', 'DB_HOST', 'DB_PORT'):
+    os.environ.setdefault(name, '')
+
+from api.settings import *  # noqa: E402,F401,F403
+from api.settings import BASE_DIR, DATABASES  # noqa: E402
+
+DEBUG = False
+ALLOWED_HOSTS = ['*']
+
+if os.environ.get('BENCHMARK_DATABASE', 'sqlite') == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('BENCHMARK_DB', str(BASE_DIR / 'benchmark.sqlite3')),
+            'OPTIONS': {
+                # Concurrent writers wait instead of failing with "database is locked"
+                'timeout': 30,
+                'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+            },
+        }
+    }
+    DATABASE_REPLICAS = []